@@ -1,5 +1,6 @@
 import pytest
 from django.contrib.auth import models
+from django.core.cache import cache
 
 from va_explorer.tests.factories import (
     GroupFactory,
@@ -9,6 +10,9 @@ from va_explorer.tests.factories import (
 )
 from va_explorer.users.models import User
 from va_explorer.va_data_management.models import Location
+from va_explorer.va_data_management.utils.location_assignment import (
+    invalidate_facility_index,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -16,6 +20,18 @@ def _media_storage(settings, tmpdir):
     settings.MEDIA_ROOT = tmpdir.strpath
 
 
+# locations are rolled back between tests, so don't let the index outlive them
+@pytest.fixture(autouse=True)
+def _facility_index():
+    invalidate_facility_index()
+
+
+# same goes for cached dashboard data and stats
+@pytest.fixture(autouse=True)
+def _cache():
+    cache.clear()
+
+
 @pytest.fixture()
 def user() -> User:
     return UserFactory()
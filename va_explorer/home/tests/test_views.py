@@ -219,6 +219,27 @@ def test_trends_no_data(user: User):
     assert json_data["isFieldWorker"] is False
 
 
+# VAs without an interview date are counted by their start date (Id10011)
+@time_machine.travel(dt.datetime(2021, 10, 26, 1, 24, tzinfo=eastern_tz))
+def test_trends_start_date_fallback(user: User):
+    client = Client()
+    client.force_login(user=user)
+
+    today = date.today()
+    coded_va = VerbalAutopsyFactory.create(Id10012="", Id10011=str(today))
+    VerbalAutopsyFactory.create(Id10012="", Id10011=str(today))
+    VerbalAutopsyFactory.create(Id10012=today)
+    CauseOfDeathFactory.create(verbalautopsy=coded_va)
+
+    response = client.get("/trends", follow=True)
+    va_table_data = json.loads(response.content)["vaTable"]
+
+    assert va_table_data["collected"]["24"] == 3
+    assert va_table_data["collected"]["Overall"] == 3
+    assert va_table_data["coded"]["24"] == 1
+    assert va_table_data["uncoded"]["24"] == 2
+
+
 # Get the about page and make sure it returns successfully
 def test_about(user: User):
     client = Client()
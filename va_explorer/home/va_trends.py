@@ -1,30 +1,20 @@
 from datetime import date, timedelta
 
 import pandas as pd
-from django.db.models import F
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
 from pandas.tseries.offsets import DateOffset
 
 from va_explorer.va_data_management.constants import REDACTED_STRING
 from va_explorer.va_data_management.utils.date_parsing import (
-    get_interview_dates,
-    parse_date,
-    to_dt,
+    count_by_start_date,
+    parse_dates,
 )
 
 TODAY = pd.to_datetime(date.today())
 START_MONTH = pd.to_datetime(date(TODAY.year - 1, TODAY.month, 1))
 
 NUM_TABLE_ROWS = 5
-VA_DF_FIELDS = [
-    "id",
-    "Id10023",
-    "location",
-    "Id10011",
-    "Id10012",
-    "created",
-    "Id10010",
-    "Id10011",
-]
 VA_TABLE_FIELDS = [
     "id",
     "location_id",
@@ -38,6 +28,10 @@ VA_TABLE_FIELDS = [
 ]
 VA_TABLE_ROWS = ["collected", "coded", "uncoded"]
 VA_TABLE_COLUMNS = ["24", "1 week", "1 month", "Overall"]
+# names of the VA_TABLE_COLUMNS periods in count aliases
+VA_TABLE_PERIODS = dict(
+    zip(VA_TABLE_COLUMNS, ["day", "week", "month", "overall"], strict=True)
+)
 VA_GRAPH_TYPES = VA_TABLE_ROWS
 
 MONTHS = [START_MONTH + DateOffset(months=i) for i in range(12)]
@@ -72,15 +66,16 @@ def empty_graph_data():
 
 
 def get_context_for_va_table(va_list, user):
+    va_list = list(va_list)
+    interview_dates = parse_dates([va.Id10012 for va in va_list])
+    death_dates = parse_dates([va.Id10023 for va in va_list])
     context = [
         {
             "id": va.id,
             "deceased": f"{va.Id10017} {va.Id10018}",
             "interviewer": va.Id10010,
-            "interviewed": (
-                parse_date(va.Id10012) if (va.Id10012 != "dk") else "Unknown"
-            ),
-            "dod": parse_date(va.Id10023) if (va.Id10023 != "dk") else "Unknown",
+            "interviewed": interviewed if (va.Id10012 != "dk") else "Unknown",
+            "dod": dod if (va.Id10023 != "dk") else "Unknown",
             "facility": va.location.name if va.location else "Not Provided",
             "cause": (
                 va.causes.all()[0].cause if len(va.causes.all()) > 0 else "Not Coded"
@@ -96,7 +91,9 @@ def get_context_for_va_table(va_list, user):
                 [issue for issue in va.coding_issues.all() if issue.severity == "error"]
             ),
         }
-        for va in va_list
+        for va, interviewed, dod in zip(
+            va_list, interview_dates, death_dates, strict=True
+        )
     ]
     # Usually handled by filter, but not in this case
     for item in context:
@@ -105,6 +102,85 @@ def get_context_for_va_table(va_list, user):
     return context
 
 
+# Count collected and coded VAs by interview date in the database: the totals
+# for each VA_TABLE_COLUMNS period and for each month of the graphs
+def count_vas_by_interview_date(vas):
+    coded = Q(causes__isnull=False)
+    periods = {
+        "24": Q(interview_date=TODAY.date()),
+        "1 week": Q(interview_date__gte=(TODAY - timedelta(days=7)).date()),
+        "1 month": Q(interview_date__gte=(TODAY - DateOffset(months=1)).date()),
+    }
+    aggregates = {}
+    for column, period in periods.items():
+        period_name = VA_TABLE_PERIODS[column]
+        aggregates[f"collected_{period_name}"] = Count(
+            "id", filter=period, distinct=True
+        )
+        aggregates[f"coded_{period_name}"] = Count(
+            "id", filter=period & coded, distinct=True
+        )
+    aggregates["collected_overall"] = Count("id", distinct=True)
+    aggregates["coded_overall"] = Count("id", filter=coded, distinct=True)
+    totals = vas.aggregate(**aggregates)
+
+    months = (
+        vas.filter(
+            interview_date__gte=START_MONTH.date(),
+            interview_date__lt=(MONTHS[-1] + DateOffset(months=1)).date(),
+        )
+        .annotate(month=TruncMonth("interview_date"))
+        .values("month")
+        .annotate(
+            collected=Count("id", distinct=True),
+            coded=Count("id", filter=coded, distinct=True),
+        )
+        .order_by()
+    )
+    by_month = {
+        row["month"].strftime("%Y-%m"): (row["collected"], row["coded"])
+        for row in months
+    }
+    return totals, by_month
+
+
+# Same counts for VAs without a parsed interview date, which are dated by their
+# start date (Id10011). They are already part of the overall totals above.
+def count_vas_by_start_date(vas):
+    start_df = count_by_start_date(
+        vas,
+        {
+            "collected": Count("id", distinct=True),
+            "coded": Count("id", filter=Q(causes__isnull=False), distinct=True),
+        },
+    )
+    if start_df.empty:
+        return {}, {}
+    periods = {
+        "24": start_df["date"] == TODAY,
+        "1 week": start_df["date"] >= (TODAY - timedelta(days=7)),
+        "1 month": start_df["date"] >= (TODAY - DateOffset(months=1)),
+    }
+    totals = {}
+    for column, period in periods.items():
+        period_name = VA_TABLE_PERIODS[column]
+        totals[f"collected_{period_name}"] = int(
+            start_df.loc[period, "collected"].sum()
+        )
+        totals[f"coded_{period_name}"] = int(start_df.loc[period, "coded"].sum())
+
+    in_graphs = start_df["date"] >= START_MONTH
+    months = (
+        start_df[in_graphs]
+        .groupby(start_df["date"].dt.strftime("%Y-%m"))[["collected", "coded"]]
+        .sum()
+    )
+    by_month = {
+        month: (int(row.collected), int(row.coded)) for month, row in months.iterrows()
+    }
+    return totals, by_month
+
+
 # NOTE: using Id10012 (Interview date) to drive stats/views. submissiondate is
 # unreliable or inaccurate due to bulk submissions
 def get_trends_data(user):
@@ -116,93 +192,32 @@ def get_trends_data(user):
     additional_issues = 0
     additional_indeterminate_cods = 0
 
-    if user_vas.count() > 0:
-        va_df = pd.DataFrame(
-            user_vas.only(*VA_DF_FIELDS)
-            .select_related("location")
-            .select_related("causes")
-            .values(
-                "id",
-                "Id10023",
-                "created",
-                "Id10011",
-                "Id10012",
-                name=F("Id10010"),
-                facility=F("location__name"),
-                cause=F("causes__cause"),
+    if user_vas.exists():
+        # only the counts leave the database, not the VAs
+        totals, by_month = count_vas_by_interview_date(user_vas)
+        start_totals, start_by_month = count_vas_by_start_date(user_vas)
+
+        for row in ["collected", "coded"]:
+            for col in VA_TABLE_COLUMNS:
+                key = f"{row}_{VA_TABLE_PERIODS[col]}"
+                va_table[row][col] = totals[key] + start_totals.get(key, 0)
+        for col in VA_TABLE_COLUMNS:
+            va_table["uncoded"][col] = (
+                va_table["collected"][col] - va_table["coded"][col]
             )
-        )
-
-        va_df["date"] = get_interview_dates(va_df)
-
-        # clean date fields - strip timezones from Id10012 (Interview date
-        # created dates
-        va_df["date"] = to_dt(va_df["date"])
-        va_df["created"] = to_dt(va_df["created"])
-        va_df["Id10023"] = to_dt(va_df["Id10023"])
-        va_df["yearmonth"] = va_df["date"].dt.strftime("%Y-%m")
-
-        # Load the VAs that are collected over various periods of time
-        vas_24_hours = va_df[va_df["date"] == TODAY].index
-        vas_1_week = va_df[va_df["date"] >= (TODAY - timedelta(days=7))].index
-        vas_1_month = va_df[va_df["date"] >= (TODAY - DateOffset(months=1))].index
-        vas_overall = va_df.sort_values(by="id").index
 
         # Graphs of the past 12 months, not including this month
         # (current month will almost always show month with artificially low numbers)
         x = [month.strftime("%b") for month in MONTHS]
-        plot_df = pd.DataFrame({"yearmonth": VA_GRAPH_X_DATA, "x": x})
-
-        # Collected; total VAs by month
-        plot_df = plot_df.merge(
-            va_df.query("date >= @START_MONTH")
-            .groupby("yearmonth")["id"]
-            .count()
-            .rename("y_collected")
-            .reset_index(),
-            how="left",
-        ).fillna(0)
-
-        graphs["collected"]["x"] = plot_df["x"].values.tolist()
-        graphs["collected"]["y"] = plot_df["y_collected"].values.tolist()
-
-        # Coded; same query as above, just filtered by whether the va has been coded
-        plot_df = plot_df.merge(
-            va_df.query("date >= @START_MONTH & cause==cause")
-            .groupby("yearmonth")["id"]
-            .count()
-            .rename("y_coded")
-            .reset_index(),
-            how="left",
-        ).fillna(0)
-
-        graphs["coded"]["x"] = plot_df["x"].values.tolist()
-        graphs["coded"]["y"] = plot_df["y_coded"].values.tolist()
-
-        # Uncoded; just take the difference between the two previous queries
-        graphs["uncoded"]["x"] = plot_df["x"].values.tolist()
-        graphs["uncoded"]["y"] = (
-            plot_df["y_collected"] - plot_df["y_coded"]
-        ).values.tolist()
-
-        # VAs successfully coded in the past 24 hours, 1 week, and 1 month
-        vas_coded_24_hours = va_df.loc[vas_24_hours, :].query("cause == cause").shape[0]
-        vas_coded_1_week = va_df.loc[vas_1_week, :].query("cause == cause").shape[0]
-        vas_coded_1_month = va_df.loc[vas_1_month, :].query("cause == cause").shape[0]
-        vas_coded_overall = va_df.loc[vas_overall, :].query("cause == cause").shape[0]
-
-        va_table["collected"]["24"] = len(vas_24_hours)
-        va_table["collected"]["1 week"] = len(vas_1_week)
-        va_table["collected"]["1 month"] = len(vas_1_month)
-        va_table["collected"]["Overall"] = len(vas_overall)
-        va_table["coded"]["24"] = vas_coded_24_hours
-        va_table["coded"]["1 week"] = vas_coded_1_week
-        va_table["coded"]["1 month"] = vas_coded_1_month
-        va_table["coded"]["Overall"] = vas_coded_overall
-        va_table["uncoded"]["24"] = len(vas_24_hours) - vas_coded_24_hours
-        va_table["uncoded"]["1 week"] = len(vas_1_week) - vas_coded_1_week
-        va_table["uncoded"]["1 month"] = len(vas_1_month) - vas_coded_1_month
-        va_table["uncoded"]["Overall"] = len(vas_overall) - vas_coded_overall
+        for graph_type in VA_GRAPH_TYPES:
+            graphs[graph_type]["x"] = x
+        for i, yearmonth in enumerate(VA_GRAPH_X_DATA):
+            collected, coded = by_month.get(yearmonth, (0, 0))
+            start_collected, start_coded = start_by_month.get(yearmonth, (0, 0))
+            collected, coded = collected + start_collected, coded + start_coded
+            graphs["collected"]["y"][i] = float(collected)
+            graphs["coded"]["y"][i] = float(coded)
+            graphs["uncoded"]["y"][i] = float(collected - coded)
 
         # Use a local scope copy of VA_TABLE_FIELDS to avoid modifying the
         # original which would impact all future requests made by any user and
@@ -233,9 +248,7 @@ def get_trends_data(user):
 
         # If there are more than NUM_TABLE_ROWS show a link to where
         # the rest can be seen
-        additional_issues = max(
-            (len(vas_overall) - vas_coded_overall) - NUM_TABLE_ROWS, 0
-        )
+        additional_issues = max(va_table["uncoded"]["Overall"] - NUM_TABLE_ROWS, 0)
         additional_indeterminate_cods = max(
             user_vas.only("id").filter(causes__cause="Indeterminate").count()
             - NUM_TABLE_ROWS,
@@ -11,7 +11,10 @@ from pandas.core.frame import DataFrame
 from va_explorer.users.forms import ExtendedUserCreationForm
 from va_explorer.users.management.commands.initialize_groups import GROUPS_PERMISSIONS
 from va_explorer.users.models import User
-from va_explorer.va_data_management.utils.location_assignment import fuzzy_match
+from va_explorer.va_data_management.utils.location_assignment import (
+    FuzzyMatcher,
+    fuzzy_match,
+)
 
 
 # get table with basic info for a list of users. By default, exports results
@@ -88,12 +91,14 @@ def create_users_from_file(user_list_file, email_confirmation=False, debug=False
     user_df = pd.read_csv(user_list_file).fillna("")
     user_ct = error_ct = 0
     new_users = []
+    # match every user's groups and locations against the same option matchers
+    matchers = get_option_matchers()
 
     # fill out user forms one-by-one
     for i, user_data in user_df.iterrows():
         if debug:
             print(i, user_data["name"])
-        user_form = fill_user_form_data(user_data, debug=debug)
+        user_form = fill_user_form_data(user_data, debug=debug, matchers=matchers)
 
         if user_form.is_valid():
             user_form.save(email_confirmation=email_confirmation)
@@ -114,8 +119,22 @@ def create_users_from_file(user_list_file, email_confirmation=False, debug=False
     return {"user_ct": user_ct, "error_ct": error_ct, "users": new_users}
 
 
-def fill_user_form_data(user_data, debug=False):
+# fuzzy matchers for the option names of each of the form's queryset choice fields
+# (e.x. groups and locations), by field name
+def get_option_matchers(form=None):
+    form = form or ExtendedUserCreationForm()
+    return {
+        name: FuzzyMatcher(field.choices.queryset.values_list("name", flat=True))
+        for name, field in form.fields.items()
+        if hasattr(getattr(field, "choices", None), "queryset")
+    }
+
+
+# fill out a user form from user_data. matchers (see get_option_matchers) are built
+# for this form if not given; pass them in when filling out many forms
+def fill_user_form_data(user_data, debug=False, matchers=None):
     form = ExtendedUserCreationForm()
+    matchers = matchers if matchers is not None else get_option_matchers(form)
 
     # if dataframe provided, convert to dict
     if type(user_data) is DataFrame:
@@ -155,12 +174,7 @@ def fill_user_form_data(user_data, debug=False):
                 try:
                     match = qs.filter(name__iexact=value)
                     if not match.exists():
-                        match_name = fuzzy_match(
-                            value,
-                            None,
-                            options=qs.values_list("name", flat=True),
-                            threshold=95,
-                        )
+                        match_name = matchers[field_name].match(value, threshold=95)
                         if match_name:
                             match = qs.filter(name__iexact=match_name)
                 except Exception as err:
@@ -0,0 +1,89 @@
+# Generated by Django 4.1.2 on 2026-10-16 23:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+
+
+# build the rollup from the existing VAs (as DashboardRollup.refresh does)
+def build_rollup(apps, schema_editor):
+    VerbalAutopsy = apps.get_model("va_data_management", "VerbalAutopsy")
+    DashboardRollup = apps.get_model("va_analytics", "DashboardRollup")
+    counts = (
+        VerbalAutopsy.objects.filter(deleted_at=None, death_date__isnull=False)
+        .annotate(
+            facility=F("location"),
+            facility_province=F("location_province"),
+            facility_district=F("location_district"),
+            month=TruncMonth("death_date"),
+            age=F("derived_age_group"),
+            sex=F("Id10019"),
+            place=F("Id10058"),
+            cause=F("causes__cause"),
+        )
+        .values(
+            "facility",
+            "facility_province",
+            "facility_district",
+            "month",
+            "age",
+            "sex",
+            "place",
+            "cause",
+        )
+        .annotate(count=Count("pk"))
+        .order_by()
+    )
+    DashboardRollup.objects.bulk_create(
+        (
+            DashboardRollup(
+                facility_id=row["facility"],
+                facility_province_id=row["facility_province"],
+                facility_district_id=row["facility_district"],
+                month=row["month"],
+                age=row["age"],
+                sex=row["sex"],
+                place=row["place"],
+                cause=row["cause"],
+                count=row["count"],
+            )
+            for row in counts.iterator()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('va_data_management', '0028_verbalautopsy_age_group'),
+        ('va_analytics', '0003_auto_20210805_2354'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('age', models.CharField(max_length=7, null=True)),
+                ('sex', models.TextField(blank=True)),
+                ('place', models.TextField(blank=True)),
+                ('cause', models.TextField(null=True)),
+                ('count', models.IntegerField()),
+                ('facility', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='va_data_management.location')),
+                ('facility_district', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='va_data_management.location')),
+                ('facility_province', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='va_data_management.location')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dashboardrollup',
+            index=models.Index(fields=['facility', 'month'], name='va_analytic_facilit_61bf98_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dashboardrollup',
+            index=models.Index(fields=['month'], name='va_analytic_month_c6f5c5_idx'),
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncMonth
+
+from va_explorer.va_data_management.models import Location, VerbalAutopsy
+from va_explorer.va_data_management.utils.data_version import bump_data_generation
 
 
 # Adds a model that is not backed by a table in the database
@@ -15,3 +20,102 @@ class Dashboard(models.Model):
             ("view_pii", "Can view PII in data"),
             ("supervise_users", "Can supervise other users"),
         )
+
+
+# Q object matching rows whose field is one of location_ids, where None stands for
+# rows without a location
+def in_locations(field, location_ids):
+    query = Q(**{f"{field}__in": [pk for pk in location_ids if pk is not None]})
+    if None in location_ids:
+        query |= Q(**{f"{field}__isnull": True})
+    return query
+
+
+# Counts of VAs (joined with their causes of death, as the dashboard counts them)
+# for every combination of the dimensions the dashboard filters and groups by.
+# Only VAs with a known date of death are counted. Rows are rebuilt per facility
+# by refresh after imports, coding runs and edits, so the dashboard can sum rollup
+# rows instead of aggregating the VA table on every request.
+class DashboardRollup(models.Model):
+    facility = models.ForeignKey(
+        Location, related_name="+", on_delete=models.CASCADE, null=True
+    )
+    facility_province = models.ForeignKey(
+        Location, related_name="+", on_delete=models.CASCADE, null=True
+    )
+    facility_district = models.ForeignKey(
+        Location, related_name="+", on_delete=models.CASCADE, null=True
+    )
+    # first day of the month of death
+    month = models.DateField()
+    age = models.CharField(max_length=7, null=True)
+    sex = models.TextField(blank=True)
+    place = models.TextField(blank=True)
+    # null for VAs without a cause of death
+    cause = models.TextField(null=True)
+    count = models.IntegerField()
+
+    # how each rollup dimension is computed from a VA
+    VA_DIMENSIONS = {
+        "facility": F("location"),
+        "facility_province": F("location_province"),
+        "facility_district": F("location_district"),
+        "month": TruncMonth("death_date"),
+        "age": F("derived_age_group"),
+        "sex": F("Id10019"),
+        "place": F("Id10058"),
+        "cause": F("causes__cause"),
+    }
+    DIMENSIONS = list(VA_DIMENSIONS)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["facility", "month"]),
+            models.Index(fields=["month"]),
+        ]
+
+    # Count vas grouped by the rollup dimensions, giving rows shaped like
+    # DashboardRollup.objects.values(*DIMENSIONS, "count")
+    @classmethod
+    def count_vas(cls, vas):
+        return (
+            vas.filter(death_date__isnull=False)
+            .annotate(**cls.VA_DIMENSIONS)
+            .values(*cls.DIMENSIONS)
+            .annotate(count=Count("pk"))
+            .order_by()
+        )
+
+    # Rebuild the rows of the facilities in location_ids (None for VAs without a
+    # location) from the VA table, or all rows if location_ids is None. Starts a
+    # new VA data generation, invalidating cached dashboard data.
+    @classmethod
+    @transaction.atomic
+    def refresh(cls, location_ids=None):
+        rows = cls.objects.all()
+        vas = VerbalAutopsy.objects.all()
+        if location_ids is not None:
+            location_ids = set(location_ids)
+            if not location_ids:
+                return
+            rows = rows.filter(in_locations("facility", location_ids))
+            vas = vas.filter(in_locations("location", location_ids))
+        rows.delete()
+        cls.objects.bulk_create(
+            (
+                cls(
+                    facility_id=row["facility"],
+                    facility_province_id=row["facility_province"],
+                    facility_district_id=row["facility_district"],
+                    month=row["month"],
+                    age=row["age"],
+                    sex=row["sex"],
+                    place=row["place"],
+                    cause=row["cause"],
+                    count=row["count"],
+                )
+                for row in cls.count_vas(vas).iterator()
+            ),
+            batch_size=5000,
+        )
+        bump_data_generation()
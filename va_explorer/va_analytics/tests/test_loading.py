@@ -0,0 +1,55 @@
+import pytest
+
+from va_explorer.tests.factories import (
+    CauseOfDeathFactory,
+    LocationFacilityFactory,
+    UserFactory,
+    VerbalAutopsyFactory,
+)
+from va_explorer.va_analytics.models import DashboardRollup
+from va_explorer.va_analytics.utils.loading import load_cod_groupings, load_va_data
+
+pytestmark = pytest.mark.django_db
+
+
+def test_load_va_data_from_rollup():
+    facility = LocationFacilityFactory.create()
+    user = UserFactory.create()
+    coded_vas = [
+        VerbalAutopsyFactory.create(Id10023=death_date, location=facility)
+        for death_date in ["2021-01-15", "2021-02-10", "2021-03-05"]
+    ]
+    for va in coded_vas:
+        CauseOfDeathFactory.create(verbalautopsy=va)
+    VerbalAutopsyFactory.create(Id10023="2021-02-20", location=facility)
+    DashboardRollup.refresh()
+
+    def load(start_date, end_date):
+        return load_va_data(user, None, start_date, end_date, None, None, None)
+
+    data = load("2021-01-01", "2021-03-31")
+    assert data["COD_grouping"] == [{"cause": "HIV/AIDS related death", "count": 3}]
+    assert [row["count"] for row in data["COD_trend"]] == [1, 1, 1]
+    assert data["uncoded_vas"] == 1
+
+    # days of partial months are counted from the VA table
+    data = load("2021-01-20", "2021-03-04")
+    assert data["COD_grouping"] == [{"cause": "HIV/AIDS related death", "count": 1}]
+    assert data["uncoded_vas"] == 1
+
+    # refreshing a facility picks up changes to its VAs
+    coded_vas[-1].delete()
+    DashboardRollup.refresh([facility.id])
+    data = load("2021-01-01", "2021-03-31")
+    assert data["COD_grouping"] == [{"cause": "HIV/AIDS related death", "count": 2}]
+
+
+def test_load_cod_groupings():
+    groupings = load_cod_groupings(cause_of_death="maternal")
+    assert "Pregnancy ended within 6 weeks of death" in groupings["filter_causes"]
+    assert "maternal" in groupings["dropdown_options"]
+    assert groupings["dropdown_options"] == sorted(groupings["dropdown_options"])
+
+    cause = "Pregnancy ended within 6 weeks of death"
+    assert load_cod_groupings(cause_of_death=cause)["filter_causes"] == [cause]
+    assert load_cod_groupings(cause_of_death=None)["filter_causes"] == []
@@ -6,12 +6,19 @@ from django.core.exceptions import PermissionDenied
 from django.test import RequestFactory
 
 from va_explorer.tests.factories import (
+    CauseOfDeathFactory,
     GroupFactory,
     LocationFactory,
     UserFactory,
     VerbalAutopsyFactory,
 )
-from va_explorer.va_analytics.views import dashboard_view, user_supervision_view
+from va_explorer.va_analytics.models import DashboardRollup
+from va_explorer.va_analytics.views import (
+    DashboardAPIView,
+    dashboard_view,
+    user_supervision_view,
+)
+from va_explorer.va_data_management.models import CauseOfDeath
 
 pytestmark = pytest.mark.django_db
 
@@ -42,6 +49,35 @@ class TestDashboardView:
             dashboard_view(request)
 
 
+class TestDashboardAPIView:
+    def test_cached_until_data_changes(
+        self, rf: RequestFactory, django_capture_on_commit_callbacks
+    ):
+        user = UserFactory.create()
+        va = VerbalAutopsyFactory.create(Id10023="2021-01-15")
+        CauseOfDeathFactory.create(verbalautopsy=va)
+        DashboardRollup.refresh()
+
+        def get_dashboard():
+            request = rf.get("/va_analytics/api/dashboard", {"sex": " "})
+            request.user = user
+            return DashboardAPIView.as_view()(request).data
+
+        expected = [{"cause": "HIV/AIDS related death", "count": 1}]
+        assert get_dashboard()["COD_grouping"] == expected
+
+        # bulk updates don't invalidate the cache, so the cached data is served
+        CauseOfDeath.objects.update(cause="Malaria")
+        DashboardRollup.objects.update(cause="Malaria")
+        assert get_dashboard()["COD_grouping"] == expected
+
+        # saving a cause of death starts a new data generation
+        with django_capture_on_commit_callbacks(execute=True):
+            CauseOfDeath.objects.get().save()
+        expected = [{"cause": "Malaria", "count": 1}]
+        assert get_dashboard()["COD_grouping"] == expected
+
+
 class TestSupervisionView:
     def test_with_view_permission(self, rf: RequestFactory):
         can_supervise_users = Permission.objects.filter(
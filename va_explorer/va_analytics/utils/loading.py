@@ -1,64 +1,164 @@
 import csv
-import itertools
+import hashlib
 import os
-from operator import itemgetter
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from functools import cache
 from pathlib import Path
+from types import MappingProxyType
 
-from django.db.models import (
-    Case,
-    CharField,
-    Count,
-    DateField,
-    F,
-    OuterRef,
-    Q,
-    Subquery,
-    Value,
-    When,
-)
-from django.db.models.functions import Cast, Substr, TruncMonth
+from django.core.cache import cache as django_cache
 
+from va_explorer.va_analytics.models import DashboardRollup
 from va_explorer.va_data_management.models import (
+    AGE_GROUP_FIELDS,
     Location,
     questions_to_autodetect_duplicates,
 )
+from va_explorer.va_data_management.utils.data_version import (
+    bump_data_generation,
+    get_data_generation,
+)
 from va_explorer.va_data_management.utils.loading import get_va_summary_stats
 
+# query parameters of the dashboard api, passed to load_va_data
+DASHBOARD_PARAMS = [
+    "start_date",
+    "end_date",
+    "cause_of_death",
+    "region_of_interest",
+    "age",
+    "sex",
+]
+# seconds dashboard data is cached for; it is dropped sooner if VA data changes
+DASHBOARD_CACHE_TIMEOUT = 60 * 60
 
-def load_cod_groupings(cause_of_death: str):
+
+# COD groupings csv files, by whether InterVA5 includes group codes in its causes
+COD_GROUPINGS_FILES = {
+    True: "cod_groupings_interva_groupcode_true.csv",
+    False: "cod_groupings_interva_groupcode_false.csv",
+}
+
+
+# cache key holding the current COD groupings version, so reloading them in one
+# process (e.x. with the reload_cod_groupings command) reloads them in all of them
+COD_GROUPINGS_VERSION_KEY = "cod_groupings_version"
+
+
+# The COD groupings of the configured InterVA5 output, read once per process:
+# the sorted dropdown options and, for each group and cause, the causes in it.
+# Call reload_cod_groupings after the csv files change.
+def get_cod_groupings():
+    return _read_cod_groupings(django_cache.get(COD_GROUPINGS_VERSION_KEY))
+
+
+@cache
+def _read_cod_groupings(version):
     INTERVA_GROUPCODE = os.environ.get("INTERVA_GROUPCODE") == "True"
-    if INTERVA_GROUPCODE:
-        filename = "cod_groupings_interva_groupcode_true.csv"
-    else:
-        filename = "cod_groupings_interva_groupcode_false.csv"
+    filename = COD_GROUPINGS_FILES[INTERVA_GROUPCODE]
     path = Path(__file__).parent.parent / "data" / filename
 
     with open(path) as csvfile:
         filereader = csv.DictReader(csvfile)
         remove = ["algorithm", "cod"]
         headers = [header for header in filereader.fieldnames if header not in remove]
+        data = list(filereader)
+
+    members = {header: [] for header in headers}
+    for row in data:
+        for header in headers:
+            if row.get(header) == "1":
+                members[header].append(row.get("cod"))
+    for row in data:
+        members[row.get("cod")] = [row.get("cod")]
+
+    return MappingProxyType(
+        {
+            "dropdown_options": tuple(sorted([row["cod"] for row in data] + headers)),
+            "members": MappingProxyType(
+                {key: tuple(causes) for key, causes in members.items()}
+            ),
+        }
+    )
 
-        data = []
-        for row in filereader:
-            data.append(row)
 
-        cods = sorted([row.get("cod") for row in data] + headers)
+# Re-read the COD groupings in every process, and drop cached dashboard data
+# filtered with the old ones
+def reload_cod_groupings():
+    _read_cod_groupings.cache_clear()
+    django_cache.set(COD_GROUPINGS_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    bump_data_generation()
 
+
+def load_cod_groupings(cause_of_death: str):
+    groupings = get_cod_groupings()
     filter_causes = []
     if cause_of_death:
-        for row in data:
-            if row.get("cod") == cause_of_death:
-                filter_causes.append(row.get("cod"))
-                break
-
-            for key, value in row.items():
-                if cause_of_death == key and value == "1":
-                    filter_causes.append(row.get("cod"))
+        filter_causes = list(groupings["members"].get(cause_of_death, ()))
 
-    return {"dropdown_options": cods, "filter_causes": filter_causes}
+    return {
+        "dropdown_options": list(groupings["dropdown_options"]),
+        "filter_causes": filter_causes,
+    }
 
 
 # ============ VA Data =================
+# Cache key of the dashboard data for user and the dashboard params. Users with
+# the same location restrictions and PII permission see the same data, so they
+# share entries. Keys include the data generation, so entries are dropped
+# whenever VAs or their causes change.
+def get_dashboard_cache_key(user, params):
+    scope = sorted(user.location_restrictions.values_list("id", flat=True))
+    parts = [
+        ",".join(str(pk) for pk in scope) or "all",
+        str(user.can_view_pii),
+        *(f"{name}={params.get(name) or ''}" for name in DASHBOARD_PARAMS),
+    ]
+    digest = hashlib.md5("|".join(parts).encode()).hexdigest()
+    return f"dashboard:{get_data_generation()}:{digest}"
+
+
+# Rows of VA counts by the DashboardRollup dimensions for the VAs the user can
+# access that died between start_date and end_date. Whole months in the range are
+# read from the rollup table; the days of partial months at either end are
+# counted from the VA table.
+def load_rollup_rows(user, start_date, end_date):
+    start = date.fromisoformat(start_date)
+    # day after the end of the range
+    after_end = date.fromisoformat(end_date) + timedelta(days=1)
+    # first day of the first whole month in the range and of the month after the
+    # last one
+    first_month = start if start.day == 1 else _next_month(start)
+    after_last_month = after_end.replace(day=1)
+
+    rows = []
+    if first_month < after_last_month:
+        rollup = DashboardRollup.objects.filter(
+            month__gte=first_month, month__lt=after_last_month
+        )
+        locations = user.accessible_locations()
+        if locations is not None:
+            rollup = rollup.filter(facility__in=locations)
+        rows.extend(rollup.values(*DashboardRollup.DIMENSIONS, "count"))
+        partial_days = [(start, first_month), (after_last_month, after_end)]
+    else:
+        partial_days = [(start, after_end)]
+
+    for days_start, days_end in partial_days:
+        if days_start < days_end:
+            vas = user.verbal_autopsies(
+                date_cutoff=start_date, end_date=end_date
+            ).filter(death_date__gte=days_start, death_date__lt=days_end)
+            rows.extend(DashboardRollup.count_vas(vas))
+    return rows
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
 def load_va_data(
     user, cause_of_death, start_date, end_date, region_of_interest, age, sex
 ):
@@ -69,185 +169,85 @@ def load_va_data(
     if len(questions_to_autodetect_duplicates()) > 0:
         update_stats["duplicates"] = user_vas.filter(duplicate=True).count()
 
-    user_vas_filtered = user_vas.exclude(Id10023__in=["dk", "DK"]).exclude(
-        location__isnull=True
-    )
+    cod_groupings = load_cod_groupings(cause_of_death=cause_of_death)
+    rows = load_rollup_rows(user, start_date, end_date)
+    uncoded_vas = sum(row["count"] for row in rows if row["cause"] is None)
+
+    # only count coded VAs with a location
+    rows = [
+        row for row in rows if row["facility"] is not None and row["cause"] is not None
+    ]
 
     # apply cause of death filtering if sent in with request
     if cause_of_death:
-        causes = load_cod_groupings(cause_of_death=cause_of_death)["filter_causes"]
-        user_vas_filtered = user_vas_filtered.filter(causes__cause__in=causes)
+        causes = set(cod_groupings["filter_causes"])
+        rows = [row for row in rows if row["cause"] in causes]
 
     # apply geographic filtering if sent in with request
     if region_of_interest:
-        if "District" in region_of_interest:
-            user_vas_filtered = (
-                user_vas_filtered.annotate(
-                    district_name=Subquery(
-                        Location.objects.values("name").filter(
-                            Q(path=Substr(OuterRef("location__path"), 1, 12)),
-                            Q(depth=3),
-                        )[:1]
-                    )
-                )
-                .filter(district_name=region_of_interest)
-                .select_related("location")
+        region_ids = set(
+            Location.objects.filter(name=region_of_interest).values_list(
+                "id", flat=True
             )
+        )
+        if "District" in region_of_interest:
+            rows = [row for row in rows if row["facility_district"] in region_ids]
 
         if "Province" in region_of_interest:
-            user_vas_filtered = (
-                user_vas_filtered.annotate(
-                    province_name=Subquery(
-                        Location.objects.values("name").filter(
-                            Q(path=Substr(OuterRef("location__path"), 1, 8)), Q(depth=2)
-                        )[:1]
-                    )
-                )
-                .filter(province_name=region_of_interest)
-                .select_related("location")
-            )
+            rows = [row for row in rows if row["facility_province"] in region_ids]
 
-    # apply filtering for age sent in request, cover is<X>, is<X>1, and is<X>2
-    # from VA specification
-    if age:
-        if age == "adult":
-            user_vas_filtered = user_vas_filtered.filter(
-                Q(isAdult="1")
-                | Q(isAdult="1.0")
-                | Q(isAdult1="1")
-                | Q(isAdult1="1.0")
-                | Q(isAdult2="1")
-                | Q(isAdult2="1.0")
-            )
-        if age == "child":
-            user_vas_filtered = user_vas_filtered.filter(
-                Q(isChild="1")
-                | Q(isChild="1.0")
-                | Q(isChild1="1")
-                | Q(isChild1="1.0")
-                | Q(isChild2="1")
-                | Q(isChild2="1.0")
-            )
-        if age == "neonate":
-            user_vas_filtered = user_vas_filtered.filter(
-                Q(isNeonatal="1")
-                | Q(isNeonatal="1")
-                | Q(isNeonatal1="1")
-                | Q(isNeonatal1="1")
-                | Q(isNeonatal2="1")
-                | Q(isNeonatal2="1")
-            )
+    # apply filtering for age sent in request (neonate, child or adult)
+    if age in AGE_GROUP_FIELDS:
+        rows = [row for row in rows if row["age"] == age]
 
     # apply filtering for sex sent in request
     if sex:
-        user_vas_filtered = user_vas_filtered.filter(Id10019=sex)
-
-    uncoded_vas = user_vas.filter(causes__cause__isnull=True).count()
-
-    demographics = (
-        user_vas_filtered.filter(causes__isnull=False)
-        .values(
-            gender=F("Id10019"),
-            age_group_named=Case(
-                When(isNeonatal="1", then=Value("neonate")),
-                When(isNeonatal="1.0", then=Value("neonate")),
-                When(isNeonatal1="1", then=Value("neonate")),
-                When(isNeonatal1="1.0", then=Value("neonate")),
-                When(isNeonatal2="1", then=Value("neonate")),
-                When(isNeonatal2="1.0", then=Value("neonate")),
-                When(isChild="1", then=Value("child")),
-                When(isChild="1.0", then=Value("child")),
-                When(isChild1="1", then=Value("child")),
-                When(isChild1="1.0", then=Value("child")),
-                When(isChild2="1", then=Value("child")),
-                When(isChild2="1.0", then=Value("child")),
-                When(isAdult="1", then=Value("adult")),
-                When(isAdult="1.0", then=Value("adult")),
-                When(isAdult1="1", then=Value("adult")),
-                When(isAdult1="1.0", then=Value("adult")),
-                When(isAdult2="1", then=Value("adult")),
-                When(isAdult2="1.0", then=Value("adult")),
-                default=Value("Unknown"),
-                output_field=CharField(),
-            ),
-        )
-        .annotate(count=Count("pk"))
-        .order_by("age_group_named")
-    )
-
-    demographics = [
-        {
-            "age_group": key,
-            **{item.get("gender"): item.get("count") for item in list(group)},
-        }
-        for key, group in itertools.groupby(demographics, itemgetter("age_group_named"))
-    ]
-
-    COD_sums = (
-        user_vas_filtered.filter(causes__isnull=False)
-        .select_related("causes")
-        .values(cause=F("causes__cause"))
-        .annotate(count=Count("pk"))
-        .order_by("-count")
-    )
-
-    COD_trend = (
-        user_vas_filtered.annotate(
-            month=TruncMonth(Cast("Id10023", output_field=DateField()))
-        )
-        .filter(causes__isnull=False)
-        .values("month")
-        .annotate(count=Count("pk"))
-        .order_by("month")
-    )
-
-    place_of_death = (
-        user_vas_filtered.filter(causes__isnull=False)
-        .values(place=F("Id10058"))
-        .annotate(count=Count("pk"))
-        .order_by("-count")
-    )
-
-    geographic_province_sums = (
-        user_vas_filtered.annotate(
-            province_name=Subquery(
-                Location.objects.values("name").filter(
-                    Q(path=Substr(OuterRef("location__path"), 1, 8)), Q(depth=2)
-                )[:1]
-            )
-        )
-        .filter(causes__isnull=False)
-        .select_related("location")
-        .values("province_name")
-        .annotate(count=Count("pk"))
-    )
-
-    geographic_district_sums = (
-        user_vas_filtered.annotate(
-            district_name=Subquery(
-                Location.objects.values("name").filter(
-                    Q(path=Substr(OuterRef("location__path"), 1, 12)), Q(depth=3)
-                )[:1]
-            )
-        )
-        .filter(causes__isnull=False)
-        .select_related("location")
-        .values("district_name")
-        .annotate(count=Count("pk"))
+        rows = [row for row in rows if row["sex"] == sex]
+
+    COD_sums, COD_trend, place_of_death = Counter(), Counter(), Counter()
+    province_sums, district_sums = Counter(), Counter()
+    demographics = defaultdict(Counter)
+    for row in rows:
+        count = row["count"]
+        COD_sums[row["cause"]] += count
+        COD_trend[row["month"]] += count
+        place_of_death[row["place"]] += count
+        province_sums[row["facility_province"]] += count
+        district_sums[row["facility_district"]] += count
+        demographics[row["age"] or "Unknown"][row["sex"]] += count
+
+    region_names = dict(
+        Location.objects.filter(
+            id__in=set(province_sums) | set(district_sums)
+        ).values_list("id", "name")
     )
 
     data = {
-        "COD_grouping": COD_sums,
-        "COD_trend": COD_trend,
-        "place_of_death": place_of_death,
-        "demographics": demographics,
-        "geographic_province_sums": geographic_province_sums,
-        "geographic_district_sums": geographic_district_sums,
+        "COD_grouping": [
+            {"cause": cause, "count": count} for cause, count in COD_sums.most_common()
+        ],
+        "COD_trend": [
+            {"month": month, "count": COD_trend[month]} for month in sorted(COD_trend)
+        ],
+        "place_of_death": [
+            {"place": place, "count": count}
+            for place, count in place_of_death.most_common()
+        ],
+        "demographics": [
+            {"age_group": age_group, **demographics[age_group]}
+            for age_group in sorted(demographics)
+        ],
+        "geographic_province_sums": [
+            {"province_name": region_names.get(province), "count": count}
+            for province, count in province_sums.items()
+        ],
+        "geographic_district_sums": [
+            {"district_name": region_names.get(district), "count": count}
+            for district, count in district_sums.items()
+        ],
         "uncoded_vas": uncoded_vas,
         "update_stats": update_stats,
-        "all_causes_list": load_cod_groupings(cause_of_death=cause_of_death)[
-            "dropdown_options"
-        ],
+        "all_causes_list": cod_groupings["dropdown_options"],
     }
 
     return data
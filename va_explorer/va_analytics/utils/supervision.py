@@ -0,0 +1,101 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import TruncWeek
+
+from va_explorer.va_data_management.utils.data_version import queryset_cache_key
+from va_explorer.va_data_management.utils.date_parsing import count_by_start_date
+
+# columns the supervision stats can be grouped by
+SUPERVISION_GROUPS = {
+    "interviewer": F("Id10010"),
+    "facility": F("location__name"),
+}
+# seconds supervision stats are cached for; they are dropped sooner if VA data
+# changes
+SUPERVISION_CACHE_TIMEOUT = 60 * 60
+
+
+# Supervision stats of vas grouped by group_col (interviewer or facility): total
+# VAs, warnings, errors, weeks with interviews, last interview and VAs per week.
+# Only VAs with an interview (or start) date are counted. Interviewer rows are
+# repeated for every facility the interviewer worked at. Stats are cached until VA
+# data changes.
+def get_supervision_stats(vas, group_col):
+    key = queryset_cache_key(f"supervision_stats:{group_col}", vas)
+    stats = cache.get(key) if key else None
+    if stats is None:
+        stats = _compute_supervision_stats(vas, group_col)
+        if key:
+            cache.set(key, stats, timeout=SUPERVISION_CACHE_TIMEOUT)
+    return stats
+
+
+def _compute_supervision_stats(vas, group_col):
+    # per group: [total VAs, warnings, errors, weeks with interviews, last interview]
+    groups = defaultdict(lambda: [0, 0, 0, set(), None])
+    facilities = defaultdict(dict)
+    for row in _count_by_week(vas):
+        group = groups[row[group_col]]
+        group[0] += row["total"]
+        group[1] += row["warnings"]
+        group[2] += row["errors"]
+        group[3].add(row["week"])
+        group[4] = max(group[4] or row["last"], row["last"])
+        facilities[row[group_col]][row["facility"]] = None
+
+    stats = []
+    for name, (total, warnings, errors, weeks, last) in groups.items():
+        group_stats = {
+            group_col: name,
+            "Total VAs": total,
+            "warnings": warnings,
+            "errors": errors,
+            "Weeks of Data": len(weeks),
+            "Last Interview": last,
+            "VAs / week": round(total / len(weeks), 2),
+        }
+        if group_col == "facility":
+            stats.append(group_stats)
+        else:
+            stats.extend(
+                {**group_stats, "facility": facility} for facility in facilities[name]
+            )
+    return stats
+
+
+# Counts of vas by interviewer, facility and week of interview, as dicts with
+# interviewer, facility, week, total, warnings, errors and last (interview date)
+def _count_by_week(vas):
+    counts = {
+        "total": Count("id", distinct=True),
+        "warnings": Count(
+            "coding_issues",
+            filter=Q(coding_issues__severity="warning"),
+            distinct=True,
+        ),
+        "errors": Count(
+            "coding_issues",
+            filter=Q(coding_issues__severity="error"),
+            distinct=True,
+        ),
+    }
+    yield from (
+        vas.filter(interview_date__isnull=False)
+        .annotate(week=TruncWeek("interview_date"), **SUPERVISION_GROUPS)
+        .values("interviewer", "facility", "week")
+        .annotate(last=Max("interview_date"), **counts)
+        .order_by()
+    )
+
+    # VAs without a parsed interview date are dated by their start date
+    start_dates = count_by_start_date(vas, counts, SUPERVISION_GROUPS)
+    start_dates = start_dates.assign(last=start_dates["date"].dt.date)
+    for row in start_dates.to_dict(orient="records"):
+        yield {
+            **row,
+            **{name: int(row[name]) for name in counts},
+            "week": row["last"] - timedelta(days=row["last"].weekday()),
+        }
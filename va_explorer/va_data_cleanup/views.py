@@ -13,7 +13,7 @@ from ..va_data_management.models import (
     VerbalAutopsy,
     questions_to_autodetect_duplicates,
 )
-from ..va_data_management.utils.date_parsing import parse_date
+from ..va_data_management.utils.date_parsing import parse_dates
 from .models import DataCleanup
 
 User = get_user_model()
@@ -46,12 +46,15 @@ class DataCleanupIndexView(CustomAuthMixin, PermissionRequiredMixin, ListView):
         )
         context["va_data_cleanup"] = True
 
+        object_list = list(context["object_list"])
+        interview_dates = parse_dates([va.Id10012 for va in object_list])
+        death_dates = parse_dates([va.Id10023 for va in object_list])
         context["object_list"] = [
             {
                 "id": va.id,
                 "interviewer": va.Id10010,
-                "interviewed": parse_date(va.Id10012),
-                "dod": parse_date(va.Id10023) if (va.Id10023 != "dk") else "Unknown",
+                "interviewed": interviewed,
+                "dod": dod if (va.Id10023 != "dk") else "Unknown",
                 "facility": va.location.name if va.location else "Not Provided",
                 "deceased": va.deceased,
                 "cause": (
@@ -74,7 +77,9 @@ class DataCleanupIndexView(CustomAuthMixin, PermissionRequiredMixin, ListView):
                     ]
                 ),
             }
-            for va in context["object_list"]
+            for va, interviewed, dod in zip(
+                object_list, interview_dates, death_dates, strict=True
+            )
         ]
 
         return context
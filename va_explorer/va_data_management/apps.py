@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class VaDataManagementConfig(AppConfig):
     name = "va_explorer.va_data_management"
+
+    def ready(self):
+        from va_explorer.va_data_management import signals  # noqa: F401
@@ -846,6 +846,8 @@ _display_fields = [
 HIDDEN_FIELDS = (
     "id",
     "location",
+    "location_province",
+    "location_district",
     "instanceid",
     "instanceName",
     "deleted_at",
@@ -43,13 +43,13 @@ class VAFilter(FilterSet):
         widget=TextInput(attrs={"class": "form-text"}),
     )
     start_date = DateFilter(
-        field_name="Id10023",
+        field_name="death_date",
         lookup_expr="gte",
         label="Earliest Date",
         widget=DateInput(attrs={"class": "form-date datepicker"}),
     )
     end_date = DateFilter(
-        field_name="Id10023",
+        field_name="death_date",
         lookup_expr="lte",
         label="Latest Date",
         widget=DateInput(attrs={"class": "form-date datepicker"}),
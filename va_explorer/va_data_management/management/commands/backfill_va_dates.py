@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from va_explorer.va_analytics.models import DashboardRollup
+from va_explorer.va_data_management.models import VerbalAutopsy
+from va_explorer.va_data_management.utils.date_parsing import backfill_parsed_dates
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills in the typed death_date and interview_date columns of existing VAs "
+        "from their Id10023 and Id10012 values (migrations already do this; use it "
+        "after changing how dates are parsed)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch_size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        count = VerbalAutopsy.all_objects.count()
+        self.stdout.write(f"Backfilling dates for {count} VAs")
+        updated = backfill_parsed_dates(VerbalAutopsy, options["batch_size"])
+        # the dashboard rollup groups VAs by month of death
+        DashboardRollup.refresh()
+        self.stdout.write(f"Done: backfilled dates for {updated} VA(s).")
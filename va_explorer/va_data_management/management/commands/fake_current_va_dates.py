@@ -3,6 +3,7 @@ from os import environ
 
 from django.core.management.base import BaseCommand
 
+from va_explorer.va_analytics.models import DashboardRollup
 from va_explorer.va_data_management.models import VerbalAutopsy
 
 # Demo only: script to update all VA dates in the system to allow an
@@ -38,3 +39,4 @@ class Command(BaseCommand):
                 datetime.strptime(va.Id10023, "%m/%d/%y").date() + shift
             )
             va.save_without_historical_record()
+        DashboardRollup.refresh()
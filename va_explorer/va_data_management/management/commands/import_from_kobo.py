@@ -2,8 +2,11 @@ import os
 
 from django.core.management.base import BaseCommand
 
-from va_explorer.va_data_management.utils.kobo import download_responses
-from va_explorer.va_data_management.utils.loading import load_records_from_dataframe
+from va_explorer.va_data_management.utils.kobo import (
+    PREFETCH_DEPTH,
+    import_responses,
+)
+from va_explorer.va_data_management.utils.loading import INSERT_BACKENDS
 
 BATCH_SIZE = 5000
 
@@ -24,11 +27,34 @@ class Command(BaseCommand):
             required=False,
             default=os.environ.get("KOBO_ASSET_ID"),
         )
+        parser.add_argument(
+            "--insert_backend",
+            choices=list(INSERT_BACKENDS),
+            default="orm",
+            help="How new VAs are inserted; 'copy' uses PostgreSQL COPY",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last unfinished import where it stopped",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only download submissions newer than the last import",
+        )
+        parser.add_argument(
+            "--prefetch_depth",
+            type=int,
+            default=PREFETCH_DEPTH,
+            help="Pages to download ahead while the current page loads; 0 disables",
+        )
 
     def handle(self, *args, **options):
         _ = args  # unused
         token = options["token"]
         asset_id = options["asset_id"]
+        insert_backend = options["insert_backend"]
 
         if not token or not asset_id:
             self.stderr.write(
@@ -37,35 +63,20 @@ class Command(BaseCommand):
             )
             return
 
-        # Make an initial call and loop if necessary
-        forms, next_page = download_responses(token, asset_id, BATCH_SIZE, None)
-        results = load_records_from_dataframe(forms)
-
-        num_created = len(results["created"])
-        num_ignored = len(results["ignored"])
-        num_outdated = len(results["outdated"])
-        num_corrected = len(results["corrected"])
-        num_invalid = len(results["removed"])
-        pages_processed = 1
-
-        while next_page is not None:
-            forms, next_page = download_responses(
-                token, asset_id, BATCH_SIZE, next_page
-            )
-            results = load_records_from_dataframe(forms)
-            num_created = num_created + len(results["created"])
-            num_ignored = num_ignored + len(results["ignored"])
-            num_outdated = num_outdated + len(results["outdated"])
-            num_corrected = num_corrected + len(results["corrected"])
-            num_invalid = num_invalid + len(results["removed"])
-            pages_processed = pages_processed + 1
-            self.stdout.write(
-                "Processed Additional Page. " f"{pages_processed} processed total.."
-            )
+        counts = import_responses(
+            token,
+            asset_id,
+            incremental=options["incremental"],
+            batch_size=BATCH_SIZE,
+            insert_backend=insert_backend,
+            progress=self.stdout.write,
+            resume=options["resume"],
+            prefetch_depth=options["prefetch_depth"],
+        )
 
         self.stdout.write(
-            f"Loaded {num_created} verbal autopsies from Kobo "
-            f"{num_corrected} required correction in order to import "
-            f"({num_ignored} ignored, {num_outdated} overwritten, "
-            f"{num_invalid} removed as invalid)"
+            f"Loaded {counts['created']} verbal autopsies from Kobo "
+            f"{counts['corrected']} required correction in order to import "
+            f"({counts['ignored']} ignored, {counts['outdated']} overwritten, "
+            f"{counts['removed']} removed as invalid)"
         )
@@ -2,8 +2,8 @@ import os
 
 from django.core.management.base import BaseCommand
 
-from va_explorer.va_data_management.utils.loading import load_records_from_dataframe
-from va_explorer.va_data_management.utils.odk import download_responses
+from va_explorer.va_data_management.utils.loading import INSERT_BACKENDS
+from va_explorer.va_data_management.utils.odk import import_responses
 
 
 class Command(BaseCommand):
@@ -23,6 +23,22 @@ class Command(BaseCommand):
         parser.add_argument("--project-id", type=str, required=False)
         parser.add_argument("--form-id", type=str, required=False)
         parser.add_argument("--form-name", type=str, required=False)
+        parser.add_argument(
+            "--insert_backend",
+            choices=list(INSERT_BACKENDS),
+            default="orm",
+            help="How new VAs are inserted; 'copy' uses PostgreSQL COPY",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last unfinished import where it stopped",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only download submissions received since the last import",
+        )
 
     def handle(self, *args, **options):
         _ = args  # unused
@@ -32,6 +48,7 @@ class Command(BaseCommand):
         project_name = options["project_name"]
         form_id = options["form_id"]
         form_name = options["form_name"]
+        insert_backend = options["insert_backend"]
 
         if not email or not password:
             self.stderr.write(
@@ -54,15 +71,22 @@ class Command(BaseCommand):
             )
             return
 
-        forms = download_responses(
-            email, password, project_name, project_id, form_name, form_id
+        counts = import_responses(
+            email,
+            password,
+            project_name,
+            project_id,
+            form_name,
+            form_id,
+            incremental=options["incremental"],
+            insert_backend=insert_backend,
+            progress=self.stdout.write,
+            resume=options["resume"],
         )
 
-        results = load_records_from_dataframe(forms)
-
-        num_created = len(results["created"])
-        num_ignored = len(results["ignored"])
-        num_outdated = len(results["outdated"])
+        num_created = counts["created"]
+        num_ignored = counts["ignored"]
+        num_outdated = counts["outdated"]
 
         self.stdout.write(
             f"Loaded {num_created} verbal autopsies from ODK "
@@ -6,7 +6,10 @@ from anytree import LevelOrderIter, Node, RenderTree
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from va_explorer.va_data_management.models import Location
+from va_explorer.va_data_management.models import Location, VerbalAutopsy
+from va_explorer.va_data_management.utils.location_assignment import (
+    invalidate_facility_index,
+)
 
 required_columns = ["province", "district", "key", "name", "status"]
 missing_column_error_msg = ", ".join(required_columns)
@@ -272,6 +275,10 @@ def _process_facility_tree(tree, delete_previous=False):
         )
         location_ct += 1
 
+    invalidate_facility_index()
+    # adding locations can move existing ones in the tree
+    VerbalAutopsy.update_location_ancestors()
+
     print(f"  added {location_ct} new locations to system")
     print(f"  updated {update_ct} locations with new data")
     print(f"  marked {delete_ct} locations as inactive")
@@ -1,9 +1,18 @@
 import argparse
+import os
 
 import pandas as pd
 from django.core.management.base import BaseCommand
 
-from va_explorer.va_data_management.utils.loading import load_records_from_dataframe
+from va_explorer.va_data_management.models import IngestRun
+from va_explorer.va_data_management.utils.loading import (
+    INSERT_BACKENDS,
+    load_records_from_chunks,
+    load_records_from_dataframe,
+)
+
+# chunk size used for --workers and --resume when --chunk_size isn't given
+DEFAULT_CHUNK_SIZE = 5000
 
 
 class Command(BaseCommand):
@@ -12,16 +21,70 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("csv_file", type=argparse.FileType("r"))
         parser.add_argument("--random_locations", type=str, nargs="?", default=False)
+        parser.add_argument(
+            "--chunk_size",
+            type=int,
+            default=None,
+            help="Stream the CSV in chunks of this many rows to bound memory usage",
+        )
+        parser.add_argument(
+            "--insert_backend",
+            choices=list(INSERT_BACKENDS),
+            default="orm",
+            help="How new VAs are inserted; 'copy' uses PostgreSQL COPY",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes preparing CSV chunks in parallel",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last unfinished import of this file where it stopped",
+        )
 
     def handle(self, *args, **options):
-        csv_data = pd.read_csv(options["csv_file"], low_memory=False)
         random_locations = options.get("random_locations", False)
+        chunk_size = options.get("chunk_size")
+        insert_backend = options["insert_backend"]
+        workers = options["workers"]
+        resume = options["resume"]
+        if (workers > 1 or resume) and not chunk_size:
+            chunk_size = DEFAULT_CHUNK_SIZE
 
-        results = load_records_from_dataframe(csv_data, random_locations)
+        if chunk_size:
+            csv_file = options["csv_file"]
+            run = IngestRun.start("csv", os.path.abspath(csv_file.name), resume)
+            # skip the data rows committed before the previous run stopped
+            skiprows = None
+            if run.rows_committed:
+                self.stdout.write(f"Resuming after row {run.rows_committed}")
+                skiprows = range(1, run.rows_committed + 1)
+            chunks = pd.read_csv(
+                csv_file, low_memory=False, chunksize=chunk_size, skiprows=skiprows
+            )
+            counts = load_records_from_chunks(
+                chunks,
+                random_locations,
+                progress=self.stdout.write,
+                insert_backend=insert_backend,
+                workers=workers,
+                run=run,
+            )
+            num_created = counts["created"]
+            num_ignored = counts["ignored"]
+            num_outdated = counts["outdated"]
+        else:
+            csv_data = pd.read_csv(options["csv_file"], low_memory=False)
+            results = load_records_from_dataframe(
+                csv_data, random_locations, insert_backend=insert_backend
+            )
 
-        num_created = len(results["created"])
-        num_ignored = len(results["ignored"])
-        num_outdated = len(results["outdated"])
+            num_created = len(results["created"])
+            num_ignored = len(results["ignored"])
+            num_outdated = len(results["outdated"])
 
         self.stdout.write(
             f"Loaded {num_created} verbal autopsies from CSV "
@@ -8,6 +8,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from tqdm import tqdm
 
+from va_explorer.va_analytics.models import DashboardRollup
 from va_explorer.va_data_management.models import VerbalAutopsy
 
 # Demo only: script to randomize VA dates for demos of e.g. the metrics page
@@ -44,3 +45,4 @@ class Command(BaseCommand):
             va.Id10023 = va.created = va.updated = va.Id10012 = new_date
             va.skip_history_when_saving = True
             va.save()
+        DashboardRollup.refresh()
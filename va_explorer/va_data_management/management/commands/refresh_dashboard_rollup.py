@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from va_explorer.va_analytics.models import DashboardRollup
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the dashboard rollup table from all VAs in the system"
+
+    def handle(self, *args, **options):
+        DashboardRollup.refresh()
+        count = DashboardRollup.objects.count()
+        self.stdout.write(f"Rebuilt dashboard rollup ({count} rows)")
@@ -3,8 +3,13 @@ from math import ceil
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from va_explorer.va_data_management.models import Location, VerbalAutopsy
-from va_explorer.va_data_management.utils.location_assignment import assign_va_location
+from va_explorer.va_analytics.models import DashboardRollup
+from va_explorer.va_data_management.models import VerbalAutopsy
+from va_explorer.va_data_management.utils.location_assignment import (
+    assign_va_location,
+    get_facility_index,
+    invalidate_facility_index,
+)
 from va_explorer.va_data_management.utils.validate import validate_vas_for_dashboard
 
 
@@ -19,6 +24,11 @@ class Command(BaseCommand):
         batch_size = 5000
         batches = ceil(count / batch_size)
         changed_count = 0
+        # locations VAs were moved from or to, whose dashboard rollup is rebuilt
+        changed_location_ids = set()
+        # rebuild the facility index so VAs are matched against the latest list
+        invalidate_facility_index()
+        facility_index = get_facility_index()
 
         for i in range(batches):
             if settings.DEBUG:
@@ -27,31 +37,21 @@ class Command(BaseCommand):
             batch_start = i * batch_size
             batch_end = (i + 1) * batch_size
 
-            # build location mapper to map csv locations to known db locations
-            # using list comprehension to remove duplicated from list
-            location_map = {}
-            verbal_autopsies = list(VerbalAutopsy.objects.all()[batch_start:batch_end])
-            h = [va.hospital for va in verbal_autopsies]
-            hospitals = []
-            [hospitals.append(x) for x in h if x not in hospitals]
-
-            location_map = {
-                key_name_pair[0]: key_name_pair[1]
-                for key_name_pair in Location.objects.filter(key__in=hospitals)
-                .only("name", "key")
-                .values_list("key", "name")
-            }
+            verbal_autopsies = list(
+                VerbalAutopsy.objects.order_by("id")[batch_start:batch_end]
+            )
 
             for va in verbal_autopsies:
-                old_location = va.location
-                new_va = assign_va_location(va, location_map)
-                new_location = new_va.location
+                old_location_id = va.location_id
+                assign_va_location(va, facility_index=facility_index)
 
-                if old_location != new_location:
+                if old_location_id != va.location_id:
                     changed_count += 1
-                    va.location = new_va.location
+                    changed_location_ids.update([old_location_id, va.location_id])
                     va.save()
 
+            # only re-runs rules for the VAs that moved (or whose facility changed)
             validate_vas_for_dashboard(verbal_autopsies)
 
+        DashboardRollup.refresh(changed_location_ids)
         print(f"Done: changed locations for {changed_count} VA(s).")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from va_explorer.va_analytics.utils.loading import reload_cod_groupings
+
+
+class Command(BaseCommand):
+    help = (
+        "Reloads the dashboard's COD groupings from their csv files in every "
+        "running process; run after changing the files"
+    )
+
+    def handle(self, *args, **options):
+        reload_cod_groupings()
+        self.stdout.write("Reloaded COD groupings")
@@ -6,6 +6,8 @@ from django.core.management.base import BaseCommand
 from va_explorer.va_data_management.models import CauseOfDeath
 from va_explorer.va_data_management.utils.coding import (
     ALGORITHM_SETTINGS,
+    CODING_BATCH_SIZE,
+    CODING_WORKERS,
     run_coding_algorithms,
     validate_algorithm_settings,
 )
@@ -21,6 +23,23 @@ class Command(BaseCommand):
         parser.add_argument(
             "--cod_fname", type=str, nargs="?", default="old_cod_mapping.csv"
         )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=CODING_BATCH_SIZE,
+            help="Number of VAs sent to pyCrossVA and InterVA5 per request",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=CODING_WORKERS,
+            help="Number of batches coded concurrently",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue after the last VA coded by an interrupted run",
+        )
 
     def handle(self, **options):
         ti = time.time()
@@ -30,7 +49,11 @@ class Command(BaseCommand):
                 self.clear_and_save_old_cods(options["cod_fname"])
 
             print("coding all eligible VAs... ")
-            stats = run_coding_algorithms()
+            stats = run_coding_algorithms(
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+                resume=options["resume"],
+            )
             num_coded = len(stats["causes"])
             num_total = len(stats["verbal_autopsies"])
             num_issues = len(stats["issues"])
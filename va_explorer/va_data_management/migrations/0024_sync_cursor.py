@@ -0,0 +1,28 @@
+# Generated by Django 4.1.2 on 2026-10-16 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('va_data_management', '0023_location_new_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.TextField()),
+                ('source_id', models.TextField()),
+                ('last_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_submission_time', models.DateTimeField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='synccursor',
+            constraint=models.UniqueConstraint(fields=('source', 'source_id'), name='unique_sync_cursor'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.2 on 2026-10-16 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('va_data_management', '0024_sync_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.TextField()),
+                ('source_id', models.TextField()),
+                ('status', models.CharField(choices=[('running', 'running'), ('completed', 'completed'), ('failed', 'failed')], default='running', max_length=9)),
+                ('rows_committed', models.BigIntegerField(default=0)),
+                ('chunks_committed', models.IntegerField(default=0)),
+                ('next_page', models.TextField(blank=True, null=True)),
+                ('num_created', models.IntegerField(default=0)),
+                ('num_ignored', models.IntegerField(default=0)),
+                ('num_outdated', models.IntegerField(default=0)),
+                ('num_corrected', models.IntegerField(default=0)),
+                ('num_removed', models.IntegerField(default=0)),
+                ('load_seconds', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ingestrun',
+            index=models.Index(fields=['source', 'source_id', 'status'], name='va_data_man_source_220bf1_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.2 on 2026-10-16 22:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# length of each step of a treebeard materialized path
+STEPLEN = 4
+
+
+# fill in the province (depth 2) and district (depth 3) ancestors of existing
+# VAs' locations, with one update per distinct pair of ancestors
+def backfill_location_ancestors(apps, schema_editor):
+    Location = apps.get_model("va_data_management", "Location")
+    VerbalAutopsy = apps.get_model("va_data_management", "VerbalAutopsy")
+    ids_by_path = dict(Location.objects.values_list("path", "id"))
+    location_ids_by_ancestors = {}
+    for location_id, path in Location.objects.values_list("id", "path"):
+        ancestors = (
+            ids_by_path.get(path[: 2 * STEPLEN]) if len(path) >= 2 * STEPLEN else None,
+            ids_by_path.get(path[: 3 * STEPLEN]) if len(path) >= 3 * STEPLEN else None,
+        )
+        location_ids_by_ancestors.setdefault(ancestors, []).append(location_id)
+    for (province_id, district_id), location_ids in location_ids_by_ancestors.items():
+        VerbalAutopsy.objects.filter(location_id__in=location_ids).update(
+            location_province_id=province_id, location_district_id=district_id
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('va_data_management', '0025_ingest_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verbalautopsy',
+            name='location_district',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='va_data_management.location'),
+        ),
+        migrations.AddField(
+            model_name='verbalautopsy',
+            name='location_province',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='va_data_management.location'),
+        ),
+        migrations.RunPython(backfill_location_ancestors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 4.1.2 on 2026-10-16 22:40
+
+import re
+from datetime import datetime
+
+import pandas as pd
+from django.db import migrations, models
+
+# date formats accepted when this migration was written (settings.DATE_FORMATS)
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%m/%d/%Y",
+    "%m/%d/%y",
+    "%d/%m/%Y",
+    "%d/%m/%y",
+    "%Y-%m-%d %H:%M:%S",
+]
+# VAs parsed per query, so we don't overwhelm RAM
+BATCH_SIZE = 5000
+
+
+# date of a VA's date string as parsed by utils/date_parsing.py when this
+# migration was written, or None for unknown and unparseable dates
+def parse_date(date_str):
+    if date_str is None:
+        return None
+    date_str = str(date_str)
+    if date_str.lower() in ["", "nan", "dk"]:
+        return None
+    # remove any excessive decimals at end of string
+    date_str = date_str.split(".")[0]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt).date()
+        except ValueError:
+            pass
+    # timestamps keep only their date
+    if re.search(r"\dT\d", date_str):
+        try:
+            return datetime.strptime(re.split(r"T\d", date_str)[0], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+    # pandas's to_datetime as a last resort
+    try:
+        parsed = pd.to_datetime(date_str)
+    except Exception:
+        return None
+    return None if pd.isna(parsed) else parsed.date()
+
+
+# parse the dates of existing VAs (deleted ones too), so they aren't left out of
+# date filters. Each distinct date string is parsed once.
+def backfill_dates(apps, schema_editor):
+    VerbalAutopsy = apps.get_model("va_data_management", "VerbalAutopsy")
+    vas = VerbalAutopsy.objects.only("id", "Id10023", "Id10012").order_by("id")
+    dates = {}
+    last_id = 0
+    while True:
+        batch = list(vas.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            return
+        for va in batch:
+            for date_str in (va.Id10023, va.Id10012):
+                if date_str not in dates:
+                    dates[date_str] = parse_date(date_str)
+            va.death_date = dates[va.Id10023]
+            va.interview_date = dates[va.Id10012]
+        VerbalAutopsy.objects.bulk_update(batch, ["death_date", "interview_date"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('va_data_management', '0026_verbalautopsy_location_ancestors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verbalautopsy',
+            name='death_date',
+            field=models.DateField(editable=False, null=True, verbose_name='Date of death'),
+        ),
+        migrations.AddField(
+            model_name='verbalautopsy',
+            name='interview_date',
+            field=models.DateField(editable=False, null=True, verbose_name='Date of interview'),
+        ),
+        migrations.AddIndex(
+            model_name='verbalautopsy',
+            index=models.Index(fields=['death_date'], name='va_data_man_death_d_74f9d5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verbalautopsy',
+            index=models.Index(fields=['interview_date'], name='va_data_man_intervi_347cb8_idx'),
+        ),
+        migrations.RunPython(backfill_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.2 on 2026-10-16 23:02
+
+from django.db import migrations, models
+from django.db.models import Q
+
+# VA fields flagging each age group, in order of precedence (as in models.py)
+AGE_GROUP_FIELDS = {
+    "neonate": ["isNeonatal", "isNeonatal1", "isNeonatal2"],
+    "child": ["isChild", "isChild1", "isChild2"],
+    "adult": ["isAdult", "isAdult1", "isAdult2"],
+}
+
+
+# set the age group of existing VAs, one update per age group
+def backfill_age_group(apps, schema_editor):
+    VerbalAutopsy = apps.get_model("va_data_management", "VerbalAutopsy")
+    for group, fields in AGE_GROUP_FIELDS.items():
+        flagged = Q()
+        for field in fields:
+            flagged |= Q(**{f"{field}__in": ["1", "1.0"]})
+        VerbalAutopsy.objects.filter(flagged, derived_age_group__isnull=True).update(
+            derived_age_group=group
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('va_data_management', '0027_verbalautopsy_parsed_dates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verbalautopsy',
+            name='derived_age_group',
+            field=models.CharField(choices=[('neonate', 'neonate'), ('child', 'child'), ('adult', 'adult')], editable=False, max_length=7, null=True, verbose_name='Derived age group'),
+        ),
+        migrations.AddIndex(
+            model_name='verbalautopsy',
+            index=models.Index(fields=['derived_age_group'], name='va_data_man_derived_5bfdc0_idx'),
+        ),
+        migrations.RunPython(backfill_age_group, migrations.RunPython.noop),
+    ]
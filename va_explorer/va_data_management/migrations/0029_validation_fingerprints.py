@@ -0,0 +1,23 @@
+# Generated by Django 4.1.2 on 2026-10-17 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('va_data_management', '0028_verbalautopsy_age_group'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='causecodingissue',
+            name='rule',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='verbalautopsy',
+            name='validation_fingerprints',
+            field=models.JSONField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.1.2 on 2026-10-17 01:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('va_data_management', '0029_validation_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodingRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('algorithm', models.TextField()),
+                ('settings', models.JSONField()),
+                ('status', models.CharField(choices=[('running', 'running'), ('completed', 'completed'), ('failed', 'failed')], default='running', max_length=9)),
+                ('batch_size', models.IntegerField()),
+                ('workers', models.IntegerField()),
+                ('last_va_id', models.IntegerField(blank=True, null=True)),
+                ('num_vas', models.IntegerField(default=0)),
+                ('num_cached', models.IntegerField(default=0)),
+                ('num_coded', models.IntegerField(default=0)),
+                ('num_issues', models.IntegerField(default=0)),
+                ('num_failed_batches', models.IntegerField(default=0)),
+                ('transform_seconds', models.FloatField(default=0)),
+                ('algorithm_seconds', models.FloatField(default=0)),
+                ('save_seconds', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransformCache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('row', models.JSONField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CodingBatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_va_id', models.IntegerField()),
+                ('last_va_id', models.IntegerField()),
+                ('status', models.CharField(choices=[('completed', 'completed'), ('failed', 'failed')], max_length=9)),
+                ('num_vas', models.IntegerField(default=0)),
+                ('num_cached', models.IntegerField(default=0)),
+                ('num_coded', models.IntegerField(default=0)),
+                ('num_issues', models.IntegerField(default=0)),
+                ('transform_seconds', models.FloatField(default=0)),
+                ('algorithm_seconds', models.FloatField(default=0)),
+                ('save_seconds', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='va_data_management.codingrun')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='causeofdeath',
+            name='coding_run',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='causes', to='va_data_management.codingrun'),
+        ),
+        migrations.AddField(
+            model_name='historicalcauseofdeath',
+            name='coding_run',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='va_data_management.codingrun'),
+        ),
+    ]
@@ -6,6 +6,7 @@ from django.conf import settings
 from django.core.exceptions import FieldDoesNotExist
 from django.db import models
 from django.db.models import Count, JSONField
+from django.utils import timezone
 from simple_history.models import HistoricalRecords
 from treebeard.mp_tree import MP_Node
 
@@ -21,6 +22,8 @@ from .constants import (
     _select_512,
     _select_vaccines,
 )
+from .utils.data_version import bump_data_generation
+from .utils.date_parsing import parse_dates_as_dates
 from .utils.multi_select import MultiSelectField
 
 
@@ -52,18 +55,51 @@ class Location(MP_Node):
         return self.get_parent().id
 
 
+# VA fields flagging each age group, in order of precedence. A field flags its group
+# if it holds 1, which is stored as "1" or "1.0" depending on the source
+AGE_GROUP_FIELDS = {
+    "neonate": ["isNeonatal", "isNeonatal1", "isNeonatal2"],
+    "child": ["isChild", "isChild1", "isChild2"],
+    "adult": ["isAdult", "isAdult1", "isAdult2"],
+}
+AGE_GROUP_FLAG_VALUES = ["1", "1.0"]
+
+
+# Treebeard paths of the province (depth 2) and district (depth 3) ancestors of the
+# location at path; empty for levels path doesn't reach
+def location_ancestor_paths(path):
+    path = path or ""
+    steplen = Location.steplen
+    return tuple(
+        path[: depth * steplen] if len(path) >= depth * steplen else ""
+        for depth in (2, 3)
+    )
+
+
 class VerbalAutopsy(SoftDeletionModel):
     class Meta:
         permissions = (("bulk_delete", "Can bulk delete"),)
         indexes = [
             models.Index(fields=["unique_va_identifier"]),
             models.Index(fields=["Id10023"], name="death_date_filter_idx"),
+            models.Index(fields=["death_date"]),
+            models.Index(fields=["interview_date"]),
+            models.Index(fields=["derived_age_group"]),
         ]
 
     # Each VerbalAutopsy is associated with a facility, which is the leaf node location
     location = models.ForeignKey(
         Location, related_name="verbalautopsies", on_delete=models.CASCADE, null=True
     )
+    # The location's province and district ancestors, kept in sync with location
+    # (see set_location_ancestors) so geographic filters and sums don't have to
+    # look them up through location's path for every VA
+    location_province = models.ForeignKey(
+        Location, related_name="+", on_delete=models.SET_NULL, null=True, editable=False
+    )
+    location_district = models.ForeignKey(
+        Location, related_name="+", on_delete=models.SET_NULL, null=True, editable=False
+    )
 
     # The VA fields collected as part of the WHO VA form or local versions
     # TODO: Need an approach that supports different variants in different countries
@@ -1599,7 +1635,18 @@ class VerbalAutopsy(SoftDeletionModel):
     geopoint = models.TextField("geopoint", blank=True)
     comment = models.TextField("Comment", blank=True)
     # Track the history of changes to each verbal autopsy
-    history = HistoricalRecords(excluded_fields=["unique_va_identifier", "duplicate"])
+    history = HistoricalRecords(
+        excluded_fields=[
+            "unique_va_identifier",
+            "duplicate",
+            "location_province",
+            "location_district",
+            "death_date",
+            "interview_date",
+            "derived_age_group",
+            "validation_fingerprints",
+        ]
+    )
     # Automatically set timestamps
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -1611,6 +1658,23 @@ class VerbalAutopsy(SoftDeletionModel):
     duplicate = models.BooleanField(
         "Marks the record as duplicate", blank=True, default=False
     )
+    # Id10023 and Id10012 parsed as dates (see set_parsed_dates), for date range
+    # filters and grouping by month. Null when the date is unknown or unparseable
+    death_date = models.DateField("Date of death", null=True, editable=False)
+    interview_date = models.DateField("Date of interview", null=True, editable=False)
+    # neonate, child or adult as flagged by AGE_GROUP_FIELDS (see set_age_group).
+    # Null when no age group is flagged. Unlike age_group, which is the answer to
+    # the survey question, this is always worked out from the flags
+    derived_age_group = models.CharField(
+        "Derived age group",
+        max_length=7,
+        choices=[(group, group) for group in AGE_GROUP_FIELDS],
+        null=True,
+        editable=False,
+    )
+    # Fingerprint of the inputs of each validation rule as of the last validation,
+    # by rule name, so unchanged VAs aren't revalidated (see validate.py)
+    validation_fingerprints = JSONField(null=True, editable=False)
 
     # function to tell if VA had any coding errors
     def any_errors(self):
@@ -1624,6 +1688,62 @@ class VerbalAutopsy(SoftDeletionModel):
     # TODO: fill this out with cleaning operations we actually want to do
     #       return
 
+    # Set death_date and interview_date from the Id10023 and Id10012 strings
+    def set_parsed_dates(self):
+        self.death_date, self.interview_date = parse_dates_as_dates(
+            [self.Id10023, self.Id10012]
+        ).tolist()
+
+    # Set derived_age_group from the first age group flagged by AGE_GROUP_FIELDS
+    def set_age_group(self):
+        self.derived_age_group = next(
+            (
+                group
+                for group, fields in AGE_GROUP_FIELDS.items()
+                if any(
+                    str(getattr(self, field)) in AGE_GROUP_FLAG_VALUES
+                    for field in fields
+                )
+            ),
+            None,
+        )
+
+    # Set location_province and location_district to the ancestors of location at
+    # those depths. ancestor_ids maps Location paths to ids; if not given, the
+    # ancestors are looked up in the database.
+    def set_location_ancestors(self, ancestor_ids=None):
+        path = self.location.path if self.location_id else ""
+        province_path, district_path = location_ancestor_paths(path)
+        if ancestor_ids is None:
+            ancestor_ids = dict(
+                Location.objects.filter(
+                    path__in=[p for p in (province_path, district_path) if p]
+                ).values_list("path", "id")
+            )
+        self.location_province_id = ancestor_ids.get(province_path)
+        self.location_district_id = ancestor_ids.get(district_path)
+
+    # Recompute location_province and location_district for all VAs, e.x. after
+    # the location tree changed. One UPDATE per distinct (province, district).
+    @classmethod
+    def update_location_ancestors(cls):
+        ancestor_ids = dict(Location.objects.values_list("path", "id"))
+        location_ids_by_ancestors = {}
+        for location_id, path in Location.objects.values_list("id", "path"):
+            ancestors = tuple(
+                ancestor_ids.get(ancestor_path)
+                for ancestor_path in location_ancestor_paths(path)
+            )
+            location_ids_by_ancestors.setdefault(ancestors, []).append(location_id)
+        for ancestors, location_ids in location_ids_by_ancestors.items():
+            province_id, district_id = ancestors
+            cls.all_objects.filter(location_id__in=location_ids).update(
+                location_province_id=province_id, location_district_id=district_id
+            )
+        cls.all_objects.filter(location__isnull=True).update(
+            location_province=None, location_district=None
+        )
+
     def set_null_location(self, null_name="Unknown"):
         # to handle passing null_name=None
         if not null_name:
@@ -1682,6 +1802,7 @@ class VerbalAutopsy(SoftDeletionModel):
                     duplicate_vas.append(va)
 
                 VerbalAutopsy.objects.bulk_update(duplicate_vas, ["duplicate"])
+            bump_data_generation()
 
     def update_duplicates_with_changed_unique_identifier(self, saved_va):
         # Given a set of duplicate VAs, we designate the oldest one as the non-duplicate record.
@@ -1749,6 +1870,9 @@ class VerbalAutopsy(SoftDeletionModel):
     def save(self, *args, **kwargs):
         if VerbalAutopsy.auto_detect_duplicates():
             self.handle_update_duplicates()
+        self.set_location_ancestors()
+        self.set_parsed_dates()
+        self.set_age_group()
 
         super().save(*args, **kwargs)
 
@@ -1829,6 +1953,10 @@ class CauseOfDeath(models.Model):
     # Store the settings used for this particular coding run
     # NOTE: by using JSONField we tie ourselves to postgres
     settings = JSONField()
+    # The run of the coding algorithms that assigned the cause, if it was recorded
+    coding_run = models.ForeignKey(
+        "CodingRun", related_name="causes", on_delete=models.SET_NULL, null=True
+    )
     # Track the history of changes to each verbal autopsy cause of death coding
     # TODO: confirm that we need a history of this
     history = HistoricalRecords()
@@ -1857,6 +1985,9 @@ class CauseCodingIssue(models.Model):
     algorithm = models.TextField()
     # NOTE: by using JSONField we tie ourselves to postgres
     settings = JSONField()
+    # Name of the validation rule that raised a data issue (algorithm ""). Blank
+    # for coding issues and for data issues raised before rules were tracked
+    rule = models.TextField(blank=True, default="")
     # Automatically set timestamps
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -1864,3 +1995,278 @@ class CauseCodingIssue(models.Model):
 
     def __str__(self):
         return self.text
+
+
+class SyncCursor(models.Model):
+    # High-water mark of what has already been imported from an external source
+    # (e.g. a Kobo asset or an ODK form) so later imports only request newer
+    # submissions. A full resync ignores the cursor and rebuilds it.
+    source = models.TextField()
+    source_id = models.TextField()
+    # highest submission id seen (Kobo _id)
+    last_id = models.BigIntegerField(null=True, blank=True)
+    # latest submission time seen (Kobo _submission_time, ODK submissionDate)
+    last_submission_time = models.DateTimeField(null=True, blank=True)
+    # Automatically set timestamps
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "source_id"], name="unique_sync_cursor"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.source}:{self.source_id}"
+
+    @classmethod
+    def for_source(cls, source, source_id):
+        cursor, _ = cls.objects.get_or_create(source=source, source_id=source_id)
+        return cursor
+
+    # advance the cursor to the highest id/time seen in a batch of submissions
+    def advance(self, last_id=None, last_submission_time=None):
+        if last_id is not None and (self.last_id is None or last_id > self.last_id):
+            self.last_id = last_id
+        if last_submission_time is not None and (
+            self.last_submission_time is None
+            or last_submission_time > self.last_submission_time
+        ):
+            self.last_submission_time = last_submission_time
+        self.save()
+
+
+class IngestRun(models.Model):
+    # Ledger of one import from a source (a csv file, Kobo asset or ODK form).
+    # Progress is checkpointed after every chunk/page, in the same transaction as
+    # the chunk's writes, so an interrupted run can be resumed where it stopped.
+    source = models.TextField()
+    source_id = models.TextField()
+    STATUS_OPTIONS = ["running", "completed", "failed"]
+    status = models.CharField(
+        max_length=9,
+        choices=[(option, option) for option in STATUS_OPTIONS],
+        default="running",
+    )
+    # source rows and chunks/pages committed so far
+    rows_committed = models.BigIntegerField(default=0)
+    chunks_committed = models.IntegerField(default=0)
+    # where to continue paging from on resume (e.g. Kobo's next page link)
+    next_page = models.TextField(null=True, blank=True)
+    # running totals of load_records_from_dataframe's results
+    num_created = models.IntegerField(default=0)
+    num_ignored = models.IntegerField(default=0)
+    num_outdated = models.IntegerField(default=0)
+    num_corrected = models.IntegerField(default=0)
+    num_removed = models.IntegerField(default=0)
+    # time spent writing chunks, and the error that stopped a failed run
+    load_seconds = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    # Automatically set timestamps
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["source", "source_id", "status"])]
+
+    def __str__(self):
+        return f"{self.source}:{self.source_id} ({self.status})"
+
+    # Start a run for source, or with resume, pick up its latest unfinished run
+    # (one that failed or was killed while running)
+    @classmethod
+    def start(cls, source, source_id, resume=False):
+        run = None
+        if resume:
+            run = (
+                cls.objects.filter(source=source, source_id=source_id)
+                .exclude(status="completed")
+                .order_by("-created")
+                .first()
+            )
+        if run is None:
+            return cls.objects.create(source=source, source_id=source_id)
+        run.status = "running"
+        run.error = ""
+        run.save()
+        return run
+
+    # record a committed chunk; call inside the chunk's transaction
+    def checkpoint(self, counts, rows, seconds=0, next_page=None):
+        for key, value in counts.items():
+            setattr(self, f"num_{key}", getattr(self, f"num_{key}") + value)
+        self.rows_committed += rows
+        self.chunks_committed += 1
+        self.load_seconds += seconds
+        self.next_page = next_page
+        self.save()
+
+    def complete(self):
+        self.status = "completed"
+        self.finished = timezone.now()
+        self.save()
+
+    def fail(self, error):
+        self.status = "failed"
+        self.error = str(error)
+        self.finished = timezone.now()
+        self.save()
+
+    def totals(self):
+        return {
+            key: getattr(self, f"num_{key}")
+            for key in ["created", "ignored", "outdated", "corrected", "removed"]
+        }
+
+
+class CodingRun(models.Model):
+    # Ledger of one run of a coding algorithm (see utils/coding.py): the settings
+    # used, what every batch of VAs produced and how long each stage took. Progress
+    # is recorded after every batch, in the same transaction as the batch's causes,
+    # so an interrupted run can be resumed after the last VA it coded.
+    algorithm = models.TextField()
+    # NOTE: by using JSONField we tie ourselves to postgres
+    settings = JSONField()
+    STATUS_OPTIONS = ["running", "completed", "failed"]
+    status = models.CharField(
+        max_length=9,
+        choices=[(option, option) for option in STATUS_OPTIONS],
+        default="running",
+    )
+    batch_size = models.IntegerField()
+    workers = models.IntegerField()
+    # id of the last VA sent for coding; a resumed run continues after it
+    last_va_id = models.IntegerField(null=True, blank=True)
+    # running totals over the run's batches. num_cached counts VAs whose pyCrossVA
+    # output came from the TransformCache
+    num_vas = models.IntegerField(default=0)
+    num_cached = models.IntegerField(default=0)
+    num_coded = models.IntegerField(default=0)
+    num_issues = models.IntegerField(default=0)
+    num_failed_batches = models.IntegerField(default=0)
+    # time spent in each stage, summed over batches (which overlap in time)
+    transform_seconds = models.FloatField(default=0)
+    algorithm_seconds = models.FloatField(default=0)
+    save_seconds = models.FloatField(default=0)
+    # the error that stopped a failed run
+    error = models.TextField(blank=True)
+    # Automatically set timestamps
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.algorithm} ({self.status})"
+
+    # Start a run, or with resume, pick up the latest unfinished run (one that
+    # failed or was killed while running) of the algorithm with the same settings
+    @classmethod
+    def start(cls, algorithm, settings, batch_size, workers, resume=False):
+        run = None
+        if resume:
+            run = (
+                cls.objects.filter(algorithm=algorithm, settings=settings)
+                .exclude(status="completed")
+                .order_by("-created")
+                .first()
+            )
+        if run is None:
+            return cls.objects.create(
+                algorithm=algorithm,
+                settings=settings,
+                batch_size=batch_size,
+                workers=workers,
+            )
+        run.status = "running"
+        run.error = ""
+        run.save()
+        return run
+
+    # Record a batch of verbal_autopsies with its counts (cached, coded, issues) and
+    # seconds per stage (transform, algorithm, save), or the error it failed with.
+    # Call inside the batch's transaction.
+    def record_batch(self, verbal_autopsies, counts, seconds, error=None):
+        CodingBatch.objects.create(
+            run=self,
+            first_va_id=verbal_autopsies[0].id,
+            last_va_id=verbal_autopsies[-1].id,
+            num_vas=len(verbal_autopsies),
+            status="failed" if error else "completed",
+            error=str(error or ""),
+            **{f"num_{key}": value for key, value in counts.items()},
+            **{f"{key}_seconds": value for key, value in seconds.items()},
+        )
+        for key, value in counts.items():
+            setattr(self, f"num_{key}", getattr(self, f"num_{key}") + value)
+        for key, value in seconds.items():
+            setattr(self, f"{key}_seconds", getattr(self, f"{key}_seconds") + value)
+        self.num_vas += len(verbal_autopsies)
+        self.num_failed_batches += bool(error)
+        self.last_va_id = verbal_autopsies[-1].id
+        self.save()
+
+    def complete(self):
+        self.status = "completed"
+        self.finished = timezone.now()
+        self.save()
+
+    def fail(self, error):
+        self.status = "failed"
+        self.error = str(error)
+        self.finished = timezone.now()
+        self.save()
+
+
+class CodingBatch(models.Model):
+    # One batch of VAs (ids first_va_id to last_va_id) sent through pyCrossVA and
+    # the coding algorithm by a CodingRun
+    run = models.ForeignKey(CodingRun, related_name="batches", on_delete=models.CASCADE)
+    first_va_id = models.IntegerField()
+    last_va_id = models.IntegerField()
+    STATUS_OPTIONS = ["completed", "failed"]
+    status = models.CharField(
+        max_length=9, choices=[(option, option) for option in STATUS_OPTIONS]
+    )
+    num_vas = models.IntegerField(default=0)
+    num_cached = models.IntegerField(default=0)
+    num_coded = models.IntegerField(default=0)
+    num_issues = models.IntegerField(default=0)
+    transform_seconds = models.FloatField(default=0)
+    algorithm_seconds = models.FloatField(default=0)
+    save_seconds = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.run}: VAs {self.first_va_id}-{self.last_va_id}"
+
+
+class TransformCache(models.Model):
+    # pyCrossVA output (an InterVA5 input row, without its ID) for a VA, keyed by a
+    # hash of the VA fields sent to pyCrossVA and the transform version (see
+    # transform_cache_key in utils/coding.py). VAs whose fields haven't changed
+    # aren't sent to pyCrossVA again, e.g. when recoding with other InterVA5
+    # settings.
+    key = models.CharField(max_length=64, unique=True)
+    row = JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+    # cached rows of keys, by key
+    @classmethod
+    def lookup(cls, keys):
+        return dict(cls.objects.filter(key__in=set(keys)).values_list("key", "row"))
+
+    # cache rows (by key), keeping rows already cached under the same key
+    @classmethod
+    def store(cls, rows):
+        cls.objects.bulk_create(
+            [cls(key=key, row=row) for key, row in rows.items()],
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
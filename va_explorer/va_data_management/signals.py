@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from va_explorer.va_data_management.models import CauseOfDeath, VerbalAutopsy
+from va_explorer.va_data_management.utils.data_version import bump_data_generation
+
+
+# Single VA and cause of death writes (edits, reverts, deletions) start a new data
+# generation. Bulk writes (imports, coding runs) do so through
+# DashboardRollup.refresh, as bulk operations don't send these signals.
+@receiver(post_save, sender=VerbalAutopsy)
+@receiver(post_delete, sender=VerbalAutopsy)
+@receiver(post_save, sender=CauseOfDeath)
+@receiver(post_delete, sender=CauseOfDeath)
+def va_data_changed(sender, **kwargs):
+    bump_data_generation()
@@ -6,7 +6,6 @@ from va_explorer.va_data_management.management.commands.import_from_kobo import
     BATCH_SIZE,
 )
 from va_explorer.va_data_management.utils import coding, kobo, odk
-from va_explorer.va_data_management.utils.loading import load_records_from_dataframe
 
 
 @app.on_after_finalize.connect
@@ -24,10 +23,11 @@ def setup_periodic_tasks(sender, **kwargs):
     )
 
 
-# Result of tasks need to be json serializable so return dicts.
+# Result of tasks need to be json serializable so return dicts. A run interrupted
+# by the task time limit is continued where it stopped by the next run.
 @app.task()
 def run_coding_algorithms():
-    results = coding.run_coding_algorithms()
+    results = coding.run_coding_algorithms(resume=True)
     return {
         "num_coded": len(results["causes"]),
         "num_total": len(results["verbal_autopsies"]),
@@ -35,61 +35,52 @@ def run_coding_algorithms():
     }
 
 
+# Like import_from_kobo, only submissions received since the last import are
+# requested unless full_resync=True
 @app.task()
-def import_from_odk():
+def import_from_odk(full_resync=False):
     options = {
         "email": env("ODK_EMAIL"),
         "password": env("ODK_PASSWORD"),
         "project_id": env("ODK_PROJECT_ID"),
         "form_id": env("ODK_FORM_ID"),
     }
-    data = odk.download_responses(
+    counts = odk.import_responses(
         options["email"],
         options["password"],
         project_id=options["project_id"],
         form_id=options["form_id"],
+        incremental=not full_resync,
+        resume=True,
     )
-    results = load_records_from_dataframe(data)
     return {
-        "num_created": len(results["created"]),
-        "num_ignored": len(results["ignored"]),
-        "num_outdated": len(results["outdated"]),
+        "num_created": counts["created"],
+        "num_ignored": counts["ignored"],
+        "num_outdated": counts["outdated"],
     }
 
 
+# Nightly imports only request submissions newer than the last import; pass
+# full_resync=True to download everything again. An import interrupted by the task
+# time limit is resumed from its last checkpoint by the next run.
 @app.task()
-def import_from_kobo():
+def import_from_kobo(full_resync=False):
     options = {
         "token": env("KOBO_API_TOKEN"),
         "asset_id": env("KOBO_ASSET_ID"),
     }
-    data, next_page = kobo.download_responses(
-        options["token"], options["asset_id"], BATCH_SIZE, None
+    counts = kobo.import_responses(
+        options["token"],
+        options["asset_id"],
+        incremental=not full_resync,
+        batch_size=BATCH_SIZE,
+        resume=True,
     )
-    results = load_records_from_dataframe(data)
-
-    num_created = len(results["created"])
-    num_ignored = len(results["ignored"])
-    num_outdated = len(results["outdated"])
-    num_corrected = len(results["corrected"])
-    num_invalid = len(results["removed"])
-
-    # Process all available pages of kobo data since it is provided via pagination
-    while next_page is not None:
-        data, next_page = kobo.download_responses(
-            options["token"], options["asset_id"], BATCH_SIZE, next_page
-        )
-        results = load_records_from_dataframe(data)
-        num_created = num_created + len(results["created"])
-        num_ignored = num_ignored + len(results["ignored"])
-        num_outdated = num_outdated + len(results["outdated"])
-        num_corrected = num_corrected + len(results["corrected"])
-        num_invalid = num_invalid + len(results["removed"])
 
     return {
-        "num_ignored": num_ignored,
-        "num_outdated": num_outdated,
-        "num_created": num_created,
-        "num_corrected": num_corrected,
-        "num_removed": num_invalid,
+        "num_ignored": counts["ignored"],
+        "num_outdated": counts["outdated"],
+        "num_created": counts["created"],
+        "num_corrected": counts["corrected"],
+        "num_removed": counts["removed"],
     }
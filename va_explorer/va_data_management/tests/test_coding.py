@@ -0,0 +1,131 @@
+from io import StringIO
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from va_explorer.tests.factories import VerbalAutopsyFactory
+from va_explorer.va_data_management.models import CauseOfDeath, CodingRun
+from va_explorer.va_data_management.utils.coding import (
+    ALGORITHM_SETTINGS,
+    INTERVA_HOST,
+    PYCROSS_HOST,
+    run_coding_algorithms,
+)
+
+pytestmark = pytest.mark.django_db
+
+TRANSFORM_URL = f"{PYCROSS_HOST}/transform"
+INTERVA5_URL = f"{INTERVA_HOST}/interva5"
+
+
+# Fake pyCrossVA and InterVA5 services: every VA is transformed to one input row,
+# numbered from 1 like pyCrossVA does, and coded as an HIV/AIDS related death
+def fake_transform(request, context):
+    count = len(pd.read_csv(StringIO(request.body.decode("utf-8"))))
+    return ",i022a\n" + "".join(f"{i},1.0\n" for i in range(1, count + 1))
+
+
+def fake_interva5(request, context):
+    return {
+        "results": {
+            "VA5": [
+                {
+                    "ID": [row["ID"]],
+                    "CAUSE1": ["HIV/AIDS related death"],
+                    "LIK1": ["80"],
+                    "INDET": [0],
+                }
+                for row in request.json()["Input"]
+            ]
+        },
+        "errors": [],
+        "warnings": [],
+    }
+
+
+# count VAs with distinct content, so they don't share pyCrossVA output
+def create_vas(count):
+    return [VerbalAutopsyFactory.create(Id10007=f"Name {i}") for i in range(count)]
+
+
+@pytest.fixture()
+def coding_services(requests_mock):
+    requests_mock.post(TRANSFORM_URL, text=fake_transform)
+    requests_mock.post(INTERVA5_URL, json=fake_interva5)
+    return requests_mock
+
+
+def test_run_coding_algorithms(coding_services):
+    vas = create_vas(5)
+
+    results = run_coding_algorithms(batch_size=2, workers=2)
+
+    assert len(results["verbal_autopsies"]) == 5
+    assert len(results["causes"]) == 5
+    assert sorted(
+        CauseOfDeath.objects.values_list("verbalautopsy_id", flat=True)
+    ) == sorted(va.id for va in vas)
+    # each batch goes through both services once
+    urls = [request.url.split("?")[0] for request in coding_services.request_history]
+    assert urls.count(TRANSFORM_URL) == 3
+    assert urls.count(INTERVA5_URL) == 3
+
+
+def test_run_coding_algorithms_resume(coding_services):
+    vas = create_vas(4)
+    # an interrupted run sent the first two VAs, which InterVA5 couldn't code
+    interrupted = CodingRun.start("InterVA5", ALGORITHM_SETTINGS, 2, 2)
+    interrupted.last_va_id = vas[1].id
+    interrupted.save()
+
+    results = run_coding_algorithms(batch_size=1, workers=2, resume=True)
+
+    assert results["run"] == interrupted
+    assert [va.id for va in results["verbal_autopsies"]] == [vas[2].id, vas[3].id]
+    interrupted.refresh_from_db()
+    assert interrupted.status == "completed"
+    assert interrupted.batches.count() == 2
+
+
+def test_coding_run_ledger_and_transform_cache(coding_services):
+    create_vas(4)
+
+    run = run_coding_algorithms(batch_size=2, workers=2)["run"]
+    assert (run.status, run.num_vas, run.num_coded, run.num_cached) == (
+        "completed",
+        4,
+        4,
+        0,
+    )
+    assert run.batches.filter(status="completed").count() == 2
+    assert set(CauseOfDeath.objects.values_list("coding_run", flat=True)) == {run.id}
+
+    # recoding with other settings reuses the cached pyCrossVA output
+    CauseOfDeath.objects.all().delete()
+    sent = len(coding_services.request_history)
+    with mock.patch.dict(ALGORITHM_SETTINGS, {"HIV": "l"}):
+        run = run_coding_algorithms(batch_size=2, workers=2)["run"]
+    assert (run.num_coded, run.num_cached) == (4, 4)
+    assert run.settings["HIV"] == "l"
+    urls = [
+        request.url.split("?")[0] for request in coding_services.request_history[sent:]
+    ]
+    assert TRANSFORM_URL not in urls
+
+
+def test_coding_run_failed_batch(coding_services):
+    vas = create_vas(3)
+    coding_services.post(
+        INTERVA5_URL,
+        [{"status_code": 500, "text": "error"}, {"json": fake_interva5}],
+    )
+
+    results = run_coding_algorithms(batch_size=2, workers=1)
+
+    # the failed batch is recorded and skipped, leaving its VAs uncoded
+    run = results["run"]
+    assert (run.status, run.num_failed_batches, run.num_coded) == ("completed", 1, 1)
+    failed = run.batches.get(status="failed")
+    assert (failed.first_va_id, failed.last_va_id) == (vas[0].id, vas[1].id)
+    assert [va.id for va in results["verbal_autopsies"]] == [vas[2].id]
@@ -1,8 +1,18 @@
+from datetime import date
+
+import pandas as pd
 import pytest
+from django.db.models import Count
 from numpy import nan
 
 from va_explorer.va_data_management.models import VerbalAutopsy
-from va_explorer.va_data_management.utils.date_parsing import get_interview_date
+from va_explorer.va_data_management.utils.date_parsing import (
+    count_by_start_date,
+    get_interview_date,
+    parse_date,
+    parse_dates,
+    parse_dates_as_dates,
+)
 
 pytestmark = pytest.mark.django_db
 
@@ -25,3 +35,78 @@ def test_interview_date_logic():
     assert date_res_1 == "2021-04-19"
     assert date_res_2 == "2020-05-19"
     assert date_res_3 == empty_string
+
+
+# the vectorized parser must keep parse_date's output contract
+def test_parse_dates_matches_parse_date():
+    dates = [
+        "2021-03-21",
+        "03/01/2021",
+        "3/1/21",
+        "25/12/2020",
+        "2021-03-21 10:00:00",
+        "2021-04-19T13:53:07.928Z",
+        "2020-05-19T20:18:12.124+02:00",
+        "March 3 2020",
+        "dk",
+        "DK",
+        "",
+        None,
+        nan,
+        "not a date",
+        "2021-03-21",
+    ]
+
+    parsed = parse_dates(pd.Series(dates, index=range(10, 10 + len(dates))))
+
+    assert parsed.tolist() == [parse_date(date) for date in dates]
+    assert parsed.index.tolist() == list(range(10, 10 + len(dates)))
+
+
+def test_parse_dates_coerce():
+    parsed = parse_dates(["2021-03-21", "dk", "not a date"], errors="coerce")
+
+    assert parsed.tolist() == ["2021-03-21", "dk", None]
+
+
+def test_parse_dates_as_dates():
+    parsed = parse_dates_as_dates(
+        ["2021-03-21", "3/1/21", "dk", None, "not a date", date(2020, 1, 2)]
+    )
+
+    assert parsed.tolist() == [
+        date(2021, 3, 21),
+        date(2021, 3, 1),
+        None,
+        None,
+        None,
+        date(2020, 1, 2),
+    ]
+
+
+# saving a VA keeps its typed date columns in sync with the text ones
+def test_va_parsed_dates():
+    va = VerbalAutopsy.objects.create(Id10023="2021-03-21", Id10012="dk")
+    va.refresh_from_db()
+    assert va.death_date == date(2021, 3, 21)
+    assert va.interview_date is None
+
+    va.Id10012 = "2021-03-25"
+    va.save()
+    va.refresh_from_db()
+    assert va.interview_date == date(2021, 3, 25)
+
+
+# VAs without an interview date are counted by their parseable start dates
+def test_count_by_start_date():
+    VerbalAutopsy.objects.create(Id10012="2021-03-25", Id10011="2021-03-20")
+    VerbalAutopsy.objects.create(Id10012="dk", Id10011="2021-03-20")
+    VerbalAutopsy.objects.create(Id10012="dk", Id10011="2021-03-20")
+    VerbalAutopsy.objects.create(Id10012="dk", Id10011="not a date")
+    VerbalAutopsy.objects.create(Id10012="dk", Id10011="dk")
+
+    counts = count_by_start_date(VerbalAutopsy.objects.all(), {"total": Count("id")})
+    assert counts[["Id10011", "total"]].to_dict(orient="records") == [
+        {"Id10011": "2021-03-20", "total": 2}
+    ]
+    assert counts["date"].tolist() == [pd.Timestamp("2021-03-20")]
@@ -1,3 +1,4 @@
+import json
 import os
 from io import StringIO
 from pathlib import Path
@@ -7,11 +8,16 @@ import pytest
 from django.core.management import call_command
 from requests.exceptions import HTTPError
 
-from va_explorer.va_data_management.models import Location, VerbalAutopsy
+from va_explorer.va_data_management.models import (
+    Location,
+    SyncCursor,
+    VerbalAutopsy,
+)
 from va_explorer.va_data_management.utils.kobo import (
     KOBO_HOST,
     download_responses,
     get_kobo_api_token,
+    prefetch_responses,
 )
 
 pytestmark = pytest.mark.django_db
@@ -72,6 +78,49 @@ class TestDownloadResponse:
         assert results["_uuid"][0] == "TESTf603-a193-4af3-9321-264096bf8602"
         assert next_page is None
 
+    @pytest.mark.parametrize("depth", [0, 1, 3])
+    def test_prefetch_responses(self, requests_mock, depth):
+        first_url = f"{KOBO_HOST}/api/v2/assets/TEST5yolfuacxkjibsj7nw/data/?format=json&limit=5000&start=0&sort=%7B%22_id%22:-1%7D"
+        for page in range(3):
+            data = json.loads(MOCK_TEST_DOWNLOAD_JSON)
+            data["results"] = data["results"][:1]
+            data["results"][0]["_id"] = page
+            data["next"] = f"{KOBO_HOST}/next/{page + 1}" if page < 2 else None
+            url = first_url if page == 0 else f"{KOBO_HOST}/next/{page}"
+            requests_mock.get(url, json=data)
+
+        pages = list(
+            prefetch_responses(
+                "8sw4a4ypxthcyjpjjra7ifr3hbyxsp2ey2bf591g",
+                "TEST5yolfuacxkjibsj7nw",
+                depth=depth,
+            )
+        )
+        assert [forms["_id"][0] for forms, _ in pages] == [0, 1, 2]
+        assert [next_page for _, next_page in pages] == [
+            f"{KOBO_HOST}/next/1",
+            f"{KOBO_HOST}/next/2",
+            None,
+        ]
+
+    def test_prefetch_responses_error(self, requests_mock):
+        data = json.loads(MOCK_TEST_DOWNLOAD_JSON)
+        data["next"] = f"{KOBO_HOST}/next/1"
+        requests_mock.get(
+            f"{KOBO_HOST}/api/v2/assets/TEST5yolfuacxkjibsj7nw/data/?format=json&limit=5000&start=0&sort=%7B%22_id%22:-1%7D",
+            json=data,
+        )
+        requests_mock.get(f"{KOBO_HOST}/next/1", status_code=500)
+
+        pages = prefetch_responses(
+            "8sw4a4ypxthcyjpjjra7ifr3hbyxsp2ey2bf591g", "TEST5yolfuacxkjibsj7nw"
+        )
+        forms, next_page = next(pages)
+        assert forms.shape[0] == 2
+        # the failed download of the second page surfaces in the consumer
+        with pytest.raises(HTTPError):
+            next(pages)
+
 
 class TestImportCommand:
     @mock.patch.dict(os.environ, {}, clear=True)
@@ -155,3 +204,39 @@ class TestImportCommand:
             "(2 ignored, 0 overwritten, 0 removed as invalid)"
         )
         assert VerbalAutopsy.objects.count() == 2
+
+    @mock.patch.dict(os.environ, {"KOBO_HOST": KOBO_HOST}, clear=True)
+    def test_incremental_run(self, requests_mock):
+        requests_mock.get(
+            f"{KOBO_HOST}/api/v2/assets/TEST5yolfuacxkjibsj7nw/data/?format=json&limit=5000&start=0&sort=%7B%22_id%22:-1%7D",
+            text=MOCK_TEST_DOWNLOAD_JSON,
+        )
+        # once a cursor exists, only submissions with a higher _id are requested
+        incremental_mock = requests_mock.get(
+            f"{KOBO_HOST}/api/v2/assets/TEST5yolfuacxkjibsj7nw/data/?format=json&limit=5000&start=0&sort=%7B%22_id%22:1%7D&query=%7B%22_id%22:%7B%22$gt%22:6071%7D%7D",
+            json={"count": 0, "next": None, "previous": None, "results": []},
+        )
+        Location.add_root(name="test hospital", location_type="facility")
+
+        for _ in range(2):
+            output = StringIO()
+            call_command(
+                "import_from_kobo",
+                "--token=8sw4a4ypxthcyjpjjra7ifr3hbyxsp2ey2bf591g",
+                "--asset_id=TEST5yolfuacxkjibsj7nw",
+                "--incremental",
+                stdout=output,
+                stderr=output,
+            )
+
+        cursor = SyncCursor.objects.get(source="kobo")
+        assert cursor.source_id == "TEST5yolfuacxkjibsj7nw"
+        assert cursor.last_id == 6071
+        assert cursor.last_submission_time.year == 2018
+        assert incremental_mock.call_count == 1
+        assert (
+            output.getvalue().strip() == "Loaded 0 verbal autopsies from Kobo "
+            "0 required correction in order to import "
+            "(0 ignored, 0 overwritten, 0 removed as invalid)"
+        )
+        assert VerbalAutopsy.objects.count() == 2
@@ -1,13 +1,22 @@
 from io import StringIO
 from pathlib import Path
+from unittest import mock
 
 import pandas
 import pytest
 from django.core.management import call_command
 
 from va_explorer.tests.factories import VerbalAutopsyFactory
-from va_explorer.va_data_management.models import Location, VerbalAutopsy
-from va_explorer.va_data_management.utils.loading import load_records_from_dataframe
+from va_explorer.va_data_management.models import IngestRun, Location, VerbalAutopsy
+from va_explorer.va_data_management.utils import loading
+from va_explorer.va_data_management.utils.loading import (
+    deduplicate_columns,
+    load_records_from_dataframe,
+)
+from va_explorer.va_data_management.utils.location_assignment import (
+    assign_va_location,
+    get_facility_index,
+)
 
 pytestmark = pytest.mark.django_db
 
@@ -123,6 +132,66 @@ def test_loading_from_dataframe_with_ignored():
     assert result["created"][0].instanceid == data[1]["instanceid"]
 
 
+def test_loading_from_dataframe_with_outdated():
+    Location.add_root(
+        name="Test Location", key="test_location", location_type="facility"
+    )
+
+    record = {
+        "instanceid": "instance1",
+        "Id10017": "name",
+        "Id10018": "1",
+        "Id10012": "2021-03-21",
+        "instancename": "_Dec---name 1---2021-03-21",
+    }
+    load_records_from_dataframe(pandas.DataFrame.from_records([record]))
+
+    # Kobo assigns a new uuid to edited records but keeps the instancename. The
+    # same uuid repeated within a batch is only imported once.
+    edited = {**record, "instanceid": "instance1-edited", "Id10018": "2"}
+    df = pandas.DataFrame.from_records([edited, edited])
+
+    result = load_records_from_dataframe(df)
+
+    assert len(result["created"]) == 1
+    assert len(result["ignored"]) == 1
+    assert len(result["outdated"]) == 1
+    assert result["outdated"][0].instanceid == "instance1"
+    assert VerbalAutopsy.objects.get().instanceid == "instance1-edited"
+    assert VerbalAutopsy.all_objects.get(instanceid="instance1").deleted_at
+
+
+def test_loading_from_dataframe_with_copy_backend():
+    loc = Location.add_root(
+        name="Test Location", key="test_location", location_type="facility"
+    )
+
+    data = [
+        {
+            "instanceid": f"instance{i}",
+            "Id10017": "name",
+            "Id10018": str(i),
+            "Id10012": "2021-03-21",
+            "instancename": f"_Dec---name {i}---2021-03-21",
+            "Id10007": "tab\tand\nnewline \\ backslash" if i == 0 else "",
+            "hospital": "test_location",
+        }
+        for i in range(3)
+    ]
+
+    result = load_records_from_dataframe(
+        pandas.DataFrame.from_records(data), insert_backend="copy"
+    )
+
+    assert len(result["created"]) == 3
+    assert all(va.pk for va in result["created"])
+    va = VerbalAutopsy.objects.get(pk=result["created"][0].pk)
+    assert va.Id10007 == data[0]["Id10007"]
+    assert va.location == loc
+    assert va.deleted_at is None
+    assert VerbalAutopsy.history.filter(history_type="+").count() == 3
+
+
 def test_loading_from_dataframe_with_key():
     # Location gets assigned automatically/randomly if hospital is not a facility
     # If that changes in loading.py it needs to change here too
@@ -167,6 +236,40 @@ def test_loading_from_dataframe_with_key():
     assert result["created"][1].location.name == "Unknown"
 
 
+def test_loading_assigns_facilities_with_shared_names(django_assert_num_queries):
+    root = Location.add_root(name="Zambia", location_type="country")
+    facilities = {}
+    for province, district in [("Lusaka", "Kafue"), ("Lusaka", "Chongwe")]:
+        province_node = Location.objects.filter(name=f"{province} Province").first()
+        if not province_node:
+            province_node = root.add_child(
+                name=f"{province} Province", location_type="province"
+            )
+        district_node = province_node.add_child(
+            name=f"{district} District", location_type="district"
+        )
+        facilities[district] = district_node.add_child(
+            name="Other Facility",
+            key=f"other_{district.lower()}",
+            location_type="facility",
+            path_string=f"/Zambia/{province} Province/{district} District/"
+            "Other Facility",
+        )
+
+    vas = [
+        VerbalAutopsy(hospital="other_kafue", province="Lusaka", area="Chongwe"),
+        VerbalAutopsy(hospital="other_kafue", province="Lusaka", area="Kafue"),
+    ]
+    # the facility index is loaded once, then no queries are needed per VA
+    get_facility_index()
+    with django_assert_num_queries(0):
+        for va in vas:
+            assign_va_location(va)
+
+    assert vas[0].location == facilities["Chongwe"]
+    assert vas[1].location == facilities["Kafue"]
+
+
 def test_load_va_csv_command():
     # Location gets assigned automatically/randomly if hospital is not a facility
     # If that changes in loading.py it needs to change here too
@@ -196,6 +299,173 @@ def test_load_va_csv_command():
     assert VerbalAutopsy.objects.get(instanceid="instance3").Id10007 == "name3"
 
 
+def test_load_va_csv_command_chunked():
+    Location.add_root(
+        name="Test Location", key="test_location", location_type="facility"
+    )
+
+    test_data = Path(__file__).parent / "test-input-data.csv"
+
+    output = StringIO()
+    call_command(
+        "load_va_csv",
+        str(test_data.absolute()),
+        "--chunk_size=2",
+        stdout=output,
+        stderr=output,
+    )
+
+    lines = output.getvalue().strip().splitlines()
+    # one progress line per chunk, then the summary
+    assert len(lines) == 3
+    assert lines[0].startswith("Chunk 1: 2 rows")
+    assert lines[1].startswith("Chunk 2: 1 rows")
+    assert (
+        lines[-1] == "Loaded 3 verbal autopsies from CSV "
+        "(0 ignored, 0 removed as outdated)"
+    )
+    assert VerbalAutopsy.objects.count() == 3
+    assert VerbalAutopsy.objects.get(instanceid="instance3").Id10007 == "name3"
+
+
+def test_load_va_csv_command_workers(tmp_path):
+    Location.add_root(
+        name="Test Location", key="test_location", location_type="facility"
+    )
+
+    # instance1 appears again in a later chunk and should be ignored as usual
+    test_data = Path(__file__).parent / "test-input-data.csv"
+    lines = test_data.read_text().strip().splitlines()
+    csv_file = tmp_path / "input.csv"
+    csv_file.write_text("\n".join([*lines, lines[1]]) + "\n")
+
+    output = StringIO()
+    call_command(
+        "load_va_csv",
+        str(csv_file),
+        "--chunk_size=1",
+        "--workers=2",
+        stdout=output,
+        stderr=output,
+    )
+
+    lines = output.getvalue().strip().splitlines()
+    assert [line.split(":")[0] for line in lines[:-1]] == [
+        "Chunk 1",
+        "Chunk 2",
+        "Chunk 3",
+        "Chunk 4",
+    ]
+    assert (
+        lines[-1] == "Loaded 3 verbal autopsies from CSV "
+        "(1 ignored, 0 removed as outdated)"
+    )
+    assert VerbalAutopsy.objects.count() == 3
+    assert VerbalAutopsy.objects.get(instanceid="instance3").Id10007 == "name3"
+
+
+def test_load_va_csv_command_resume():
+    Location.add_root(
+        name="Test Location", key="test_location", location_type="facility"
+    )
+    test_data = Path(__file__).parent / "test-input-data.csv"
+
+    # fail while writing the second chunk
+    write_prepared_records = loading.write_prepared_records
+    calls = []
+
+    def fail_second_chunk(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        return write_prepared_records(*args, **kwargs)
+
+    with mock.patch.object(
+        loading, "write_prepared_records", fail_second_chunk
+    ), pytest.raises(RuntimeError):
+        call_command(
+            "load_va_csv",
+            str(test_data.absolute()),
+            "--chunk_size=2",
+            stdout=StringIO(),
+        )
+
+    # the first chunk is committed, the second rolled back
+    run = IngestRun.objects.get(source="csv")
+    assert run.status == "failed"
+    assert run.error == "connection lost"
+    assert run.rows_committed == 2
+    assert VerbalAutopsy.objects.count() == 2
+
+    output = StringIO()
+    call_command(
+        "load_va_csv",
+        str(test_data.absolute()),
+        "--chunk_size=2",
+        "--resume",
+        stdout=output,
+        stderr=output,
+    )
+
+    lines = output.getvalue().strip().splitlines()
+    assert lines[0] == "Resuming after row 2"
+    assert (
+        lines[-1] == "Loaded 1 verbal autopsies from CSV "
+        "(0 ignored, 0 removed as outdated)"
+    )
+    assert VerbalAutopsy.objects.count() == 3
+    run.refresh_from_db()
+    assert run.status == "completed"
+    assert run.rows_committed == 3
+    assert run.num_created == 3
+
+
+def test_deduplicate_columns():
+    data = pandas.DataFrame.from_records(
+        [
+            {"Id10010": "a", "Id10010_other": "b", "Id100101": "c"},
+            {"Id10010": "other", "Id10010_other": "b", "Id100101": "c"},
+            {"Id10010": None, "Id10010_other": None, "Id100101": "c"},
+        ]
+    )
+    data["filtered_Id10010_other"] = ["d", "d", "d"]
+    data["Id10058_other"] = ["e", "e", "e"]
+
+    result = deduplicate_columns(data)
+
+    # _other columns are dropped, even without an original to collapse into
+    assert list(result.columns) == ["Id10010", "Id100101"]
+    assert result["Id10010"].tolist() == ["a", "b", "d"]
+    # columns that merely share the original's prefix are left alone
+    assert result["Id100101"].tolist() == ["c", "c", "c"]
+
+
+def test_loading_age_groups():
+    data = pandas.DataFrame.from_records(
+        [
+            {"isNeonatal": "1", "isChild1": "1.0", "isAdult": ""},
+            {"isNeonatal": "0", "isChild1": "1.0", "isAdult": "1"},
+            {"isNeonatal": "", "isChild1": "", "isAdult": "1.0"},
+            {"isNeonatal": "", "isChild1": "0", "isAdult": "0"},
+        ]
+    )
+
+    assert loading.get_age_groups(data).tolist() == [
+        "neonate",
+        "child",
+        "adult",
+        None,
+    ]
+    # and a VA saved with the same fields gets the same age group
+    for row, age_group in zip(
+        data.to_dict(orient="records"),
+        ["neonate", "child", "adult", None],
+        strict=True,
+    ):
+        va = VerbalAutopsyFactory.create(**row)
+        assert va.derived_age_group == age_group
+
+
 def test_loading_duplicate_vas(settings):
     settings.QUESTIONS_TO_AUTODETECT_DUPLICATES = (
         "Id10017, Id10018, Id10012, Id10019, Id10020, Id10021, Id10022, Id10023"
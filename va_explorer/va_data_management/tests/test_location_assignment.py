@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from va_explorer.va_data_management.models import Location, VerbalAutopsy
+from va_explorer.va_data_management.utils.location_assignment import (
+    FuzzyMatcher,
+    assign_va_location,
+    fuzzy_match,
+)
+
+FACILITIES = [
+    "Kafue District Hospital",
+    "Chongwe District Hospital",
+    "University Teaching Hospital",
+    "Chilenje Level 1 Hospital",
+]
+
+
+def test_fuzzy_matcher_match():
+    matcher = FuzzyMatcher(FACILITIES)
+
+    assert matcher.match("kafue distrct hospital") == "Kafue District Hospital"
+    assert matcher.match("University Teaching Hosp") == "University Teaching Hospital"
+    assert matcher.match("Mansa General") is None
+    assert matcher.match(None) is None
+
+    match = matcher.match("chongwe district hospital", return_str=False)
+    assert match == {
+        "name": "Chongwe District Hospital",
+        "key": "chongwe district hospital",
+        "score": 100,
+    }
+
+
+def test_fuzzy_matcher_agrees_with_fuzzy_match():
+    matcher = FuzzyMatcher(FACILITIES)
+    for search in ["chilenje level one hospital", "kafue hospital", "teaching hosp"]:
+        assert matcher.match(search, threshold=60) == fuzzy_match(
+            search, None, options=FACILITIES, threshold=60
+        )
+
+
+def test_fuzzy_matcher_match_all():
+    matcher = FuzzyMatcher(FACILITIES)
+    searches = pd.Series(
+        ["chongwe dist hospital", None, "nowhere", "chongwe dist hospital"],
+        index=[10, 11, 12, 13],
+    )
+
+    matches = matcher.match_all(searches)
+
+    assert list(matches.index) == [10, 11, 12, 13]
+    assert matches[10] == matches[13] == "Chongwe District Hospital"
+    assert pd.isna(matches[11])
+    assert pd.isna(matches[12])
+
+
+# hospitals that aren't known keys are rescued by a conservative fuzzy match
+@pytest.mark.django_db
+def test_assign_va_location_fuzzy_hospital():
+    country = Location.add_root(name="Zambia", location_type="country")
+    province = country.add_child(name="Lusaka Province", location_type="province")
+    district = province.add_child(name="Kafue District", location_type="district")
+    facility = district.add_child(
+        name="Kafue District Hospital",
+        key="kafue_district_hospital",
+        location_type="facility",
+    )
+
+    va = assign_va_location(VerbalAutopsy(hospital="kafue_distrct_hospital"))
+    assert va.location == facility
+    assert va.location_district_id == district.id
+
+    va = assign_va_location(VerbalAutopsy(hospital="Kafue Distrct Hospital"))
+    assert va.location == facility
+
+    va = assign_va_location(VerbalAutopsy(hospital="Mansa General"))
+    assert va.location.name == "Unknown"
@@ -10,6 +10,7 @@ from va_explorer.va_data_management.models import (
     CauseCodingIssue,
     CauseOfDeath,
     DhisStatus,
+    Location,
     VerbalAutopsy,
 )
 
@@ -311,3 +312,23 @@ def test_related_model_managers():
     assert CauseOfDeath.objects.all().count() == 0
     assert CauseCodingIssue.objects.all().count() == 0
     assert DhisStatus.objects.all().count() == 0
+
+
+def test_location_ancestors():
+    country = Location.add_root(name="Zambia", location_type="country")
+    province = country.add_child(name="Lusaka Province", location_type="province")
+    district = province.add_child(name="Kafue District", location_type="district")
+    facility = district.add_child(name="Kafue Hospital", location_type="facility")
+
+    # saving a VA records its location's province and district
+    va = VerbalAutopsyFactory.create(location=facility)
+    va.refresh_from_db()
+    assert va.location_province == province
+    assert va.location_district == district
+
+    # VAs updated in bulk are caught up by update_location_ancestors
+    VerbalAutopsy.objects.filter(pk=va.pk).update(location=province)
+    VerbalAutopsy.update_location_ancestors()
+    va.refresh_from_db()
+    assert va.location_province == province
+    assert va.location_district is None
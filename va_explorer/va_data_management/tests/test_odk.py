@@ -1,3 +1,4 @@
+import json
 from io import StringIO
 from pathlib import Path
 
@@ -5,7 +6,12 @@ import pytest
 from django.core.management import call_command
 from requests.exceptions import HTTPError
 
-from va_explorer.va_data_management.models import Location, VerbalAutopsy
+from va_explorer.va_data_management.models import (
+    IngestRun,
+    Location,
+    SyncCursor,
+    VerbalAutopsy,
+)
 from va_explorer.va_data_management.utils.odk import (
     ODK_HOST,
     download_responses,
@@ -399,3 +405,73 @@ class TestImportCommand:
             == "Loaded 0 verbal autopsies from ODK (1 ignored, 0 removed as outdated)"
         )
         assert VerbalAutopsy.objects.count() == 1
+
+    def test_incremental_run(self, requests_mock):
+        requests_mock.post(f"{ODK_HOST}/v1/sessions", json=MOCK_GET_ODK_LOGIN_TOKEN)
+        requests_mock.get(f"{ODK_HOST}/v1/projects/34/forms", json=MOCK_GET_ODK_FORM)
+        url = f"{ODK_HOST}/v1/projects/34/forms/va_who_v1_5_2.svc/Submissions"
+
+        # Two pages linked with @odata.nextLink, the second holding a newer copy
+        first_page = json.loads(MOCK_TEST_DOWNLOAD_JSON)
+        second_page = json.loads(MOCK_TEST_DOWNLOAD_JSON)
+        second_page["value"][0]["meta"]["instanceID"] = "test-instance-2"
+        second_page["value"][0]["meta"]["instanceName"] = "_Dec---test_data_2"
+        second_page["value"][0]["__system"][
+            "submissionDate"
+        ] = "2021-03-23T10:00:00.000Z"
+        first_page["@odata.nextLink"] = f"{url}?$skiptoken=page2"
+
+        def submissions(request, context):
+            if " gt " in request.qs.get("$filter", [""])[0]:
+                return {"value": []}
+            if "$skiptoken" in request.qs:
+                return second_page
+            return first_page
+
+        submissions_mock = requests_mock.get(url, json=submissions)
+        Location.add_root(name="test location", location_type="facility")
+
+        output = StringIO()
+        call_command(
+            "import_from_odk",
+            "--email=test",
+            "--password=test",
+            "--project-id=34",
+            "--form-id=va_who_v1_5_2",
+            "--incremental",
+            stdout=output,
+            stderr=output,
+        )
+
+        assert (
+            output.getvalue().strip().splitlines()[-1]
+            == "Loaded 2 verbal autopsies from ODK (0 ignored, 0 removed as outdated)"
+        )
+        assert VerbalAutopsy.objects.count() == 2
+        assert submissions_mock.request_history[0].qs["$top"] == ["1000"]
+        cursor = SyncCursor.objects.get(source="odk", source_id="34/va_who_v1_5_2")
+        assert cursor.last_submission_time.isoformat() == "2021-03-23T10:00:00+00:00"
+
+        # The next run only asks for submissions newer than the cursor
+        output = StringIO()
+        call_command(
+            "import_from_odk",
+            "--email=test",
+            "--password=test",
+            "--project-id=34",
+            "--form-id=va_who_v1_5_2",
+            "--incremental",
+            stdout=output,
+            stderr=output,
+        )
+
+        assert (
+            output.getvalue().strip()
+            == "Loaded 0 verbal autopsies from ODK (0 ignored, 0 removed as outdated)"
+        )
+        # ...received before the run started, so a resumed run sees the same pages
+        assert submissions_mock.last_request.qs["$filter"][0].startswith(
+            "__system/submissiondate gt 2021-03-23t10:00:00.000z and "
+            "__system/submissiondate le "
+        )
+        assert IngestRun.objects.filter(source="odk", status="completed").count() == 2
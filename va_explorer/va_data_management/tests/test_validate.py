@@ -0,0 +1,82 @@
+import pytest
+
+from va_explorer.tests.factories import (
+    LocationFacilityFactory,
+    VerbalAutopsyFactory,
+)
+from va_explorer.va_data_management.models import CauseCodingIssue, VerbalAutopsy
+from va_explorer.va_data_management.utils.validate import (
+    VALIDATION_RULES,
+    validate_vas_for_dashboard,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+# the first words of each data issue of va
+def issue_texts(va):
+    return sorted(
+        " ".join(issue.text.split()[:3])
+        for issue in CauseCodingIssue.objects.filter(verbalautopsy=va)
+    )
+
+
+def test_validate_vas_for_dashboard(
+    django_assert_max_num_queries, django_assert_num_queries
+):
+    active = LocationFacilityFactory.create(path="0001", is_active=True)
+    inactive = LocationFacilityFactory.create(path="0002", is_active=False)
+    valid_va = VerbalAutopsyFactory.create(
+        location=active, Id10023="2021-01-01", ageInYears2="30", isAdult="1"
+    )
+    invalid_va = VerbalAutopsyFactory.create(
+        location=inactive, Id10023="not a date", ageInYears2="dk", hospital="Hospital"
+    )
+    # issues from an earlier validation are replaced
+    CauseCodingIssue.objects.create(
+        verbalautopsy=valid_va,
+        text="Error: field Id10023, stale issue",
+        severity="error",
+        algorithm="",
+        settings="",
+    )
+
+    # a query for locations, the delete, the insert and the fingerprint update,
+    # whatever the VA count
+    with django_assert_max_num_queries(5):
+        validate_vas_for_dashboard([valid_va, invalid_va])
+
+    assert issue_texts(valid_va) == []
+    assert issue_texts(invalid_va) == [
+        "Error: field Id10023,",
+        "Warning: VA location",
+        "Warning: field ageInYears2,",
+        "Warning: field age_group,",
+    ]
+
+    # unchanged VAs aren't revalidated, so only their locations are looked up
+    with django_assert_num_queries(1):
+        assert validate_vas_for_dashboard([valid_va, invalid_va]) == []
+
+    # only the rule reading a changed field is re-run, and only for that VA
+    kept_issue_ids = set(CauseCodingIssue.objects.values_list("id", flat=True))
+    valid_va.Id10023 = "not a date"
+    issues = validate_vas_for_dashboard([valid_va, invalid_va])
+    assert [issue.rule for issue in issues] == ["unparseable_death_date"]
+    assert issue_texts(valid_va) == ["Error: field Id10023,"]
+    assert kept_issue_ids < set(CauseCodingIssue.objects.values_list("id", flat=True))
+
+
+# every rule reads fields a VerbalAutopsy loaded from the database really has
+def test_validate_saved_va():
+    location = LocationFacilityFactory.create(is_active=True)
+    saved_va = VerbalAutopsyFactory.create(location=location)
+    va = VerbalAutopsy.objects.get(pk=saved_va.pk)
+
+    validate_vas_for_dashboard([va])
+
+    assert set(va.validation_fingerprints) == {rule.name for rule in VALIDATION_RULES}
+    assert issue_texts(va) == [
+        "Warning: field ageInYears2,",
+        "Warning: field age_group,",
+    ]
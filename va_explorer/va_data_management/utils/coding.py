@@ -1,18 +1,26 @@
 import csv
+import hashlib
 import json
 import os
 import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
-from math import ceil
 
 import pandas as pd
 import requests
+from django.db import transaction
 from django.forms import model_to_dict
+from requests.adapters import HTTPAdapter
 from simple_history.utils import bulk_create_with_history
 
+from va_explorer.va_analytics.models import DashboardRollup
 from va_explorer.va_data_management.models import (
     CauseCodingIssue,
     CauseOfDeath,
+    CodingRun,
+    TransformCache,
     VerbalAutopsy,
 )
 
@@ -23,6 +31,23 @@ from va_explorer.va_data_management.models import (
 PYCROSS_HOST = os.environ.get("PYCROSS_HOST", "http://127.0.0.1:5001")
 INTERVA_HOST = os.environ.get("INTERVA_HOST", "http://127.0.0.1:5002")
 
+# pyCrossVA input and output formats. Along with PYCROSS_VERSION, which should be
+# changed when the pyCrossVA service is upgraded, they version the TransformCache
+PYCROSS_INPUT = "2016WHOv151"
+PYCROSS_OUTPUT = "InterVA5"
+PYCROSS_VERSION = os.environ.get("PYCROSS_VERSION", "1")
+
+# VAs sent to pyCrossVA and InterVA5 per request, and how many batches are in
+# flight at once. While one batch is with InterVA5 the next is with pyCrossVA.
+CODING_BATCH_SIZE = int(os.environ.get("CODING_BATCH_SIZE", 500))
+CODING_WORKERS = int(os.environ.get("CODING_WORKERS", 4))
+
+# VA fields sent to pyCrossVA: the editable fields, as model_to_dict includes. Only
+# these are loaded when selecting VAs to code
+CODING_FIELDS = [
+    field.name for field in VerbalAutopsy._meta.concrete_fields if field.editable
+]
+
 # Param Setting value sets (used for validation)
 # TODO: add other algorithms' settings as we add support for them
 ALGORITHM_PARAM_OPTIONS = {
@@ -75,37 +100,121 @@ def validate_algorithm_settings():
     return True
 
 
-def _run_pycross_and_interva5(verbal_autopsies):
+# Session shared by the coding threads, so connections to pyCrossVA and InterVA5
+# are reused across batches
+def coding_session(workers=CODING_WORKERS):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max(workers, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _run_pycross_and_interva5(verbal_autopsies, session=requests):
+    va_data = [model_to_dict(va, fields=CODING_FIELDS) for va in verbal_autopsies]
+    rows = _run_pycross(va_data, session)
+    return _run_interva5(rows, session)
+
+
+# Transform VA records (model_to_dict of VerbalAutopsy) to InterVA5 input rows using
+# the pyCrossVA web service. Rows are numbered from 1 in their ID column.
+def _run_pycross(va_data, session=requests):
     # Get into CSV format, also prefixing keys with - as expected by
     # pyCrossVA (e.g. Id10424 becomes -Id10424)
-    va_data = [model_to_dict(va) for va in verbal_autopsies]
     va_data = [{f"-{k}": v for k, v in d.items()} for d in va_data]
     va_data_csv = pd.DataFrame.from_records(va_data).to_csv()
 
     # Transform to algorithm format using the pyCrossVA web service
-    transform_url = f"{PYCROSS_HOST}/transform?input=2016WHOv151&output=InterVA5"
-    transform_response = requests.post(transform_url, data=va_data_csv.encode("utf-8"))
+    transform_url = (
+        f"{PYCROSS_HOST}/transform?input={PYCROSS_INPUT}&output={PYCROSS_OUTPUT}"
+    )
+    transform_response = session.post(transform_url, data=va_data_csv.encode("utf-8"))
 
     # Convert result to JSON
     transform_response_reader = csv.DictReader(StringIO(transform_response.text))
 
     # Replace blank key with ID and append to list for later jsonification
-    rows = [
+    return [
         {"ID" if key == "" else key: value for key, value in row.items()}
         for row in transform_response_reader
     ]
 
+
+def _run_interva5(rows, session=requests):
     result_json = json.dumps({"Input": rows, **ALGORITHM_SETTINGS})
 
     # This is to get to the data into required algorithm format for interva5
     result_json = result_json.replace('"0.0"', '"."').replace('"1.0"', '"y"')
 
     algorithm_url = f"{INTERVA_HOST}/interva5"
-    algorithm_response = requests.post(algorithm_url, data=result_json)
+    algorithm_response = session.post(algorithm_url, data=result_json)
     return json.loads(algorithm_response.text)
 
 
-def run_coding_algorithms():
+# Key of a VA's pyCrossVA output in the TransformCache: a hash of the transform
+# version and the VA record sent to pyCrossVA, other than its id
+def transform_cache_key(va_record):
+    content = json.dumps(
+        [
+            PYCROSS_INPUT,
+            PYCROSS_OUTPUT,
+            PYCROSS_VERSION,
+            {key: value for key, value in va_record.items() if key != "id"},
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# Code a batch of VA records on a worker thread. Only records without a cached
+# pyCrossVA row (by cache key, in cached) are sent to pyCrossVA; InterVA5 gets the
+# rows of all of them, numbered from 1 in batch order as pyCrossVA numbers them.
+# Returns the InterVA5 response, the new pyCrossVA rows by cache key, the number of
+# cached rows used and the seconds spent on each stage. An error stops the batch
+# and is returned, with whatever the batch got done before it.
+def _code_batch(va_data, keys, cached, session):
+    result = {
+        "response": None,
+        "transformed": {},
+        "counts": {"cached": 0},
+        "seconds": {"transform": 0.0, "algorithm": 0.0},
+        "error": None,
+    }
+    try:
+        started = time.monotonic()
+        uncached = [i for i, key in enumerate(keys) if key not in cached]
+        if uncached:
+            rows = _run_pycross([va_data[i] for i in uncached], session)
+            for i, row in zip(uncached, rows, strict=True):
+                row.pop("ID", None)
+                result["transformed"][keys[i]] = row
+        result["counts"]["cached"] = len(keys) - len(uncached)
+        result["seconds"]["transform"] = time.monotonic() - started
+
+        started = time.monotonic()
+        rows = [
+            {
+                "ID": str(number),
+                **(cached[key] if key in cached else result["transformed"][key]),
+            }
+            for number, key in enumerate(keys, start=1)
+        ]
+        result["response"] = _run_interva5(rows, session)
+        result["seconds"]["algorithm"] = time.monotonic() - started
+    except Exception as err:
+        result["error"] = err
+    return result
+
+
+# Code all verbal autopsies without a cause, recording the run and each of its
+# batches in a CodingRun. VAs are coded in order of id, and the id of the last VA
+# sent is recorded after every batch. With resume, the latest unfinished run with
+# the same settings continues after the VAs it already sent. A batch that fails is
+# recorded and skipped; its VAs are left uncoded for the next run.
+def run_coding_algorithms(
+    batch_size=CODING_BATCH_SIZE, workers=CODING_WORKERS, resume=False
+):
     # Load all verbal autopsies that don't have a cause coding
     # TODO: This should eventually check to see that there's a cause coding for
     # every supported algorithm
@@ -116,33 +225,130 @@ def run_coding_algorithms():
     issues_list = []
     verbal_autopsies_without_causes_list = []
 
-    # Determine number of iterations necessary for large lists of verbal autopsies
-    count = VerbalAutopsy.objects.filter(causes__isnull=True).count()
-    batch_size = 500
-    batches = ceil(count / batch_size)
-
-    for i in range(batches):
-        batch_start = i * batch_size
-        batch_end = (i + 1) * batch_size
-        verbal_autopsies_without_causes = list(
-            VerbalAutopsy.objects.filter(causes__isnull=True)[batch_start:batch_end]
+    # the run records a copy of the settings, which won't follow later changes
+    run = CodingRun.start(
+        "InterVA5", dict(ALGORITHM_SETTINGS), batch_size, workers, resume
+    )
+    batches = _uncoded_batches(batch_size, run.last_va_id or 0)
+    try:
+        for verbal_autopsies_without_causes, result in code_batches(batches, workers):
+            # transformed rows are kept even if InterVA5 failed on the batch
+            TransformCache.store(result["transformed"])
+            started = time.monotonic()
+            try:
+                if result["error"] is not None:
+                    raise result["error"]
+                with transaction.atomic():
+                    causes, issues = save_interva5_results(
+                        verbal_autopsies_without_causes, result["response"], run
+                    )
+                    result["seconds"]["save"] = time.monotonic() - started
+                    run.record_batch(
+                        verbal_autopsies_without_causes,
+                        {
+                            **result["counts"],
+                            "coded": len(causes),
+                            "issues": len(issues),
+                        },
+                        result["seconds"],
+                    )
+            except Exception as err:
+                batch = verbal_autopsies_without_causes
+                print(f"Coding VAs {batch[0].id} to {batch[-1].id} failed: {err}")
+                run.record_batch(
+                    verbal_autopsies_without_causes,
+                    result["counts"],
+                    result["seconds"],
+                    error=err,
+                )
+                continue
+
+            causes_list += causes
+            issues_list += issues
+            verbal_autopsies_without_causes_list += verbal_autopsies_without_causes
+    except Exception as err:
+        run.fail(err)
+        raise
+    finally:
+        # causes are part of the dashboard rollup, so refresh the coded VAs'
+        # facilities (including those of batches saved before a failure)
+        DashboardRollup.refresh(
+            {va.location_id for va in verbal_autopsies_without_causes_list}
         )
-        causes, issues = run_interva5(verbal_autopsies_without_causes)
-
-        causes_list += causes
-        issues_list += issues
-        verbal_autopsies_without_causes_list += verbal_autopsies_without_causes
+    run.complete()
 
     return {
+        "run": run,
         "verbal_autopsies": verbal_autopsies_without_causes_list,
         "causes": causes_list,
         "issues": issues_list,
     }
 
 
+# Batches of batch_size verbal autopsies without a cause coding with ids above
+# after_id, in order of id. Each batch is selected by id rather than offset, so
+# batches coded in the meantime don't shift later ones and every query is as
+# cheap as the first.
+def _uncoded_batches(batch_size, after_id=0):
+    uncoded = (
+        VerbalAutopsy.objects.filter(causes__isnull=True)
+        .only(*CODING_FIELDS)
+        .order_by("id")
+    )
+    while True:
+        batch = list(uncoded.filter(id__gt=after_id)[:batch_size])
+        if not batch:
+            return
+        after_id = batch[-1].id
+        yield batch
+
+
+# Send batches of VAs through pyCrossVA and InterVA5 on a pool of threads, yielding
+# (batch, result of _code_batch) pairs in the order the batches were given. Up to
+# workers batches are in flight at once, so one batch's InterVA5 request overlaps
+# the next batch's pyCrossVA request. The database is only used on the calling
+# thread, which reads the batches, looks up their cached pyCrossVA rows and saves
+# the results.
+def code_batches(batches, workers=CODING_WORKERS):
+    workers = max(workers, 1)
+    session = coding_session(workers)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coding")
+    in_flight = deque()
+    try:
+        for batch in batches:
+            if not batch:
+                continue
+            if len(in_flight) >= workers:
+                done_batch, future = in_flight.popleft()
+                yield done_batch, future.result()
+            va_data = [model_to_dict(va, fields=CODING_FIELDS) for va in batch]
+            keys = [transform_cache_key(va_record) for va_record in va_data]
+            cached = TransformCache.lookup(keys)
+            in_flight.append(
+                (batch, executor.submit(_code_batch, va_data, keys, cached, session))
+            )
+        while in_flight:
+            done_batch, future = in_flight.popleft()
+            yield done_batch, future.result()
+    finally:
+        # don't start batches nobody will save if the caller stopped
+        executor.shutdown(wait=True, cancel_futures=True)
+        session.close()
+
+
 def run_interva5(verbal_autopsies_without_causes):
     interva_response_data = _run_pycross_and_interva5(verbal_autopsies_without_causes)
+    return save_interva5_results(verbal_autopsies_without_causes, interva_response_data)
+
 
+# Save the causes and coding issues in an InterVA5 response for the VAs sent with
+# it, recording coding_run as the run that assigned the causes
+def save_interva5_results(
+    verbal_autopsies_without_causes, interva_response_data, coding_run=None
+):
+    # the settings stored with each cause and issue, copied so they don't change
+    # along with ALGORITHM_SETTINGS
+    settings = dict(ALGORITHM_SETTINGS)
     # The ID that comes back is the index in the data that was passed in.
     # Use that to look up the matching VA in the verbal_autopsies_without_causes list.
     causes = []
@@ -165,7 +371,8 @@ def run_interva5(verbal_autopsies_without_causes):
                     verbalautopsy_id=va_id,
                     cause=cause,
                     algorithm="InterVA5",
-                    settings=ALGORITHM_SETTINGS,
+                    settings=settings,
+                    coding_run=coding_run,
                 )
             )
 
@@ -193,7 +400,7 @@ def run_interva5(verbal_autopsies_without_causes):
                     text=issue_text,
                     severity=severity,
                     algorithm="InterVA5",
-                    settings=ALGORITHM_SETTINGS,
+                    settings=settings,
                 )
             )
 
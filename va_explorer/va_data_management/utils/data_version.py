@@ -0,0 +1,48 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction
+
+# cache key of the VA data generation, which changes whenever VAs or their causes
+# of death change. Caches of values derived from VA data include the generation
+# in their keys, so bumping it invalidates all of them at once in every process.
+DATA_GENERATION_KEY = "va_data_generation"
+
+
+# Return the current VA data generation. If the counter is missing (e.g. evicted),
+# it restarts from the current time so keys of an earlier generation are not reused
+def get_data_generation():
+    generation = cache.get(DATA_GENERATION_KEY)
+    if generation is None:
+        cache.add(DATA_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(DATA_GENERATION_KEY, 0)
+    return generation
+
+
+# Start a new VA data generation; call after VAs or their causes change. The
+# counter moves once the current transaction commits, so no request can cache data
+# read before the commit under the new generation.
+def bump_data_generation():
+    transaction.on_commit(_increment_data_generation)
+
+
+def _increment_data_generation():
+    try:
+        cache.incr(DATA_GENERATION_KEY)
+    except ValueError:
+        # counter is missing, start a new one
+        get_data_generation()
+
+
+# Cache key of a value derived from the VAs in queryset, valid for the current VA
+# data generation. None if the query can't match any VAs, since there is then no SQL
+# to key on.
+def queryset_cache_key(prefix, queryset):
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return None
+    digest = hashlib.md5(sql.encode()).hexdigest()
+    return f"{prefix}:{get_data_generation()}:{digest}"
@@ -1,5 +1,6 @@
 import re
 from datetime import datetime
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
@@ -8,6 +9,16 @@ from config.settings.base import DATE_FORMATS
 
 DATE_FORMATS = DATE_FORMATS.keys()
 NULL_STRINGS = ["nan", "dk"]
+# regex equivalents of the strptime directives used in DATE_FORMATS
+FORMAT_DIRECTIVE_PATTERNS = {
+    "%Y": r"\d{4}",
+    "%y": r"\d{2}",
+    "%m": r"\d{1,2}",
+    "%d": r"\d{1,2}",
+    "%H": r"\d{1,2}",
+    "%M": r"\d{1,2}",
+    "%S": r"\d{1,2}",
+}
 
 
 # helper method to parse dates in a variety of formats
@@ -50,6 +61,127 @@ def parse_date(date_str, formats=DATE_FORMATS, strict=False, return_format="%Y-%
     return "dk"
 
 
+# vectorized counterpart of parse_date for a whole column of date strings. Keeps the
+# same output contract ("dk" for empty/unknown values, return_format strings for
+# parsed dates, original strings passed through when unparseable) but tries each
+# format once per column instead of once per row. Date columns repeat a lot, so the
+# work is done once per distinct value. Only values left unparsed by the vectorized
+# passes fall back to the row-wise parse_date. With errors="coerce", unparseable
+# values become None instead of being passed through (what parse_date(strict=True)
+# would raise on).
+def parse_dates(dates, formats=DATE_FORMATS, return_format="%Y-%m-%d", errors="ignore"):
+    dates = pd.Series(dates, dtype=object)
+    codes, uniques = pd.factorize(dates)
+    parsed = _parse_distinct_dates(
+        pd.Series(uniques, dtype=object), tuple(formats), return_format, errors
+    )
+    # factorize marks nulls with -1, which map to the "dk" sentinel
+    parsed = np.append(parsed.to_numpy(dtype=object), "dk")
+    return pd.Series(parsed[codes], index=dates.index, dtype=object)
+
+
+def _parse_distinct_dates(dates, formats, return_format, errors):
+    result = pd.Series("dk", index=dates.index, dtype=object)
+
+    is_str = dates.map(lambda d: isinstance(d, str))
+    str_dates = dates[is_str]
+    str_dates = str_dates[~str_dates.str.lower().isin(["", *NULL_STRINGS])]
+    # remove any excessive decimals at end of string
+    remaining = str_dates.str.split(".", n=1).str[0]
+
+    # no configured format contains a time separator T, so timestamps like
+    # 2021-04-19T13:53:07 can be resolved in one regex pass up front
+    is_timestamp = remaining.str.contains(r"\dT\d", regex=True)
+    result[remaining.index[is_timestamp]] = (
+        remaining[is_timestamp].str.split(r"T\d", n=1, regex=True).str[0]
+    )
+    remaining = remaining[~is_timestamp]
+
+    # try each format on the values that are still unparsed. pandas is more lenient
+    # than strptime for ISO-like formats, so only values shaped like the format are
+    # handed to it
+    for fmt in formats:
+        if remaining.empty:
+            break
+        candidates = remaining[remaining.str.fullmatch(_format_regex(fmt))]
+        if candidates.empty:
+            continue
+        try:
+            parsed = pd.to_datetime(candidates, format=fmt, errors="coerce")
+        except (ValueError, TypeError):
+            continue
+        parsed = parsed[parsed.notna()]
+        result[parsed.index] = parsed.dt.strftime(return_format)
+        remaining = remaining.drop(parsed.index)
+
+    # anything left gets the full row-wise treatment (pandas fallback/pass-through)
+    def parse_remaining(date_str):
+        try:
+            return parse_date(
+                date_str,
+                formats=formats,
+                strict=(errors == "coerce"),
+                return_format=return_format,
+            )
+        except ValueError:
+            return None
+
+    if not remaining.empty:
+        result[remaining.index] = str_dates[remaining.index].map(parse_remaining)
+
+    return result
+
+
+# parse a column of date strings to datetime.date objects, e.x. for a VA's typed
+# date columns. Unknown and unparseable dates become None.
+def parse_dates_as_dates(dates, formats=DATE_FORMATS):
+    dates = pd.Series(dates, dtype=object)
+    # values that aren't strings (e.x. dates set in code) are parsed from their str
+    dates = dates.map(lambda d: d if d is None or isinstance(d, str) else str(d))
+    parsed = pd.to_datetime(
+        parse_dates(dates, formats=formats, errors="coerce"),
+        format="%Y-%m-%d",
+        errors="coerce",
+    )
+    result = parsed.dt.date.astype(object)
+    result[parsed.isna()] = None
+    return result
+
+
+# Fill in the typed death_date and interview_date of every VA (deleted ones too) from
+# their Id10023 and Id10012 strings, parsing batch_size VAs at a time so we don't
+# overwhelm RAM. Returns the number of VAs updated.
+def backfill_parsed_dates(verbal_autopsy_model, batch_size=5000):
+    manager = verbal_autopsy_model._base_manager
+    vas = manager.only("id", "Id10023", "Id10012").order_by("id")
+    last_id, updated = 0, 0
+    while True:
+        batch = list(vas.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return updated
+        death_dates = parse_dates_as_dates([va.Id10023 for va in batch])
+        interview_dates = parse_dates_as_dates([va.Id10012 for va in batch])
+        for va, death_date, interview_date in zip(
+            batch, death_dates, interview_dates, strict=True
+        ):
+            va.death_date = death_date
+            va.interview_date = interview_date
+        manager.bulk_update(batch, ["death_date", "interview_date"])
+        last_id = batch[-1].id
+        updated += len(batch)
+
+
+# regex matching the shape of strings a strptime format can accept
+@lru_cache(maxsize=32)
+def _format_regex(fmt):
+    pattern = ""
+    for literal, directive in re.findall(r"([^%]*)(%.)?", fmt):
+        pattern += re.escape(literal)
+        if directive:
+            pattern += FORMAT_DIRECTIVE_PATTERNS.get(directive, ".+?")
+    return pattern
+
+
 # vectorized method to extract dates from datetime strings
 def to_dt(dates, utc=True):
     if isinstance(dates, list):
@@ -59,6 +191,26 @@ def to_dt(dates, utc=True):
     )
 
 
+# Counts of the vas without a parsed interview date, which are dated by their start
+# date (Id10011) like get_interview_dates does. Id10011 is free text, so the VAs are
+# grouped by it (and by groups, a dict of names to expressions) and counted in the
+# database, then dated in python. Returns a DataFrame with the groups, Id10011, the
+# counts and date; rows whose start date can't be parsed are dropped.
+def count_by_start_date(vas, counts, groups=None):
+    groups = groups or {}
+    start_dates = (
+        vas.filter(interview_date__isnull=True)
+        .exclude(Id10011__in=["", *NULL_STRINGS])
+        .annotate(**groups)
+        .values(*groups, "Id10011")
+        .annotate(**counts)
+        .order_by()
+    )
+    start_df = pd.DataFrame(start_dates, columns=[*groups, "Id10011", *counts])
+    start_df["date"] = to_dt(start_df["Id10011"])
+    return start_df.dropna(subset=["date"])
+
+
 # get interview date for multiple vas (supports df, queryset or list of vas).
 # First, checks for Id10012 (interview). If empty, checks for va start date (Id10011).
 # If empty, returns empty_string
@@ -1,15 +1,27 @@
+import queue
+import threading
+import time
 from urllib.parse import urlparse
 
 import environ
 import pandas as pd
 import requests
+from django.db import transaction
 from requests.auth import HTTPBasicAuth
 
+from va_explorer.va_data_management.models import IngestRun, SyncCursor
+from va_explorer.va_data_management.utils.loading import (
+    RESULT_KEYS,
+    load_records_from_dataframe,
+)
+
 env = environ.Env()
 USE_GATEWAY = env.bool("USE_GATEWAY", default=False)
 KOBO_HOST = env("KOBO_HOST", default="http://127.0.0.1:6001")
 # Don't verify localhost (self-signed cert)
 SSL_VERIFY = env.bool("KOBO_SSL_VERIFY", default=("localhost" in KOBO_HOST))
+# Number of downloaded pages allowed to wait in memory while the current page loads
+PREFETCH_DEPTH = env.int("KOBO_PREFETCH_DEPTH", default=2)
 
 # TODO: Further support Kobo integration by creating an endpoint for VAs coming
 #       in via REST Services feature (uploaded as soon as they're filled out)
@@ -38,7 +50,9 @@ def get_kobo_api_token(username, password):
     return {"Authorization": f"Token {token}"}
 
 
-def download_responses(token, asset_id, batch_size=5000, next_page=None):
+# If since_id is given, only submissions with a greater _id are requested, sorted
+# in ascending _id order so each page can safely advance a sync cursor
+def download_responses(token, asset_id, batch_size=5000, next_page=None, since_id=None):
     if not token or not asset_id:
         raise AttributeError(
             "Must specify either --token and --asset_id arguments or "
@@ -47,7 +61,17 @@ def download_responses(token, asset_id, batch_size=5000, next_page=None):
 
     # Support advanced networking setups by allowing explicit use of external
     # docker network gateways
-    params = "?format=json" + f"&limit={batch_size}" + "&start=0&sort={%22_id%22:-1}"
+    if since_id is None:
+        params = (
+            "?format=json" + f"&limit={batch_size}" + "&start=0&sort={%22_id%22:-1}"
+        )
+    else:
+        params = (
+            "?format=json"
+            + f"&limit={batch_size}"
+            + "&start=0&sort={%22_id%22:1}"
+            + f"&query={{%22_id%22:{{%22$gt%22:{int(since_id)}}}}}"
+        )
     if USE_GATEWAY:
         DOCKER_GATEWAY = env("DOCKER_GATEWAY", default="https://172.18.0.1")
         if next_page is None:
@@ -80,3 +104,155 @@ def download_responses(token, asset_id, batch_size=5000, next_page=None):
         return pd.DataFrame(parsed_results), next_results
     else:
         return pd.DataFrame([]), None
+
+
+# Yield (forms, next_page) for every page of submissions, starting at next_page if
+# given and following next_page links until Kobo reports there are no more. Pages
+# are downloaded on a background thread that stays up to depth pages ahead of the
+# caller, so downloading the next page overlaps with loading the current one.
+# Download errors are re-raised in the caller. With a depth of 0 pages are
+# downloaded one at a time as requested.
+def prefetch_responses(
+    token,
+    asset_id,
+    batch_size=5000,
+    since_id=None,
+    depth=PREFETCH_DEPTH,
+    next_page=None,
+):
+    def pages():
+        nonlocal next_page
+        while True:
+            forms, next_page = download_responses(
+                token, asset_id, batch_size, next_page, since_id=since_id
+            )
+            yield forms, next_page
+            if next_page is None:
+                return
+
+    if depth <= 0:
+        yield from pages()
+        return
+
+    # entries are (page, error); (None, None) marks the end
+    buffer = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    # block while the buffer is full, but give up once the caller stops consuming
+    def put(entry):
+        while not stopped.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for page in pages():
+                if not put((page, None)):
+                    return
+        except Exception as err:
+            put((None, err))
+        else:
+            put((None, None))
+
+    producer = threading.Thread(target=produce, name="kobo-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            page, err = buffer.get()
+            if err is not None:
+                raise err
+            if page is None:
+                return
+            yield page
+    finally:
+        stopped.set()
+
+
+# Import all pages of Kobo submissions for asset_id. In incremental mode only
+# submissions newer than the asset's SyncCursor are requested; otherwise everything
+# is downloaded again (full resync). Either way the cursor is advanced to the
+# newest submission loaded. Each page is loaded in its own transaction and
+# checkpointed in an IngestRun; with resume, an interrupted full resync continues
+# from the page after the last one committed (incremental imports resume from the
+# cursor, which is advanced with every page).
+def import_responses(
+    token,
+    asset_id,
+    incremental=False,
+    batch_size=5000,
+    insert_backend="orm",
+    progress=None,
+    prefetch_depth=PREFETCH_DEPTH,
+    resume=False,
+):
+    cursor = SyncCursor.for_source("kobo", asset_id)
+    since_id = cursor.last_id if incremental else None
+    run = IngestRun.start("kobo", asset_id, resume)
+    next_page = run.next_page if resume and since_id is None else None
+
+    counts = {key: 0 for key in RESULT_KEYS}
+    pages_processed = 0
+    last_id, last_submission_time = None, None
+    pages = prefetch_responses(
+        token,
+        asset_id,
+        batch_size,
+        since_id=since_id,
+        depth=prefetch_depth,
+        next_page=next_page,
+    )
+    try:
+        for forms, next_page in pages:
+            page_start = time.monotonic()
+            page_counts = {key: 0 for key in RESULT_KEYS}
+            with transaction.atomic():
+                if not forms.empty:
+                    results = load_records_from_dataframe(
+                        forms, insert_backend=insert_backend
+                    )
+                    page_counts = {key: len(results[key]) for key in RESULT_KEYS}
+
+                    if "_id" in forms.columns:
+                        page_id = int(forms["_id"].max())
+                        last_id = page_id if last_id is None else max(last_id, page_id)
+                    if "_submission_time" in forms.columns:
+                        page_time = pd.to_datetime(
+                            forms["_submission_time"], errors="coerce", utc=True
+                        ).max()
+                        if not pd.isna(page_time):
+                            last_submission_time = (
+                                page_time
+                                if last_submission_time is None
+                                else max(last_submission_time, page_time)
+                            )
+                    # incremental pages arrive in ascending _id order, so everything
+                    # up to this page is loaded and the cursor can move forward
+                    if since_id is not None:
+                        cursor.advance(last_id, last_submission_time)
+
+                run.checkpoint(
+                    page_counts,
+                    forms.shape[0],
+                    seconds=time.monotonic() - page_start,
+                    next_page=next_page if since_id is None else None,
+                )
+            for key in RESULT_KEYS:
+                counts[key] += page_counts[key]
+
+            pages_processed += 1
+            if pages_processed > 1 and progress:
+                progress(
+                    "Processed Additional Page. " f"{pages_processed} processed total.."
+                )
+    except Exception as err:
+        run.fail(err)
+        raise
+
+    cursor.advance(last_id, last_submission_time)
+    run.complete()
+    counts["pages"] = pages_processed
+    return counts
@@ -1,18 +1,37 @@
 import logging
+import multiprocessing
 import random
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-import numpy as np
+import django
 import pandas as pd
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Count, Max, Q
 from simple_history.utils import bulk_create_with_history
 
 from va_explorer.users.utils.demo_users import make_field_workers_for_facilities
-from va_explorer.va_data_management.models import Location, VerbalAutopsy
-from va_explorer.va_data_management.utils.date_parsing import parse_date
+from va_explorer.va_analytics.models import DashboardRollup
+from va_explorer.va_data_management.models import (
+    AGE_GROUP_FIELDS,
+    AGE_GROUP_FLAG_VALUES,
+    VerbalAutopsy,
+)
+from va_explorer.va_data_management.utils.copy_insert import copy_create_with_history
+from va_explorer.va_data_management.utils.data_version import queryset_cache_key
+from va_explorer.va_data_management.utils.date_parsing import (
+    parse_date,
+    parse_dates,
+    parse_dates_as_dates,
+)
 from va_explorer.va_data_management.utils.location_assignment import (
     assign_va_location,
+    get_facility_index,
 )
 from va_explorer.va_data_management.utils.validate import validate_vas_for_dashboard
 
@@ -20,14 +39,45 @@ from ..constants import _checkbox_choices
 
 User = get_user_model()
 
+# keys of the result dict returned by load_records_from_dataframe
+RESULT_KEYS = ["created", "ignored", "outdated", "corrected", "removed"]
+# max number of values sent in a single IN (...) lookup
+QUERY_BATCH_SIZE = 5000
+# functions that can be used to insert new VAs along with their history. "copy"
+# uses PostgreSQL's COPY FROM STDIN and is much faster for large imports
+INSERT_BACKENDS = {
+    "orm": bulk_create_with_history,
+    "copy": copy_create_with_history,
+}
+
 
 # load VA records into django database
-def load_records_from_dataframe(record_df, random_locations=False, debug=False):
+def load_records_from_dataframe(
+    record_df,
+    random_locations=False,
+    debug=False,
+    mark_duplicates=True,
+    insert_backend="orm",
+):
     logger = None if not debug else logging.getLogger("debug")
     if logger:
         header = "=" * 10 + "DATA INGEST" + "=" * 10
         logger.info(header)
 
+    prepared = prepare_records(record_df, debug)
+    return write_prepared_records(
+        prepared, random_locations, debug, mark_duplicates, insert_backend
+    )
+
+
+# Normalize a dataframe of raw VA records without touching the database: map
+# column names onto VerbalAutopsy fields, fill in missing instancenames, collapse
+# _other columns, drop Kobo records flagged invalid and parse dates. With
+# build_vas, unsaved VerbalAutopsy objects are built for every row as well. This
+# is the CPU-bound part of an import, so it can run in worker processes.
+def prepare_records(record_df, debug=False, build_vas=False):
+    logger = None if not debug else logging.getLogger("debug")
+
     # CSV can prefix column names with a strings and a dash or more. Examples:
     #     presets-Id10004
     #     respondent-backgr-Id10008
@@ -87,7 +137,7 @@ def load_records_from_dataframe(record_df, random_locations=False, debug=False):
     # Kobo provides an indicator for which records are invalid. Check if this
     # column is present, and if so, drop these from import consideration plus
     # attempt to remove them from existing VA Explorer records
-    invalid_vas = []
+    invalid_uuids = []
     if "_validation_status" in record_df.columns:
         filtered_df = record_df[
             record_df["_validation_status"].apply(
@@ -100,10 +150,6 @@ def load_records_from_dataframe(record_df, random_locations=False, debug=False):
             )
         ]
         invalid_uuids = invalid["instanceid"].to_list() if len(invalid) > 0 else []
-        to_remove = VerbalAutopsy.objects.filter(instanceid__in=invalid_uuids)
-        for va in to_remove:
-            invalid_vas.append(va)
-        to_remove.delete()
         record_df = record_df.drop(labels=invalid.index.values, axis=0)
 
     print("de-duplicating fields...")
@@ -122,24 +168,98 @@ def load_records_from_dataframe(record_df, random_locations=False, debug=False):
         logger.debug("Extra fields: %s", extra_field_names)
     record_df = record_df[common_field_names]
 
-    # For each row, check to see if there is an instanceid.
-    # If there is instanceid, try to find existing VA with that instanceid.
-    # If row does not have an instanceid, it will create a new VA.
-    # Build a list of VAs to create and a list of VAs to ignore (that already exist).
-    ignored_vas = []
-    outdated_vas = []
+    # Parse date of death and interview date as dates, a whole column at a time.
+    # Values that can't be parsed are kept as strings and recorded as record issues
+    # during validation
+    for date_col, date_label in [
+        ("Id10023", "Date of Death"),
+        ("Id10012", "Interview Date"),
+    ]:
+        if date_col in record_df.columns:
+            record_df = record_df.assign(**{date_col: parse_dates(record_df[date_col])})
+        else:
+            record_df = record_df.assign(**{date_col: "dk"})
+        if logger:
+            logger.info(
+                "Parsed %s: %s of %s values unknown (dk)",
+                date_label,
+                (record_df[date_col] == "dk").sum(),
+                record_df.shape[0],
+            )
+    # and keep typed copies of them for date range filters
+    record_df = record_df.assign(
+        death_date=parse_dates_as_dates(record_df["Id10023"]).to_numpy(),
+        interview_date=parse_dates_as_dates(record_df["Id10012"]).to_numpy(),
+    )
+    record_df = record_df.assign(derived_age_group=get_age_groups(record_df).to_numpy())
+
+    prepared = {
+        "records": record_df,
+        "corrected": corrected_vas,
+        "invalid_ids": invalid_uuids,
+        "vas": None,
+    }
+    if build_vas:
+        prepared["vas"] = build_verbal_autopsies(record_df)
+        # only the columns needed to de-duplicate and locate the VAs are kept
+        prepared["records"] = record_df[
+            record_df.columns.intersection(["instanceid", "instancename", "hospital"])
+        ]
+    return prepared
+
+
+# Age group of each record, a whole column at a time (see
+# VerbalAutopsy.set_age_group). None where no age group is flagged.
+def get_age_groups(record_df):
+    age_groups = pd.Series(None, index=record_df.index, dtype=object)
+    for group, fields in AGE_GROUP_FIELDS.items():
+        flagged = pd.Series(False, index=record_df.index)
+        for field in record_df.columns.intersection(fields):
+            flagged |= record_df[field].astype(str).isin(AGE_GROUP_FLAG_VALUES)
+        age_groups[flagged & age_groups.isna()] = group
+    return age_groups
+
+
+# Build unsaved VerbalAutopsy objects (with duplicate identifier hashes, if
+# configured) for prepared records, one per row.
+def build_verbal_autopsies(record_df):
+    vas = []
+    for row in record_df.to_dict(orient="records"):
+        format_multi_select_fields(row)
+        va = VerbalAutopsy(**row)
+        # Generate a unique_identifier_hash for each VA if the application is
+        # configured to detect duplicate VAs
+        if VerbalAutopsy.auto_detect_duplicates():
+            va.generate_unique_identifier_hash()
+        vas.append(va)
+    return vas
+
+
+# Write the output of prepare_records to the database: remove VAs Kobo flagged as
+# invalid, split off ignored and outdated records, assign locations, insert the
+# new VAs and validate them. If VAs were already built (e.g. by a worker process)
+# only the new ones among them are kept.
+def write_prepared_records(
+    prepared,
+    random_locations=False,
+    debug=False,
+    mark_duplicates=True,
+    insert_backend="orm",
+    refresh_rollup=True,
+):
+    logger = None if not debug else logging.getLogger("debug")
+    record_df = prepared["records"]
+
+    invalid_vas = []
+    if prepared["invalid_ids"]:
+        to_remove = VerbalAutopsy.objects.filter(instanceid__in=prepared["invalid_ids"])
+        for va in to_remove:
+            invalid_vas.append(va)
+        to_remove.delete()
+
     created_vas = []
-    location_map = {}
-
-    # build location mapper to map csv locations to known db locations
-    if "hospital" in record_df.columns:
-        hospitals = record_df["hospital"].unique().tolist()
-        location_map = {
-            key_name_pair[0]: key_name_pair[1]
-            for key_name_pair in Location.objects.filter(key__in=hospitals)
-            .only("name", "key")
-            .values_list("key", "name")
-        }
+    # map csv locations to known db locations without a query per VA
+    facility_index = get_facility_index()
 
     # if random locations, assign random locations via a random field worker.
     if random_locations:
@@ -152,12 +272,20 @@ def load_records_from_dataframe(record_df, random_locations=False, debug=False):
             make_field_workers_for_facilities()
             field_workers = [u for u in User.objects.all() if u.is_fieldworker()]
 
-    # pull in all existing VA instanceIDs from db for de-duping purposes
-    print("pulling in instance ids...")
-    va_instance_ids = set(VerbalAutopsy.objects.values_list("instanceid", flat=True))
-    va_instance_names = set(
-        VerbalAutopsy.objects.values_list("instancename", flat=True)
-    )
+    # match this batch's instanceids/instancenames against the db in a few IN-list
+    # queries and split rows into new and ignored sets, soft-deleting outdated VAs
+    print("de-duplicating against existing VAs...")
+    record_df, ignored_df, outdated_vas = split_existing_records(record_df)
+    ignored_vas = [
+        VerbalAutopsy(instanceid=row.instanceid, instancename=row.instancename)
+        for row in ignored_df[["instanceid", "instancename"]].itertuples()
+    ]
+
+    if prepared["vas"] is None:
+        new_vas = build_verbal_autopsies(record_df)
+    else:
+        va_by_index = dict(zip(prepared["records"].index, prepared["vas"], strict=True))
+        new_vas = [va_by_index[index] for index in record_df.index]
 
     if debug:
         print(
@@ -167,56 +295,9 @@ def load_records_from_dataframe(record_df, random_locations=False, debug=False):
         )
 
     print("creating new VAs...")
-    for i, row in enumerate(record_df.to_dict(orient="records")):
-        format_multi_select_fields(row)
-
-        va = VerbalAutopsy(**row)
-        # only import VA if its instanceId doesn't already exist
-        if row["instanceid"]:
-            va_exists = row["instanceid"] in va_instance_ids
-            if va_exists:
-                ignored_vas.append(va)
-                continue
-            else:
-                # If VA "doesn't exist", it's still possible we have an edited VA,
-                # since kobo will change the uuid for an edited VA. Check if a
-                # previous instancename for this "new" VA exists and if so, delete
-                # the old one in favor of this new one
-                if row["instancename"] in va_instance_names:
-                    outdated_va = VerbalAutopsy.objects.filter(
-                        instancename=row["instancename"]
-                    )
-                    outdated_vas.append(outdated_va)
-                    outdated_va.delete()
-
-                va_instance_ids.add(row["instanceid"])
-
+    for i, va in enumerate(new_vas):
         # If we got here, we have a new, legit VA on our hands.
-        va_id = row.get("instanceid", f"{i} of {record_df.shape[0]}")
-
-        # Try to parse date of death as as datetime. Otherwise, record string and
-        # add record issue during validation
-        parsed_date = parse_date(va.Id10023, strict=False)
-        if logger:
-            logger.info(
-                "va_id: %s - Parsed %s for Date of Death from %s",
-                va_id,
-                parse_date,
-                va.Id10023,
-            )
-        va.Id10023 = parsed_date
-
-        # Try to parse interview date as as datetime. Otherwise, record string and
-        # add record issue during validation
-        parsed_sub_date = parse_date(va.Id10012, strict=False)
-        if logger:
-            logger.info(
-                "va_id: %s - Parsed %s as Interview Date from %s",
-                va_id,
-                parsed_sub_date,
-                va.Id10012,
-            )
-        va.Id10012 = parsed_sub_date
+        va_id = va.instanceid or f"{i} of {record_df.shape[0]}"
 
         # if random_locations, assign random field worker to VA which can be used
         # to determine location.
@@ -224,41 +305,194 @@ def load_records_from_dataframe(record_df, random_locations=False, debug=False):
         if random_locations:
             user = random.choice(field_workers)
             va.location = user.location_restrictions.first()
+            va.set_location_ancestors(facility_index.ids_by_path)
         else:
-            assign_va_location(va, location_map)
-            if "hospital" in row and logger:
+            assign_va_location(va, facility_index=facility_index)
+            if "hospital" in record_df.columns and logger:
                 logger.info(
                     "va_id: %s - Matched hospital %s to %s location in DB",
                     va_id,
-                    row["hospital"],
+                    va.hospital,
                     va.location,
                 )
-
-        # Generate a unique_identifier_hash for each VA if the application is
-        # configured to detect duplicate VAs
-        if VerbalAutopsy.auto_detect_duplicates():
-            va.generate_unique_identifier_hash()
         created_vas.append(va)
 
     print("populating DB...")
-    new_vas = bulk_create_with_history(created_vas, VerbalAutopsy)
+    new_vas = INSERT_BACKENDS[insert_backend](created_vas, VerbalAutopsy)
 
     print("Validating VAs...")
     # Add any errors to the db
     validate_vas_for_dashboard(new_vas)
 
     # Mark duplicate VAs if the application is configured to do so
-    if VerbalAutopsy.auto_detect_duplicates():
+    if mark_duplicates and VerbalAutopsy.auto_detect_duplicates():
         print("Marking VAs as duplicate...")
         VerbalAutopsy.mark_duplicates()
 
-    return {
+    results = {
         "ignored": ignored_vas,
         "outdated": outdated_vas,
         "created": created_vas,
-        "corrected": corrected_vas,
+        "corrected": prepared["corrected"],
         "removed": invalid_vas,
     }
+    if refresh_rollup:
+        DashboardRollup.refresh(changed_location_ids(results))
+    return results
+
+
+# ids of the locations whose VAs were added or removed by an import (None for VAs
+# without a location)
+def changed_location_ids(results):
+    return {
+        va.location_id
+        for key in ["created", "outdated", "removed"]
+        for va in results[key]
+    }
+
+
+# Split incoming records into new and ignored rows. A row is ignored if its
+# instanceid already exists in the db or appears earlier in the same batch; rows
+# without an instanceid are always new. If a new row's instancename matches an
+# existing VA, that VA is an older version of a Kobo-edited record (Kobo changes the
+# uuid on edit), so it is soft-deleted in favor of the incoming one. Lookups are done
+# with batched IN-lists over this batch's values only, so cost does not grow with the
+# size of the VA table.
+def split_existing_records(record_df):
+    if "instanceid" not in record_df.columns or record_df.empty:
+        return record_df, record_df.iloc[0:0], []
+
+    instance_ids = record_df["instanceid"]
+    has_id = instance_ids.notna() & (instance_ids.astype(str) != "")
+
+    existing_ids = set()
+    for id_batch in _batched(instance_ids[has_id].unique().tolist()):
+        existing_ids.update(
+            VerbalAutopsy.objects.filter(instanceid__in=id_batch).values_list(
+                "instanceid", flat=True
+            )
+        )
+
+    ignored = has_id & (
+        instance_ids.isin(existing_ids) | instance_ids.duplicated(keep="first")
+    )
+    new_names = record_df.loc[has_id & ~ignored, "instancename"].dropna().unique()
+
+    # soft-delete outdated VAs (one UPDATE per batch of names)
+    outdated_vas = []
+    for name_batch in _batched(new_names.tolist()):
+        outdated = VerbalAutopsy.objects.filter(instancename__in=name_batch)
+        outdated_vas.extend(
+            outdated.only("id", "instanceid", "instancename", "location")
+        )
+        outdated.delete()
+
+    return record_df[~ignored], record_df[ignored], outdated_vas
+
+
+def _batched(values, batch_size=QUERY_BATCH_SIZE):
+    for start in range(0, len(values), batch_size):
+        yield values[start : start + batch_size]
+
+
+# load VA records from an iterable of dataframes (e.g. the chunks yielded by
+# pd.read_csv(..., chunksize=n)) one chunk at a time. Only per-key counts are kept
+# between chunks so peak memory stays bounded by the chunk size. Duplicate marking
+# scans the whole table, so it is done once after the last chunk.
+# With workers > 1, chunks are prepared (see prepare_records) in that many worker
+# processes while this process writes them to the database one at a time in their
+# original order, so instanceid de-duplication behaves as in a sequential import.
+# Each chunk is written in its own transaction and, if an IngestRun is given,
+# checkpointed in it, so an interrupted import only has to redo the chunk that was
+# in progress. The dashboard rollup is refreshed once for every facility touched
+# by the import after the last chunk.
+def load_records_from_chunks(
+    chunks,
+    random_locations=False,
+    debug=False,
+    progress=print,
+    insert_backend="orm",
+    workers=1,
+    run=None,
+):
+    counts = {key: 0 for key in RESULT_KEYS}
+    location_ids = set()
+    num_chunks, num_rows = 0, 0
+    start = time.monotonic()
+    try:
+        for record_df, prepared in _prepare_chunks(chunks, workers, debug):
+            chunk_start = time.monotonic()
+            with transaction.atomic():
+                results = write_prepared_records(
+                    prepared,
+                    random_locations,
+                    debug,
+                    mark_duplicates=False,
+                    insert_backend=insert_backend,
+                    refresh_rollup=False,
+                )
+                chunk_counts = {key: len(results[key]) for key in RESULT_KEYS}
+                if run:
+                    run.checkpoint(
+                        chunk_counts,
+                        record_df.shape[0],
+                        seconds=time.monotonic() - chunk_start,
+                    )
+            for key in RESULT_KEYS:
+                counts[key] += chunk_counts[key]
+            location_ids |= changed_location_ids(results)
+
+            num_chunks += 1
+            num_rows += record_df.shape[0]
+            if progress:
+                chunk_elapsed = max(time.monotonic() - chunk_start, 1e-6)
+                total_elapsed = max(time.monotonic() - start, 1e-6)
+                progress(
+                    f"Chunk {num_chunks}: {record_df.shape[0]} rows in "
+                    f"{chunk_elapsed:.1f}s "
+                    f"({record_df.shape[0] / chunk_elapsed:.0f} rows/s). "
+                    f"{num_rows} rows processed total "
+                    f"({num_rows / total_elapsed:.0f} rows/s)"
+                )
+    except Exception as err:
+        if run:
+            run.fail(err)
+        raise
+
+    if num_chunks > 0 and VerbalAutopsy.auto_detect_duplicates():
+        print("Marking VAs as duplicate...")
+        VerbalAutopsy.mark_duplicates()
+    DashboardRollup.refresh(location_ids)
+    if run:
+        run.complete()
+
+    counts["chunks"] = num_chunks
+    counts["rows"] = num_rows
+    return counts
+
+
+# Yield (chunk, prepare_records output) pairs in chunk order. With several workers,
+# up to two chunks per worker are prepared ahead of the one being written. Workers
+# are spawned rather than forked so they never share the parent's db connections.
+def _prepare_chunks(chunks, workers, debug):
+    if workers <= 1:
+        for record_df in chunks:
+            yield record_df, prepare_records(record_df, debug)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, context, initializer=django.setup) as pool:
+        pending = deque()
+        for record_df in chunks:
+            pending.append(
+                (record_df, pool.submit(prepare_records, record_df, debug, True))
+            )
+            if len(pending) >= 2 * workers:
+                record_df, future = pending.popleft()
+                yield record_df, future.result()
+        while pending:
+            record_df, future = pending.popleft()
+            yield record_df, future.result()
 
 
 # Change the response format of Multiselect questions from ODK (space-separated)
@@ -278,57 +512,71 @@ def format_multi_select_fields(row):
 # NOTE: currently using 'cleaned' version of other field (called filtered_<field>_other)
 # and discarding <field>-other values. verify that this is kosher.
 def deduplicate_columns(record_df, drop_duplicates=True):
-    other_cols = record_df.filter(regex=r"\_other$", axis=1).columns
-    # get original columns that other columns are derived from
-    original_cols = list(
-        set(
-            other_cols.str.replace(r"^filtered\_", "", regex=True)
-            .str.replace(r"_other$", "", regex=True)
-            .tolist()
+    other_cols, column_map, missing_cols = _other_column_map(tuple(record_df.columns))
+    for original_col in missing_cols:
+        print(
+            f"WARNING: couldn't find {original_col} but \
+            {original_col}_other in columns"
         )
-    )
-    for original_col in original_cols:
-        # If original column exists, combine values from original and _other
-        # columns into a single column
-        if original_col in record_df.columns:
-            record_df[original_col] = (
-                record_df.filter(regex=original_col, axis=1)
-                .replace("other", np.nan)
-                .bfill(axis=1)
-                .iloc[:, 0]
-            )
-            # record_df[original_col] = record_df.apply(lambda row: row[other_col]
-            # f pd.isna(row[original_col]) else row[original_col], axis=1)
-        else:
-            print(
-                f"WARNING: couldn't find {original_col} but \
-                {original_col}_other in columns"
-            )
+    # Combine values from the original and its _other columns into a single
+    # column, taking the first value that isn't missing or "other"
+    for original_col, derived_cols in column_map.items():
+        combined = _drop_other(record_df[original_col])
+        for col in derived_cols:
+            combined = combined.combine_first(_drop_other(record_df[col]))
+        record_df[original_col] = combined
     if drop_duplicates:
-        record_df = record_df.drop(columns=other_cols)
+        record_df = record_df.drop(columns=list(other_cols))
     return record_df
 
 
+# Map each original column to the _other columns derived from it (e.x. Id10010 to
+# Id10010_other and filtered_Id10010_other), in header order. Cached per header
+# because imports of the same form keep reusing the same columns.
+@lru_cache(maxsize=32)
+def _other_column_map(columns):
+    other_cols = [col for col in columns if col.endswith("_other")]
+    column_map, missing_cols = {}, []
+    for other_col in other_cols:
+        original_col = re.sub(r"^filtered_", "", other_col)[: -len("_other")]
+        if original_col in column_map:
+            column_map[original_col].append(other_col)
+        elif original_col in columns:
+            column_map[original_col] = [other_col]
+        elif original_col not in missing_cols:
+            missing_cols.append(original_col)
+    column_map = {col: tuple(derived) for col, derived in column_map.items()}
+    return tuple(other_cols), column_map, tuple(missing_cols)
+
+
+def _drop_other(values):
+    return values.where(values != "other")
+
+
 def get_va_summary_stats(vas, filter_fields=False):
     # if vas.count() > 0 code is the slowest SQL query
 
     # if filter_fields=True, filter down to only relevant fields
     if filter_fields:
-        vas = vas.only("created", "id", "location", "Id10023")
-
-    # check cache for va summary stats and set it if not already there
-    stats = cache.get("va_summary_stats")
+        vas = vas.only("created", "id", "location", "death_date")
+
+    # check cache for va summary stats and set it if not already there. The key
+    # covers the query (so users with different location restrictions or filters
+    # don't share stats) and the data generation (so stats are dropped when VAs
+    # change)
+    key = queryset_cache_key("va_summary_stats", vas)
+    stats = cache.get(key) if key else None
     if not stats:
         stats = vas.aggregate(
             last_update=Max("created"),
-            last_interview=Max("Id10012"),
+            last_interview=Max("interview_date"),
             total_vas=Count("id"),
         )
-        cache.set("va_summary_stats", stats, timeout=60 * 60)
-
-    stats["ineligible_vas"] = vas.filter(
-        Q(Id10023__in=["DK", "dk"]) | Q(Id10023__isnull=True) | Q(location__isnull=True)
-    ).count()
+        stats["ineligible_vas"] = vas.filter(
+            Q(death_date__isnull=True) | Q(location__isnull=True)
+        ).count()
+        if key:
+            cache.set(key, stats, timeout=60 * 60)
 
     # clean up dates if non-null
     if stats["last_update"] and not isinstance(stats["last_update"], str):
@@ -1,59 +1,170 @@
+import re
+import uuid
+from collections import Counter, defaultdict
+
 import pandas as pd
+from django.core.cache import cache
 from fuzzywuzzy import fuzz
 
 from va_explorer.va_data_management.models import Location
 
+# cache key holding the current facility index version, so a change to the
+# location tree in one process invalidates the index in all of them
+FACILITY_INDEX_VERSION_KEY = "facility_index_version"
+
+_facility_index = None
+
+
+# In-memory index of the Location table used to assign locations to VAs without
+# per-VA queries: location names by key, facilities by name and by
+# (province, district, name), all in tree order, the "Unknown" location, and
+# location ids by path for setting a VA's province and district.
+class FacilityIndex:
+    def __init__(self, locations, version=None):
+        self.version = version
+        self.names_by_key = {}
+        self.facilities_by_name = {}
+        self.facilities_by_place = {}
+        self.null_location = None
+        self.ids_by_path = {}
+        # built on the first fuzzy match, with the names matched so far
+        self.fuzzy_options = {}
+        self.fuzzy_matcher = None
+        self.fuzzy_names = {}
+        for location in locations:
+            self.ids_by_path[location.path] = location.id
+            if location.key:
+                self.names_by_key.setdefault(location.key, location.name)
+            if location.name == "Unknown" and self.null_location is None:
+                self.null_location = location
+            if location.location_type != "facility":
+                continue
+            self.facilities_by_name.setdefault(location.name, []).append(location)
+            place = _place_from_path(location.path_string)
+            if place:
+                self.facilities_by_place.setdefault(place, location)
+
+    @classmethod
+    def load(cls, version=None):
+        return cls(Location.objects.order_by("path"), version)
+
+    # name of the location whose key or facility name best matches raw_location,
+    # for hospitals that aren't known keys (e.x. misspelled free text), or None if
+    # nothing scores at least threshold
+    def fuzzy_location_name(self, raw_location, threshold=90):
+        if self.fuzzy_matcher is None:
+            # options are facility names and location keys, mapped to location names
+            self.fuzzy_options = {name: name for name in self.facilities_by_name}
+            self.fuzzy_options.update(self.names_by_key)
+            self.fuzzy_matcher = FuzzyMatcher(self.fuzzy_options)
+        if raw_location not in self.fuzzy_names:
+            match = self.fuzzy_matcher.match(raw_location, threshold)
+            self.fuzzy_names[raw_location] = self.fuzzy_options.get(match)
+        return self.fuzzy_names[raw_location]
+
+    # find the facility named name, using the VA's province and district (or
+    # failing that, its hospital) to pick between facilities sharing the name
+    def find_facility(self, name, va):
+        facilities = self.facilities_by_name.get(name, [])
+        if len(facilities) > 1:
+            place = _place_key(va.province, va.area, name)
+            if place in self.facilities_by_place:
+                return self.facilities_by_place[place]
+            # attempt to find specific facility based on match with other
+            # va location data. warn if that doesn't narrow it down completely
+            search_string = f"{va.province} Province/{va.area} District/{va.hospital}"
+            facilities = [
+                facility
+                for facility in facilities
+                if search_string.lower() in (facility.path_string or "").lower()
+            ]
+            if len(facilities) > 1:
+                print(
+                    f"WARNING: ambiguous location: {search_string} "
+                    + "using most likely match"
+                )
+        return facilities[0] if facilities else None
+
+
+# Return the process-wide facility index, reloading it if the location tree
+# changed since it was built. Call once per batch, not once per VA.
+def get_facility_index():
+    global _facility_index
+    version = cache.get(FACILITY_INDEX_VERSION_KEY)
+    if _facility_index is None or _facility_index.version != version:
+        _facility_index = FacilityIndex.load(version)
+    return _facility_index
+
+
+# Drop the facility index in this and every other process; call after changing
+# the location tree
+def invalidate_facility_index():
+    global _facility_index
+    _facility_index = None
+    cache.set(FACILITY_INDEX_VERSION_KEY, uuid.uuid4().hex, timeout=None)
 
-def assign_va_location(va, location_mapper=None, location_fields=None):
+
+def _place_key(province, district, name):
+    if not province or not district or not name:
+        return None
+    return (str(province).lower(), str(district).lower(), str(name).lower())
+
+
+# (province, district, name) of a facility from its path string, e.x.
+# /Zambia/Lusaka Province/Kafue District/Other Facility
+def _place_from_path(path_string):
+    parts = (path_string or "").split("/")
+    if len(parts) < 4:
+        return None
+    province, district, name = parts[-3:]
+    return _place_key(
+        re.sub(r" Province$", "", province), re.sub(r" District$", "", district), name
+    )
+
+
+def assign_va_location(
+    va, location_mapper=None, location_fields=None, facility_index=None
+):
     # check if the hospital or place of death fields are known locations
     location_fields = (
         location_fields if location_fields else ["hospital", "hospital_other"]
     )
+    facility_index = facility_index or get_facility_index()
     raw_location, db_location = None, None
     for location_field in location_fields:
         raw_location = va.__dict__.get(location_field, None)
         if raw_location:
             break
     if raw_location:
+        fuzzy = not location_mapper
         if not location_mapper:
-            # no mapper provided, create a one-off for this assignment
-            location_mapper = dict(
-                Location.objects.filter(key=raw_location)
-                .only("name", "key")
-                .values_list("key", "name")
-            )
+            location_mapper = facility_index.names_by_key
         db_location_name = location_mapper.get(raw_location, None)
+        # otherwise, try rescuing the hospital with a conservative fuzzy match
+        if not db_location_name and fuzzy and isinstance(raw_location, str):
+            db_location_name = facility_index.fuzzy_location_name(raw_location)
         # if matching db location, retrieve it. Otherwise, record location as unknown
         if db_location_name:
             # TODO: make this more generic to other location hierarchies
-            db_location = Location.objects.filter(
-                location_type="facility", name=db_location_name
-            )
-            if len(db_location) > 1:
-                # attempt to find specific facility based on match with other
-                # va location data. warn if that doesn't narrow it down completely
-                search_string = (
-                    f"{va.province} Province/{va.area} District/{va.hospital}"
-                )
-                db_location = db_location.filter(path_string__icontains=search_string)
-                if len(db_location) > 1:
-                    print(
-                        f"WARNING: ambiguous location: {search_string} "
-                        + "using most likely match"
-                    )
-            # need to take first anyway to get (ideally 1) Location out of QuerySet
-            db_location = db_location.first()
+            db_location = facility_index.find_facility(db_location_name, va)
 
     # if any db location found, update VA with found location
     if db_location:
         va.location = db_location
+        va.set_location_ancestors(facility_index.ids_by_path)
     elif (
         not pd.isna(raw_location)
         and len(raw_location) > 0
         and raw_location.lower() not in ["dk", "nan"]
     ):
         # if raw location detected but no db match, set to "Unknown"
-        va.set_null_location()
+        if facility_index.null_location:
+            va.location = facility_index.null_location
+            va.set_location_ancestors(facility_index.ids_by_path)
+        else:
+            va.set_null_location()
+            va.set_location_ancestors()
+            invalidate_facility_index()
     # otherwise, va.location will just be blank
     return va
 
@@ -110,3 +221,63 @@ def fuzzy_match(
             )
 
     return match
+
+
+# Fuzzy matcher for resolving many search strings against a fixed list of options
+# (e.x. messy free-text hospital names against the facility list). Options are
+# indexed once by their character n-grams, so each search only scores (with
+# fuzz.ratio, as in fuzzy_match) the few options sharing the most n-grams with it
+# instead of every option. Matching is case insensitive.
+class FuzzyMatcher:
+    def __init__(self, options, n=3, max_candidates=10):
+        self.n = n
+        self.max_candidates = max_candidates
+        self.names = list(dict.fromkeys(name for name in options if name))
+        self.keys = [str(name).lower() for name in self.names]
+        self.ngram_index = defaultdict(list)
+        for i, key in enumerate(self.keys):
+            for ngram in self._ngrams(key):
+                self.ngram_index[ngram].append(i)
+
+    def _ngrams(self, text):
+        # pad so short strings and word boundaries still produce n-grams
+        text = f" {text} "
+        return {text[i : i + self.n] for i in range(max(len(text) - self.n + 1, 1))}
+
+    # indices of the options sharing the most n-grams with search
+    def candidates(self, search):
+        shared = Counter()
+        for ngram in self._ngrams(search):
+            shared.update(self.ngram_index.get(ngram, []))
+        return [i for i, _ in shared.most_common(self.max_candidates)]
+
+    # best option (name, or a dict with name, key and score if return_str is False)
+    # scoring at least threshold against search, or None
+    def match(self, search, threshold=75, return_str=True):
+        if pd.isna(search):
+            return None
+        # if threshold is a decimal, convert to percent
+        if threshold > 0 and threshold <= 1:
+            threshold = int(100 * threshold)
+        search_term = str(search).lower()
+        best, best_score = None, -1
+        for i in self.candidates(search_term):
+            score = fuzz.ratio(search_term, self.keys[i])
+            # ties go to the earlier option
+            if score > best_score or (score == best_score and i < best):
+                best, best_score = i, score
+        if best is None or best_score < threshold:
+            return None
+        if return_str:
+            return self.names[best]
+        return {"name": self.names[best], "key": self.keys[best], "score": best_score}
+
+    # match a whole column of search strings at once; each distinct value is only
+    # matched once. Returns a Series of matches aligned with searches
+    def match_all(self, searches, threshold=75, return_str=True):
+        searches = pd.Series(searches)
+        matches = {
+            search: self.match(search, threshold, return_str)
+            for search in searches.dropna().unique()
+        }
+        return searches.map(matches)
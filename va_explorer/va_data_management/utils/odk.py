@@ -1,14 +1,25 @@
+import time
+from datetime import timezone
 from io import BytesIO
 
 import environ
 import pandas as pd
 import requests
+from django.db import transaction
+
+from va_explorer.va_data_management.models import IngestRun, SyncCursor
+from va_explorer.va_data_management.utils.loading import (
+    RESULT_KEYS,
+    load_records_from_dataframe,
+)
 
 env = environ.Env()
 
 ODK_HOST = env("ODK_HOST", default="http://127.0.0.1:5002")
 # Don't verify localhost (self-signed cert)
 SSL_VERIFY = env.bool("ODK_SSL_VERIFY", not ODK_HOST.startswith("https://localhost"))
+# Number of submissions requested per OData page during incremental imports
+PAGE_SIZE = env.int("ODK_PAGE_SIZE", default=1000)
 
 
 def flatten_dict(item):
@@ -116,3 +127,134 @@ def download_responses(
         forms = pd.read_csv(BytesIO(response.content))
         forms.columns = [c.rsplit("-", 1)[-1] for c in forms.columns]
         return forms
+
+
+# Page through a form's OData Submissions feed with $top/$skip, yielding one
+# DataFrame per page. If since/until are given, only submissions received after
+# since and no later than until are requested, starting skip submissions in.
+# @odata.nextLink is followed when the server provides one; otherwise $skip is
+# advanced until a short page comes back.
+def download_response_pages(
+    token, project_id, form_id, page_size=PAGE_SIZE, since=None, until=None, skip=0
+):
+    url = f"{ODK_HOST}/v1/projects/{project_id}/forms/{form_id}.svc/Submissions"
+    params = {"$top": page_size, "$skip": skip}
+    filters = []
+    if since is not None:
+        filters.append(f"__system/submissionDate gt {_odata_datetime(since)}")
+    if until is not None:
+        filters.append(f"__system/submissionDate le {_odata_datetime(until)}")
+    if filters:
+        params["$filter"] = " and ".join(filters)
+
+    while url:
+        response = requests.get(url, headers=token, params=params, verify=SSL_VERIFY)
+        response.raise_for_status()
+        data = response.json()
+        values = data.get("value", [])
+        if values:
+            # JSON nulls become blanks, as in the csv and Kobo exports
+            forms = pd.DataFrame.from_records([flatten_dict(item) for item in values])
+            yield forms.fillna("")
+
+        if data.get("@odata.nextLink"):
+            # the link already carries all query options
+            url, params = data["@odata.nextLink"], None
+        elif len(values) == page_size and params is not None:
+            params["$skip"] += page_size
+        else:
+            url = None
+
+
+def _odata_datetime(value):
+    value = value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+    return f"{value[:-3]}Z"
+
+
+# Import a form's ODK submissions. In incremental mode pages of submissions newer
+# than the form's SyncCursor are loaded one at a time as they arrive; otherwise the
+# full submissions.csv export is loaded (full resync). Either way the cursor is
+# advanced to the newest submission loaded. Each page is loaded in its own
+# transaction and checkpointed in an IngestRun. An incremental run only asks for
+# submissions received before it started, so with resume an interrupted run can
+# skip straight past the submissions it already committed.
+def import_responses(
+    email,
+    password,
+    project_name=None,
+    project_id=None,
+    form_name=None,
+    form_id=None,
+    incremental=False,
+    page_size=PAGE_SIZE,
+    insert_backend="orm",
+    progress=None,
+    resume=False,
+):
+    if not project_name and not project_id:
+        raise AttributeError("Must specify either project_name or project_id argument.")
+
+    token = get_odk_login_token(email, password)
+    if not project_id:
+        project_id = get_odk_project_id(token, project_name)
+    form_id = get_odk_form(token, project_id, form_name, form_id)["xmlFormId"]
+    cursor = SyncCursor.for_source("odk", f"{project_id}/{form_id}")
+    run = IngestRun.start("odk", f"{project_id}/{form_id}", resume)
+
+    if incremental:
+        pages = download_response_pages(
+            token,
+            project_id,
+            form_id,
+            page_size,
+            since=cursor.last_submission_time,
+            until=run.created,
+            skip=run.rows_committed,
+        )
+    else:
+        pages = [
+            download_responses(email, password, project_id=project_id, form_id=form_id)
+        ]
+
+    counts = {key: 0 for key in RESULT_KEYS}
+    pages_processed = 0
+    last_submission_time = None
+    try:
+        for forms in pages:
+            if forms.empty:
+                continue
+            page_start = time.monotonic()
+            with transaction.atomic():
+                results = load_records_from_dataframe(
+                    forms, insert_backend=insert_backend
+                )
+                page_counts = {key: len(results[key]) for key in RESULT_KEYS}
+                run.checkpoint(
+                    page_counts, forms.shape[0], seconds=time.monotonic() - page_start
+                )
+            for key in RESULT_KEYS:
+                counts[key] += page_counts[key]
+            pages_processed += 1
+            if progress and incremental:
+                progress(
+                    f"Processed page {pages_processed} ({forms.shape[0]} submissions)"
+                )
+
+            # submissionDate from OData, SubmissionDate from the csv export
+            for date_col in ["submissionDate", "SubmissionDate"]:
+                if date_col in forms.columns:
+                    page_time = pd.to_datetime(
+                        forms[date_col], errors="coerce", utc=True
+                    ).max()
+                    if not pd.isna(page_time) and (
+                        last_submission_time is None or page_time > last_submission_time
+                    ):
+                        last_submission_time = page_time
+    except Exception as err:
+        run.fail(err)
+        raise
+
+    cursor.advance(last_submission_time=last_submission_time)
+    run.complete()
+    counts["pages"] = pages_processed
+    return counts
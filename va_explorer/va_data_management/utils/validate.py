@@ -1,172 +1,284 @@
-from va_explorer.va_data_management.models import CauseCodingIssue
-from va_explorer.va_data_management.utils.date_parsing import parse_date
-from va_explorer.va_data_management.utils.location_assignment import assign_va_location
+from itertools import compress
 
+import pandas as pd
+from django.db.models import Q
 
-def validate_vas_for_dashboard(verbal_autopsies):
-    # This validator is used to determine whether there is sufficient data to include
-    # the record in the dashboard. Any errors or warnings are collected and reported
-    # in the data manager.
-    # The validation has to occur after the va's are created so we can reference
-    # the va_id in the CauseCodingIssue.
-    # The validator runs after va's are loaded and after a va is edited or reset.
-    # TODO: would it be possible to move this to the VA model clean function?
-    issues = []
-    for va in verbal_autopsies:
-        # clear all data related errors in case any were addressed
-        CauseCodingIssue.objects.filter(verbalautopsy_id=va.id, algorithm="").delete()
-
-        # Validate: date of death
-        # Id10023 is required for the dashboard time frame filters
-        # VA form guarantees this field is either "dk" or a valid datetime.date value
-        try:
-            va.Id10023 = parse_date(va.Id10023, strict=True)
-        except:  # noqa E722 - Intent is to save to db, not do anything with exception
-            issue_text = f"Error: field Id10023, couldn't parse date from {va.Id10023}"
-            issue = CauseCodingIssue(
-                verbalautopsy_id=va.id,
-                text=issue_text,
-                severity="error",
-                algorithm="",
-                settings="",
-            )
-            issues.append(issue)
-
-        # Validate: ageInYears2
-        # ageInYears2 is required for calculating mean age of death
-        try:
-            _ = int(float(va.ageInYears2))
-        except:  # noqa E722 - Intent is to save to db, not do anything with exception
-            issue_text = (
-                "Warning: field ageInYears2, age was not provided or not a number."
-            )
-            issue = CauseCodingIssue(
-                verbalautopsy_id=va.id,
-                text=issue_text,
-                severity="warning",
+from va_explorer.va_data_management.models import (
+    CauseCodingIssue,
+    Location,
+    VerbalAutopsy,
+)
+from va_explorer.va_data_management.utils.date_parsing import parse_dates
+from va_explorer.va_data_management.utils.location_assignment import (
+    assign_va_location,
+    get_facility_index,
+)
+
+# Rules checked by validate_vas_for_dashboard, in the order their issues are
+# recorded. Each rule declares the VA fields it reads; its check gets a DataFrame
+# with those fields (one row per VA) and returns a boolean mask of the rows that
+# fail it. Location rules also see the location_name and location_is_active of
+# the VA's location (or of the location it would be assigned, if it has none).
+# A rule is only re-run for VAs whose fields it reads changed since they were last
+# validated (see validate_vas_for_dashboard).
+VALIDATION_RULES = []
+
+# columns of the validation frame that the location field stands for
+LOCATION_COLUMNS = ["location", "location_name", "location_is_active"]
+
+
+class ValidationRule:
+    def __init__(self, check, fields, severity, text):
+        self.check = check
+        self.name = check.__name__
+        self.fields = fields
+        # frame columns the check depends on
+        self.columns = [
+            column
+            for field in fields
+            for column in (LOCATION_COLUMNS if field == "location" else [field])
+        ]
+        self.severity = severity
+        # formatted with the failing row's fields
+        self.text = text
+
+    # Fingerprint of the rule's inputs for each row, as a hex string. Values are
+    # hashed as strings so a row's fingerprint doesn't depend on the dtypes the
+    # rest of the frame gives its columns.
+    def fingerprints(self, va_df):
+        hashes = pd.util.hash_pandas_object(
+            va_df[self.columns].astype(str), index=False
+        )
+        return hashes.map("{:x}".format)
+
+    def issues(self, va_df):
+        failing = pd.Series(self.check(va_df), index=va_df.index)
+        failing = va_df[failing.fillna(False).astype(bool)]
+        return [
+            CauseCodingIssue(
+                verbalautopsy_id=int(row["id"]),
+                text=self.text.format(**row),
+                severity=self.severity,
                 algorithm="",
                 settings="",
+                rule=self.name,
             )
-            issues.append(issue)
-
-        # Validate: age
-        # age group can be determined from multiple fields, it's required for
-        # filtering demographics
-        if (
-            va.isNeonatal != 1
-            and va.isNeonatal != 1.0
-            and va.isNeonatal != "1"
-            and va.isNeonatal1 != 1
-            and va.isNeonatal1 != 1.0
-            and va.isNeonatal1 != "1"
-            and va.isNeonatal2 != 1
-            and va.isNeonatal2 != 1.0
-            and va.isNeonatal2 != "1"
-            and va.isChild != 1
-            and va.isChild != 1.0
-            and va.isChild != "1"
-            and va.isChild1 != 1
-            and va.isChild1 != 1.0
-            and va.isChild1 != "1"
-            and va.isChild2 != 1
-            and va.isChild2 != 1.0
-            and va.isChild2 != "1"
-            and va.isAdult != 1
-            and va.isAdult != 1.0
-            and va.isAdult != "1"
-            and va.isAdult1 != 1
-            and va.isAdult1 != 1.0
-            and va.isAdult1 != "1"
-            and va.isAdult2 != 1
-            and va.isAdult2 != 1.0
-            and va.isAdult2 != "1"
-        ):
-            issue_text = "Warning: field age_group, no relevant data was found in \
+            for row in failing.to_dict(orient="records")
+        ]
+
+
+# register the decorated check as a validation rule
+def validation_rule(fields, severity, text):
+    def register(check):
+        VALIDATION_RULES.append(ValidationRule(check, fields, severity, text))
+        return check
+
+    return register
+
+
+# Validate: date of death
+# Id10023 is required for the dashboard time frame filters
+# VA form guarantees this field is either "dk" or a valid datetime.date value
+@validation_rule(
+    fields=["Id10023"],
+    severity="error",
+    text="Error: field Id10023, couldn't parse date from {Id10023}",
+)
+def unparseable_death_date(va_df):
+    return parse_dates(va_df["Id10023"].tolist(), errors="coerce").isna().to_numpy()
+
+
+# Validate: ageInYears2
+# ageInYears2 is required for calculating mean age of death
+@validation_rule(
+    fields=["ageInYears2"],
+    severity="warning",
+    text="Warning: field ageInYears2, age was not provided or not a number.",
+)
+def missing_age(va_df):
+    ages = pd.to_numeric(va_df["ageInYears2"].astype(str).str.strip(), errors="coerce")
+    return ages.isna() | ages.abs().eq(float("inf"))
+
+
+# Validate: age
+# age group can be determined from multiple fields, it's required for
+# filtering demographics
+@validation_rule(
+    fields=["derived_age_group"],
+    severity="warning",
+    text="Warning: field age_group, no relevant data was found in \
                 fields; isNeonatal, isNeonatal1, isNeonatal2, isChild, isChild1, \
-                isChild2 isAdult, isAdult1, or isAdult2."
-            issue = CauseCodingIssue(
-                verbalautopsy_id=va.id,
-                text=issue_text,
-                severity="warning",
-                algorithm="",
-                settings="",
-            )
-            issues.append(issue)
-
-        # Validate: location
-        # location is used to display the record on the map
-        if not va.location:
-            # try re-assigning location using location logic described in loading.py
-            va = assign_va_location(va)
-
-            # if still no location, record an error
-            if not va.location:
-                issue_text = "ERROR: no location provided (or none detected)"
-                issue = CauseCodingIssue(
-                    verbalautopsy_id=va.id,
-                    text=issue_text,
-                    severity="error",
-                    algorithm="",
-                    settings="",
-                )
-                issues.append(issue)
-
-        # if location is valid but inactive record a warning
-        if (
-            va.location
-            and not va.location.is_active
-            and va.location.name.casefold() != "unknown"
-            and va.hospital.casefold() != "other"
-        ):
-            issue_text = "Warning: VA location was matched to facility known \
+                isChild2 isAdult, isAdult1, or isAdult2.",
+)
+def missing_age_group(va_df):
+    return va_df["derived_age_group"].isna()
+
+
+# Validate: location
+# location is used to display the record on the map
+@validation_rule(
+    fields=["location", "hospital", "province", "area"],
+    severity="error",
+    text="ERROR: no location provided (or none detected)",
+)
+def missing_location(va_df):
+    return va_df["location_name"] == ""
+
+
+# if location is valid but inactive record a warning
+@validation_rule(
+    fields=["location", "hospital", "province", "area"],
+    severity="warning",
+    text="Warning: VA location was matched to facility known \
                 to be inactive. Consider updating the location to an active \
-                facility instead, or update the facility list."
-            issue = CauseCodingIssue(
-                verbalautopsy_id=va.id,
-                text=issue_text,
-                severity="warning",
-                algorithm="",
-                settings="",
-            )
-            issues.append(issue)
-
-        # if location is "Other" (a valid, but non-informative location stemming
-        # stemming from bad data) record a warning
-        if (
-            va.location
-            and va.location.name.casefold() == "unknown"
-            and va.hospital.casefold() == "other"
-        ):
-            issue_text = "Warning: location field (parsed from hospital) \
+                facility instead, or update the facility list.",
+)
+def inactive_location(va_df):
+    return (
+        (va_df["location_name"] != "")
+        & va_df["location_is_active"].eq(False)
+        & (va_df["location_name"].str.casefold() != "unknown")
+        & (va_df["hospital"].str.casefold() != "other")
+    )
+
+
+# if location is "Other" (a valid, but non-informative location stemming
+# stemming from bad data) record a warning
+@validation_rule(
+    fields=["location", "hospital", "province", "area"],
+    severity="warning",
+    text="Warning: location field (parsed from hospital) \
                 was parsed as 'Other Facility'. May not fully show on \
-                dashboards until underlying data is corrected to actual location."
-            issue = CauseCodingIssue(
-                verbalautopsy_id=va.id,
-                text=issue_text,
-                severity="warning",
-                algorithm="",
-                settings="",
-            )
-            issues.append(issue)
-
-        # if location is "Unknown" (couldn't find match for provided location)
-        # record a warning
-        if (
-            va.location
-            and va.location.name.casefold() == "unknown"
-            and va.hospital.casefold() != "other"
-        ):
-            issue_text = "ERROR: location field (parsed from hospital) did not \
+                dashboards until underlying data is corrected to actual location.",
+)
+def other_location(va_df):
+    return (va_df["location_name"].str.casefold() == "unknown") & (
+        va_df["hospital"].str.casefold() == "other"
+    )
+
+
+# if location is "Unknown" (couldn't find match for provided location)
+# record a warning
+@validation_rule(
+    fields=["location", "hospital", "province", "area"],
+    severity="error",
+    text="ERROR: location field (parsed from hospital) did not \
                 match any known facilities in the facility list. VA Explorer set \
                 the location to 'Unknown.'  This VA will not show on \
-                dashboards until underlying data is corrected to actual location."
-            issue = CauseCodingIssue(
-                verbalautopsy_id=va.id,
-                text=issue_text,
-                severity="error",
-                algorithm="",
-                settings="",
-            )
-            issues.append(issue)
+                dashboards until underlying data is corrected to actual location.",
+)
+def unknown_location(va_df):
+    return (va_df["location_name"].str.casefold() == "unknown") & (
+        va_df["hospital"].str.casefold() != "other"
+    )
+
+
+def validate_vas_for_dashboard(verbal_autopsies):
+    # This validator is used to determine whether there is sufficient data to include
+    # the record in the dashboard. Any errors or warnings are collected and reported
+    # in the data manager.
+    # The validation has to occur after the va's are created so we can reference
+    # the va_id in the CauseCodingIssue.
+    # The validator runs after va's are loaded and after a va is edited or reset.
+    # All VAs are checked at once: each rule is evaluated over a DataFrame of all
+    # VAs, old data issues are cleared with one DELETE and new ones bulk inserted.
+    # Each VA stores a fingerprint of every rule's inputs, so a rule is only re-run
+    # (and its issues replaced) for the VAs whose inputs changed since their last
+    # validation. Returns the issues created.
+    verbal_autopsies = list(verbal_autopsies)
+    if not verbal_autopsies:
+        return []
+
+    va_df = build_validation_frame(verbal_autopsies, VALIDATION_RULES)
+    fingerprints = pd.DataFrame(
+        {rule.name: rule.fingerprints(va_df) for rule in VALIDATION_RULES}
+    )
+    previous = pd.DataFrame(
+        [va.validation_fingerprints or {} for va in verbal_autopsies],
+        index=fingerprints.index,
+        columns=fingerprints.columns,
+    )
+    changed = fingerprints != previous
+
+    stale = Q()
+    issues = []
+    for rule in VALIDATION_RULES:
+        rerun = changed[rule.name]
+        if rerun.any():
+            stale |= Q(rule=rule.name, verbalautopsy_id__in=va_df["id"][rerun].tolist())
+            issues.extend(rule.issues(va_df[rerun]))
+    # data issues recorded before rules were tracked aren't tagged with their rule;
+    # VAs with such issues have no fingerprints, so every rule is re-run for them
+    unfingerprinted = [
+        va.id for va in verbal_autopsies if va.validation_fingerprints is None
+    ]
+    if unfingerprinted:
+        stale |= Q(rule="", verbalautopsy_id__in=unfingerprinted)
+    if not stale:
+        return []
+
+    # clear the issues of the re-run rules in case any were addressed
+    CauseCodingIssue.objects.filter(stale, algorithm="").delete()
+    issues = CauseCodingIssue.objects.bulk_create(issues, batch_size=5000)
+
+    revalidated = []
+    for va, va_fingerprints, rerun in zip(
+        verbal_autopsies,
+        fingerprints.to_dict(orient="records"),
+        changed.any(axis=1),
+        strict=True,
+    ):
+        if rerun:
+            va.validation_fingerprints = va_fingerprints
+            revalidated.append(va)
+    VerbalAutopsy.all_objects.bulk_update(
+        revalidated, ["validation_fingerprints"], batch_size=5000
+    )
+    return issues
+
+
+# DataFrame of the fields the rules read (one row per VA), with the name and
+# active flag of each VA's location joined in
+def build_validation_frame(verbal_autopsies, rules):
+    fields = sorted({field for rule in rules for field in rule.fields} - {"location"})
+    va_df = pd.DataFrame(
+        {
+            "id": [va.id for va in verbal_autopsies],
+            "location": [va.location_id for va in verbal_autopsies],
+            **{
+                field: [getattr(va, field) for va in verbal_autopsies]
+                for field in fields
+            },
+        }
+    )
+
+    # try re-assigning location using location logic described in loading.py.
+    # Uses the in-memory facility index, so this doesn't query per VA
+    unassigned = va_df["location"].isna()
+    if unassigned.any():
+        facility_index = get_facility_index()
+        va_df.loc[unassigned, "location"] = [
+            assign_va_location(va, facility_index=facility_index).location_id
+            for va in compress(verbal_autopsies, unassigned)
+        ]
+    va_df["location"] = va_df["location"].astype("Int64")
 
-    CauseCodingIssue.objects.bulk_create(issues)
+    locations = pd.DataFrame(
+        Location.objects.filter(id__in=va_df["location"].dropna().unique().tolist())
+        .values("id", "name", "is_active")
+        .order_by(),
+        columns=["id", "name", "is_active"],
+    )
+    locations = locations.rename(
+        columns={
+            "id": "location",
+            "name": "location_name",
+            "is_active": "location_is_active",
+        }
+    ).astype({"location": "Int64"})
+    va_df = va_df.merge(locations, on="location", how="left")
+    # blank strings instead of missing values, so string checks work on every row
+    va_df["location_name"] = va_df["location_name"].fillna("")
+    if "hospital" in va_df.columns:
+        va_df["hospital"] = va_df["hospital"].fillna("").astype(str)
+    return va_df
@@ -19,11 +19,12 @@ from django.views.generic import (
 from django.views.generic.detail import SingleObjectMixin
 
 from va_explorer.utils.mixins import CustomAuthMixin
+from va_explorer.va_analytics.models import DashboardRollup
 from va_explorer.va_data_management.filters import VAFilter
 from va_explorer.va_data_management.forms import VerbalAutopsyForm
 from va_explorer.va_data_management.models import Location, VerbalAutopsy
 from va_explorer.va_data_management.tasks import run_coding_algorithms
-from va_explorer.va_data_management.utils.date_parsing import parse_date
+from va_explorer.va_data_management.utils.date_parsing import parse_dates
 from va_explorer.va_data_management.utils.loading import get_va_summary_stats
 from va_explorer.va_data_management.utils.validate import validate_vas_for_dashboard
 
@@ -109,21 +110,24 @@ class Index(CustomAuthMixin, PermissionRequiredMixin, ListView):
             # render button useless
             context["download_url"] = ""
 
+        object_list = list(context["object_list"])
+        interview_dates = parse_dates([va["Id10012"] for va in object_list])
+        death_dates = parse_dates([va["Id10023"] for va in object_list])
         context["object_list"] = [
             {
                 "id": va["id"],
                 "deceased": va["deceased"],
                 "interviewer": va["Id10010"],
-                "interviewed": parse_date(va["Id10012"]),
-                "dod": (
-                    parse_date(va["Id10023"]) if (va["Id10023"] != "dk") else "Unknown"
-                ),
+                "interviewed": interviewed,
+                "dod": dod if (va["Id10023"] != "dk") else "Unknown",
                 "facility": va["location__name"],
                 "cause": va["causes__cause"],
                 "warnings": va["warnings"],
                 "errors": va["errors"],
             }
-            for va in context["object_list"]
+            for va, interviewed, dod in zip(
+                object_list, interview_dates, death_dates, strict=True
+            )
         ]
 
         context.update(get_va_summary_stats(self.filterset.qs))
@@ -212,6 +216,7 @@ class Edit(
     def get_success_url(self):
         # update the validation errors
         validate_vas_for_dashboard([self.object])
+        DashboardRollup.refresh([self.object.location_id])
         return reverse("va_data_management:show", kwargs={"id": self.object.id})
 
     def get_form_kwargs(self):
@@ -247,9 +252,14 @@ class Reset(
             )
             > 0
         ):
-            earliest.instance.save()
+            instance = earliest.instance
+            # history doesn't track fingerprints; keep the current ones so only
+            # the rules reading reverted fields are re-run
+            instance.validation_fingerprints = self.object.validation_fingerprints
+            instance.save()
             # update the validation errors
-            validate_vas_for_dashboard([earliest])
+            validate_vas_for_dashboard([instance])
+            DashboardRollup.refresh([self.object.location_id, instance.location_id])
         messages.success(self.request, self.success_message)
         return redirect("va_data_management:show", id=self.object.id)
 
@@ -276,9 +286,12 @@ class RevertLatest(
                 )
                 > 0
             ):
-                previous.instance.save()
+                instance = previous.instance
+                instance.validation_fingerprints = self.object.validation_fingerprints
+                instance.save()
                 # update the validation errors
-                validate_vas_for_dashboard([previous])
+                validate_vas_for_dashboard([instance])
+                DashboardRollup.refresh([self.object.location_id, instance.location_id])
         messages.success(self.request, self.success_message)
         return redirect("va_data_management:show", id=self.object.id)
 
@@ -318,7 +331,9 @@ class Delete(CustomAuthMixin, PermissionRequiredMixin, DeleteView):
             .exists()
         ):
             messages.success(self.request, self.success_message % obj.__dict__)
-            return super().delete(request, *args, **kwargs)
+            response = super().delete(request, *args, **kwargs)
+            DashboardRollup.refresh([obj.location_id])
+            return response
         else:
             messages.error(self.request, self.error_message % obj.__dict__)
             return redirect("va_data_cleanup:index")
@@ -335,7 +350,10 @@ class DeleteAll(CustomAuthMixin, PermissionRequiredMixin, TemplateView):
     template_name = "va_data_management/verbalautopsy_confirm_delete_all.html"
 
     def post(self, request, *args, **kwargs):
-        self.request.user.verbal_autopsies().filter(duplicate=True).delete()
+        duplicates = self.request.user.verbal_autopsies().filter(duplicate=True)
+        location_ids = set(duplicates.values_list("location", flat=True))
+        duplicates.delete()
+        DashboardRollup.refresh(location_ids)
         messages.success(self.request, self.success_message)
         return redirect(reverse("va_data_cleanup:index"))
 
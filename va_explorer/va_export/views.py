@@ -35,7 +35,7 @@ class VaApi(CustomAuthMixin, View):
         # unknown death dates, or unknown CODs
         matching_vas = (
             request.user.verbal_autopsies()
-            .exclude(Id10023="dk")
+            .exclude(death_date__isnull=True)
             .exclude(location__isnull=True)
             .select_related("location")
             .annotate(
@@ -88,11 +88,11 @@ class VaApi(CustomAuthMixin, View):
                 start_date = (
                     start_date[0] if isinstance(start_date, list) else start_date
                 )
-                matching_vas = matching_vas.filter(Id10023__gte=start_date)
+                matching_vas = matching_vas.filter(death_date__gte=start_date)
 
             if end_date not in empty_values:
                 end_date = end_date[0] if isinstance(end_date, list) else end_date
-                matching_vas = matching_vas.filter(Id10023__lte=end_date)
+                matching_vas = matching_vas.filter(death_date__lte=end_date)
 
             # get causes for matching vas and convert to list of records
             matching_vas = (